@@ -0,0 +1,144 @@
+import math
+import numpy as np
+
+
+class RunningStats:
+    """Welford's running mean/variance with min and max, O(1) per sample"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def snapshot(self, scale=1.0):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.mean * scale,
+            "std": self.std * scale,
+            "min": self.min * scale,
+            "max": self.max * scale,
+            # Coefficient of variation: how consistent the values are, independent of scale
+            "cv": self.std / self.mean if self.mean else 0.0,
+        }
+
+
+class SessionAnalytics:
+    """Rehab metrics kept up to date from the sensor thread.
+
+    Per finger: press duration, peak and mean drop over each press, and reaction
+    time from a tutorial prompt to the press. Per session: inter-onset intervals
+    between consecutive presses and tutorial accuracy. Every update is O(1);
+    snapshot() can be called at any time from the event loop.
+    Times are perf_counter seconds from the frame that caused the change.
+    """
+
+    def __init__(self, fingers):
+        self.names = list(fingers)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        self.pressed_at = np.zeros(n)
+        self.peak = np.full(n, -np.inf)
+        self.drop_sum = np.zeros(n)
+        self.frames = np.zeros(n, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self.duration = {name: RunningStats() for name in self.names}
+        self.peak_drop = {name: RunningStats() for name in self.names}
+        self.mean_drop = {name: RunningStats() for name in self.names}
+        self.reaction = {name: RunningStats() for name in self.names}
+        self.ioi = RunningStats()
+        self.last_onset = None
+        self.prompted = None
+        self.prompt_time = 0.0
+        self.correct = 0
+        self.errors = 0
+        self.presses = 0
+        self.peak[:] = -np.inf
+        self.drop_sum[:] = 0.0
+        self.frames[:] = 0
+
+    def observe(self, active, drop):
+        """Per frame: fold the drop of every pressed finger into its current press"""
+        np.maximum(self.peak, np.where(active, drop, -np.inf), out=self.peak)
+        self.drop_sum += np.where(active, drop, 0.0)
+        self.frames += active
+
+    def press(self, finger, t):
+        self.pressed_at[self.index[finger]] = t
+        self.presses += 1
+        if self.last_onset is not None:
+            self.ioi.add(t - self.last_onset)
+        self.last_onset = t
+
+    def release(self, finger, t):
+        i = self.index[finger]
+        self.duration[finger].add(t - self.pressed_at[i])
+        if self.frames[i]:
+            self.peak_drop[finger].add(float(self.peak[i]))
+            self.mean_drop[finger].add(float(self.drop_sum[i] / self.frames[i]))
+        # Start the next press from scratch
+        self.peak[i] = -np.inf
+        self.drop_sum[i] = 0.0
+        self.frames[i] = 0
+
+    def prompt(self, fingers, t):
+        """A tutorial now expects any of fingers (a chord); reaction time runs from t"""
+        self.prompted = frozenset(fingers)
+        self.prompt_time = t
+
+    def end_prompts(self):
+        self.prompted = None
+
+    def tutorial_press(self, finger, t):
+        """Score a press made while a tutorial prompt is showing; returns True if it was right"""
+        if self.prompted is None:
+            return False
+        if finger not in self.prompted:
+            self.errors += 1
+            return False
+        self.correct += 1
+        self.reaction[finger].add(t - self.prompt_time)
+        return True
+
+    def snapshot(self):
+        attempts = self.correct + self.errors
+        return {
+            "presses": self.presses,
+            "fingers": {
+                name: {
+                    "duration_ms": self.duration[name].snapshot(1000),
+                    "peak_drop": self.peak_drop[name].snapshot(),
+                    "mean_drop": self.mean_drop[name].snapshot(),
+                    "reaction_ms": self.reaction[name].snapshot(1000),
+                }
+                for name in self.names
+            },
+            "ioi_ms": self.ioi.snapshot(1000),
+            "tutorial": {
+                "correct": self.correct,
+                "errors": self.errors,
+                "error_rate": self.errors / attempts if attempts else 0.0,
+            },
+        }
@@ -0,0 +1,240 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+import numpy as np
+from synth import INSTRUMENTS
+from sampler import SAMPLED, wait_ready
+from filters import FILTERS
+from frames import FRAME_SIZE, FrameDecoder
+from drums import DRUMS, generate_drum
+from sounds import SoundRegistry, parse_sound
+from sim import SimulatedGlove
+from effects import IMPULSES, EffectsChain
+from session import CHANNELS, FINGERS, SAMPLE_RATE, Session, drum_bank
+
+BLOCK = 256
+DEADLINE = BLOCK / SAMPLE_RATE     # 5.8 ms
+FRAME_RATE = 1000                  # DexUMI frames per second
+VOICE_COUNTS = [1, 5, 10, 20]
+DRUM_HITS = [1, 4, 8, 16]
+READ_SIZES = [64, 400, 4096]
+SPECS = ['C', 'F#3', 'Bb5', 'C_maj', 'Am', 'G7', 'E4+15c', 'kick']
+
+
+def measure(fn, repeat, warmup=3):
+    """Per-call durations of fn() in seconds"""
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        began = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - began
+    return times
+
+
+def result(name, times, period, unit="block"):
+    """Summarize durations against the real time one call stands for (period seconds)"""
+    mean = float(np.mean(times))
+    return {
+        "name": name,
+        "mean_us": mean * 1e6,
+        "p99_us": float(np.percentile(times, 99)) * 1e6,
+        "rtf": period / mean if mean else float("inf"),
+        "cpu": mean / period * 100,
+        "unit": unit,
+    }
+
+
+def bench_callback(repeat):
+    results = []
+    out = np.zeros((BLOCK, CHANNELS), dtype=np.float32)
+    wait_ready()
+    for instrument in list(INSTRUMENTS) + list(SAMPLED):
+        for count in VOICE_COUNTS:
+            session = Session("bench")
+            session.custom_instrument = instrument
+            session.state["current_preset"] = "custom"
+            for i in range(count):
+                session.voices.note_on(("bench", i), 220.0 * 2 ** (i / 12))
+            session.audio_callback(out, BLOCK, None, None)
+            times = measure(lambda: session.audio_callback(out, BLOCK, None, None), repeat)
+            results.append(result(f"callback/{instrument}/{count} voices", times, DEADLINE))
+
+        # Every voice held by a finger whose pressure moves on every block
+        count = VOICE_COUNTS[-1]
+        session = Session("bench")
+        session.custom_instrument = instrument
+        session.state["current_preset"] = "custom"
+        fingers = list(FINGERS)
+        for i in range(count):
+            freq = 220.0 * 2 ** (i / 12)
+            session.voices.note_on((fingers[i % len(fingers)], freq), freq)
+        rng = np.random.default_rng(0)
+
+        def modulated():
+            session.voices.set_controls(rng.uniform(0.2, 1.0, (2, len(fingers))))
+            session.audio_callback(out, BLOCK, None, None)
+        modulated()
+        times = measure(modulated, repeat)
+        results.append(result(f"callback/{instrument}/{count} modulated", times, DEADLINE))
+    return results
+
+
+def bench_drums(repeat):
+    results = []
+    out = np.zeros(BLOCK, dtype=np.float32)
+    ids = [drum_bank.hit(drum, 1.0) for drum in DRUMS]
+    for hits in DRUM_HITS:
+        session = Session("bench")
+        mixer = session.drum_mixer
+
+        def block():
+            # Keep every hit sounding: restart them before they run out
+            if not mixer.active.any() or mixer.pos.max() > drum_bank.length - BLOCK:
+                mixer.start(None, 0.0)
+                for i in range(hits):
+                    mixer.start(ids[i % len(ids)], 0.8)
+            mixer.mix(out)
+        times = measure(block, repeat)
+        results.append(result(f"drums/{hits} hits", times, DEADLINE))
+    return results
+
+
+def bench_effects(repeat):
+    results = []
+    rng = np.random.default_rng(0)
+    block = (rng.standard_normal((BLOCK, CHANNELS)) * 0.5).astype(np.float32)
+    out = np.empty_like(block)
+    for name in [None] + list(IMPULSES):
+        chain = EffectsChain(SAMPLE_RATE, CHANNELS)
+        chain.set_reverb(name, 0.3)
+
+        def run():
+            out[:] = block
+            chain.process(out)
+        times = measure(run, repeat)
+        results.append(result(f"effects/{name or 'limiter only'}", times, DEADLINE))
+    return results
+
+
+def bench_generate(repeat):
+    results = []
+    duration = 0.4
+    for drum in DRUMS:
+        times = measure(lambda: generate_drum(drum, duration, SAMPLE_RATE, seed=1), max(repeat // 50, 5), warmup=1)
+        results.append(result(f"generate_drum/{drum}", times, duration, "sample"))
+    return results
+
+
+def capture(seconds):
+    """Raw bytes of a simulated glove playing a scale, as read_loop would see them"""
+    glove = SimulatedGlove(FINGERS, FRAME_RATE, interval=0.1, hold=0.05, lead_in=0.0)
+    return glove.produce(0, int(seconds * FRAME_RATE))
+
+
+def bench_decode(repeat, data):
+    results = []
+    frames = len(data) // FRAME_SIZE
+    for size in READ_SIZES:
+        decoder = FrameDecoder()
+
+        def run():
+            decoder.reset()
+            for pos in range(0, len(data), size):
+                decoder.feed(data[pos:pos + size])
+        times = measure(run, max(repeat // 100, 5), warmup=1)
+        results.append(result(f"decode/{size}-byte reads", times, frames / FRAME_RATE, "stream"))
+    return results
+
+
+def bench_filters(repeat, data):
+    results = []
+    rows = FrameDecoder(len(data) + FRAME_SIZE).feed(data)[:repeat]
+    rest = {name: 1_000_000 for name in FINGERS}
+    for name in FILTERS:
+        session = Session("bench")
+        detector = session.detector
+        detector.set_filter(name)
+        detector.set_rest(rest)
+        stream = itertools.cycle(rows)
+        times = measure(lambda: detector.update(next(stream)), repeat)
+        results.append(result(f"detector/{name}", times, 1 / FRAME_RATE, "frame"))
+    return results
+
+
+def bench_sounds(repeat):
+    results = []
+    for spec in SPECS:
+        times = measure(lambda: parse_sound(spec), repeat)
+        results.append(result(f"parse_sound/{spec}", times, 1 / FRAME_RATE, "call"))
+    registry = SoundRegistry()
+    mapping = dict(zip(FINGERS, SPECS))
+    times = measure(lambda: registry.compile_mapping(mapping), repeat)
+    results.append(result("compile_mapping/cached", times, 1 / FRAME_RATE, "call"))
+    return results
+
+
+SUITES = {
+    "callback": lambda repeat, data: bench_callback(repeat),
+    "drums": lambda repeat, data: bench_drums(repeat),
+    "effects": lambda repeat, data: bench_effects(repeat),
+    "generate": lambda repeat, data: bench_generate(repeat),
+    "decode": bench_decode,
+    "filters": bench_filters,
+    "sounds": lambda repeat, data: bench_sounds(repeat),
+}
+
+
+def report(results, baseline=None):
+    baseline = {r["name"]: r for r in baseline or []}
+    print(f"{'benchmark':<36} {'mean':>10} {'p99':>10} {'real time':>10} {'budget':>8}")
+    for r in results:
+        line = f"{r['name']:<36} {r['mean_us']:>8.1f}us {r['p99_us']:>8.1f}us {r['rtf']:>9.0f}x {r['cpu']:>7.2f}%"
+        old = baseline.get(r["name"])
+        if old:
+            change = (r["mean_us"] - old["mean_us"]) / old["mean_us"] * 100
+            line += f"  {change:+.1f}%"
+        print(line)
+    print(f"budget: share of the real time each {'/'.join(sorted({r['unit'] for r in results}))} covers "
+          f"(a {BLOCK}-frame block is {DEADLINE * 1000:.1f}ms, a frame {1000 / FRAME_RATE:.1f}ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the audio, sensor and sound-parsing hot paths")
+    parser.add_argument("suites", nargs="*", help=f"suites to run: {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=2000, help="calls timed per benchmark")
+    parser.add_argument("--capture", help="raw frame bytes to decode instead of a simulated stream (capture file or recording frames.bin)")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier --save to diff against")
+    args = parser.parse_args(argv)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+    else:
+        data = capture(10.0)
+
+    results = []
+    for suite in args.suites or list(SUITES):
+        results.extend(SUITES[suite](args.repeat, data))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"time": time.time(), "block": BLOCK, "sample_rate": SAMPLE_RATE, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
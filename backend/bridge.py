@@ -0,0 +1,145 @@
+import asyncio
+import time
+from collections import deque
+from protocol import encode_drops, encode_fingers, finger_mask
+
+EVENT_QUEUE_SIZE = 1024
+CLIENT_QUEUE_SIZE = 256
+
+# Only the newest message of these types matters; older unsent ones are replaced
+COALESCE_TYPES = {'fingers'}
+# Sent only to clients that negotiated the binary protocol
+BINARY_ONLY_TYPES = {'drops'}
+
+
+class ClientChannel:
+    """Per-client send queue drained by its own task, so one slow tab only delays itself"""
+
+    def __init__(self, websocket, latency=None):
+        self.websocket = websocket
+        self.latency = latency
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.binary = False
+        self.names = ()
+        self.decimation = 0
+        self.format = 0
+        self.mask = 0
+        self.task = asyncio.create_task(self.run())
+
+    def configure(self, binary, names=(), decimation=0, fmt=0):
+        """Switch between JSON and the binary protocol; decimation 0 means no drop stream"""
+        self.binary = binary
+        self.names = list(names)
+        self.decimation = decimation if binary else 0
+        self.format = fmt
+        self.mask = 0
+
+    def push(self, msg, stamp=None):
+        kind = msg.get("type")
+        if kind in BINARY_ONLY_TYPES and not self.decimation:
+            return
+        if kind in COALESCE_TYPES:
+            for i, (queued, queued_stamp) in enumerate(self.pending):
+                if queued.get("type") == kind:
+                    # Keep the older stamp: latency is measured to the first change still unsent
+                    self.pending[i] = (msg, queued_stamp if queued_stamp is not None else stamp)
+                    return
+        if len(self.pending) >= CLIENT_QUEUE_SIZE:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append((msg, stamp))
+        self.wakeup.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.pending:
+                    msg, stamp = self.pending.popleft()
+                    await self.send(msg)
+                    if stamp is not None and self.latency is not None:
+                        self.latency.record(time.perf_counter() - stamp)
+        except asyncio.CancelledError:
+            raise
+        except:
+            pass
+
+    async def send(self, msg):
+        kind = msg.get("type")
+        if self.binary and kind == "fingers":
+            mask = finger_mask(self.names, msg["active"])
+            data = encode_fingers(mask, self.mask)
+            self.mask = mask
+            await self.websocket.send_bytes(data)
+        elif kind == "drops":
+            data = encode_drops(msg["drops"], msg["first"], self.decimation, self.format)
+            if data is not None:
+                await self.websocket.send_bytes(data)
+        else:
+            await self.websocket.send_json(msg)
+
+    def close(self):
+        self.task.cancel()
+
+
+class EventBridge:
+    """Hands messages from the sensor thread to WebSocket clients on the asyncio loop.
+
+    publish() never blocks: it appends to a bounded deque (atomic under the GIL)
+    and only schedules a wakeup with call_soon_threadsafe when the queue was empty.
+    A single drain pass on the loop then fans the batch out to every client channel.
+    """
+
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE, latency=None):
+        self.events = deque(maxlen=maxsize)
+        self.latency = latency
+        self.channels = {}
+        self.loop = None
+        self.scheduled = False
+        self.published = 0
+        self.drop_clients = 0
+
+    def attach(self, websocket):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        channel = ClientChannel(websocket, self.latency)
+        self.channels[websocket] = channel
+        return channel
+
+    def detach(self, websocket):
+        channel = self.channels.pop(websocket, None)
+        if channel:
+            channel.close()
+            self.count_drop_clients()
+
+    def configure(self, websocket, binary, names=(), decimation=0, fmt=0):
+        self.channels[websocket].configure(binary, names, decimation, fmt)
+        self.count_drop_clients()
+
+    def count_drop_clients(self):
+        # Read by the sensor thread to skip batching drops nobody asked for
+        self.drop_clients = sum(1 for channel in self.channels.values() if channel.decimation)
+
+    def publish(self, msg, stamp=None):
+        """stamp: perf_counter time the message's cause was read, for send latency"""
+        if self.loop is None or not self.channels:
+            return
+        self.events.append((msg, stamp))
+        self.published += 1
+        if not self.scheduled:
+            self.scheduled = True
+            try:
+                self.loop.call_soon_threadsafe(self.drain)
+            except RuntimeError:
+                # Event loop already closed (server shutting down)
+                self.scheduled = False
+
+    def drain(self):
+        self.scheduled = False
+        while self.events:
+            msg, stamp = self.events.popleft()
+            for channel in list(self.channels.values()):
+                channel.push(msg, stamp)
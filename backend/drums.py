@@ -1,53 +1,234 @@
-# New drum sounds
-def generate_drum(drum_type, duration=0.4):
-    import numpy as np
-    SAMPLE_RATE = 44100
-    t = np.linspace(0, duration, int(SAMPLE_RATE * duration), False)
-    
+import hashlib
+import os
+import threading
+import numpy as np
+from collections import deque
+
+DRUMS = ['kick', 'snare', 'hihat', 'tom', 'clap', 'cymbal']
+
+ROUND_ROBIN = 4          # noise variants per drum, cycled on every hit
+VELOCITY_LAYERS = 3      # soft / medium / hard, brighter as they get louder
+GENERATOR_VERSION = 1    # bump when generate_drum changes so stale cache files are ignored
+
+CACHE_DIR = os.environ.get("RIPPLE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ripple", "samples"))
+
+def generate_drum(drum_type, duration=0.4, sample_rate=44100, seed=0, brightness=0.0):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, duration, int(sample_rate * duration), False)
+
     if drum_type == 'kick':
         # Deep bass with sub frequencies
         freq = 55 * np.exp(-2 * t)
         wave = np.sin(2 * np.pi * freq * t) * np.exp(-3 * t)
         wave += 0.6 * np.sin(2 * np.pi * 35 * t) * np.exp(-4 * t)
-        wave += 0.2 * np.random.randn(len(t)) * np.exp(-80 * t)
-    
+        wave += 0.2 * rng.standard_normal(len(t)) * np.exp(-80 * t)
+
     elif drum_type == 'snare':
         wave = 0.4 * np.sin(2 * np.pi * 180 * t) * np.exp(-25 * t)
-        wave += 0.6 * np.random.randn(len(t)) * np.exp(-18 * t)
-    
+        wave += 0.6 * rng.standard_normal(len(t)) * np.exp(-18 * t)
+
     elif drum_type == 'hihat':
-        wave = np.random.randn(len(t)) * np.exp(-35 * t)
+        wave = rng.standard_normal(len(t)) * np.exp(-35 * t)
         wave = np.diff(np.concatenate([[0], wave]))
-    
+
     elif drum_type == 'tom':
         freq = 90 * np.exp(-4 * t)
         wave = np.sin(2 * np.pi * freq * t) * np.exp(-8 * t)
-    
+
     elif drum_type == 'clap':
         wave = np.zeros(len(t))
         for i in range(5):
-            offset = int((i * 0.012 + np.random.random() * 0.005) * SAMPLE_RATE)
+            offset = int((i * 0.012 + rng.random() * 0.005) * sample_rate)
             if offset < len(t):
                 remaining = len(t) - offset
-                noise = np.random.randn(remaining)
+                noise = rng.standard_normal(remaining)
                 hit_env = np.exp(-60 * np.linspace(0, 0.1, remaining))
                 wave[offset:] += noise * hit_env * (0.7 ** i)
         wave *= np.exp(-12 * t)
-        wave += 0.15 * np.random.randn(len(t)) * np.exp(-6 * t)
-    
+        wave += 0.15 * rng.standard_normal(len(t)) * np.exp(-6 * t)
+
     elif drum_type == 'cymbal':
-        wave = np.random.randn(len(t)) * np.exp(-2.5 * t)
-        wave += 0.4 * np.random.randn(len(t)) * np.exp(-1 * t)
-    
+        wave = rng.standard_normal(len(t)) * np.exp(-2.5 * t)
+        wave += 0.4 * rng.standard_normal(len(t)) * np.exp(-1 * t)
+
     else:
         wave = np.zeros(len(t))
-    
+
+    if brightness > 0:
+        # Harder hits: blend in a first-difference high-passed copy
+        wave = wave + brightness * np.diff(np.concatenate([[0], wave]))
+
     if np.max(np.abs(wave)) > 0:
         wave = wave / np.max(np.abs(wave)) * 0.75
     return wave.astype(np.float32)
 
+
+class DrumBank:
+    """Lazily generated, memoized drum samples backed by a memory-mapped .npy cache.
+
+    Each drum has VELOCITY_LAYERS x ROUND_ROBIN variants. A variant is generated the
+    first time it is asked for, written to CACHE_DIR under a hash of its parameters
+    and memory-mapped from there on later runs. Loaded variants are also copied into
+    a row of one preallocated table (with a trailing zero column) that DrumMixer
+    gathers from, so the audio path never allocates or touches the disk.
+    """
+
+    def __init__(self, sample_rate=44100, duration=0.4, cache_dir=CACHE_DIR, drums=DRUMS):
+        self.sample_rate = sample_rate
+        self.duration = duration
+        self.cache_dir = cache_dir
+        self.length = int(sample_rate * duration)
+        self.table = np.zeros((len(drums) * VELOCITY_LAYERS * ROUND_ROBIN, self.length + 1), dtype=np.float32)
+        self.samples = {}
+        self.rows = {}
+        self.next_variant = {}
+        self.lock = threading.Lock()
+
+    def params(self, drum_type, layer, variant):
+        return {
+            "drum": drum_type,
+            "duration": self.duration,
+            "sample_rate": self.sample_rate,
+            "seed": variant,
+            "brightness": layer / max(VELOCITY_LAYERS - 1, 1) * 0.5,
+            "version": GENERATOR_VERSION,
+        }
+
+    def cache_path(self, params):
+        key = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{params['drum']}-{key}.npy")
+
+    def load(self, drum_type, layer, variant):
+        params = self.params(drum_type, layer, variant)
+        path = self.cache_path(params)
+        try:
+            sample = np.load(path, mmap_mode='r')
+            # Touch every page now so the audio thread never takes a page fault
+            float(sample[::1024].sum())
+            return sample
+        except (OSError, ValueError):
+            pass
+        sample = generate_drum(drum_type, self.duration, self.sample_rate, params["seed"], params["brightness"])
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, sample)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+        return sample
+
+    def get(self, drum_type, layer=VELOCITY_LAYERS - 1, variant=0):
+        key = (drum_type, layer, variant)
+        sample = self.samples.get(key)
+        if sample is None:
+            with self.lock:
+                sample = self.samples.get(key)
+                if sample is None:
+                    sample = self.load(drum_type, layer, variant)
+                    row = len(self.rows)
+                    n = min(len(sample), self.length)
+                    self.table[row, :n] = sample[:n]
+                    self.rows[key] = row
+                    self.samples[key] = sample
+        return sample
+
+    def sample_id(self, drum_type, layer=VELOCITY_LAYERS - 1, variant=0):
+        """Row of the variant in self.table, loading it first if needed"""
+        key = (drum_type, layer, variant)
+        if key not in self.rows:
+            self.get(drum_type, layer, variant)
+        return self.rows[key]
+
+    def hit(self, drum_type, velocity=1.0):
+        """Sample id for one hit: velocity picks the layer, round-robin picks the variant"""
+        layer = min(int(velocity * VELOCITY_LAYERS), VELOCITY_LAYERS - 1)
+        variant = self.next_variant.get(drum_type, 0)
+        self.next_variant[drum_type] = (variant + 1) % ROUND_ROBIN
+        return self.sample_id(drum_type, layer, variant)
+
+    def preload(self, drums, background=True):
+        """Build every variant of a kit ahead of time, by default off the calling thread"""
+        def run():
+            for drum_type in drums:
+                for layer in range(VELOCITY_LAYERS):
+                    for variant in range(ROUND_ROBIN):
+                        self.get(drum_type, layer, variant)
+        if background:
+            threading.Thread(target=run, daemon=True).start()
+        else:
+            run()
+
+
+class DrumMixer:
+    """Fixed number of drum voice slots (sample id, position, gain) mixed in one gather.
+
+    Hits are queued from control threads and started at the top of the next block.
+    When every slot is busy the hit steals the slot that has played the longest.
+    Each slot has left/right gains for mixing into a (frames, 2) buffer.
+    """
+
+    def __init__(self, bank, slots=16, max_block=4096):
+        self.bank = bank
+        self.slots = slots
+        self.ids = np.zeros(slots, dtype=np.intp)
+        self.pos = np.zeros(slots, dtype=np.intp)
+        self.gain = np.zeros(slots, dtype=np.float32)
+        self.active = np.zeros(slots, dtype=bool)
+        self.center = np.full(2, np.sqrt(0.5))
+        self.pan = np.tile(self.center, (slots, 1))
+        self.ramp = np.arange(max_block, dtype=np.intp)
+        self.queue = deque()
+        self.stolen = 0
+
+    def trigger(self, sample_id, gain=1.0, pan=None):
+        self.queue.append((sample_id, gain, pan))
+
+    def reset(self):
+        self.queue.append((None, 0.0, None))
+
+    def start(self, sample_id, gain, pan=None):
+        if sample_id is None:
+            self.active[:] = False
+            return
+        free = np.flatnonzero(~self.active)
+        if len(free):
+            slot = free[0]
+        else:
+            slot = int(np.argmax(self.pos))
+            self.stolen += 1
+        self.ids[slot] = sample_id
+        self.pos[slot] = 0
+        self.gain[slot] = gain
+        self.pan[slot] = self.center if pan is None else pan
+        self.active[slot] = True
+
+    def mix(self, out):
+        """Add len(out) frames of every playing hit into out (mono or stereo)"""
+        while self.queue:
+            self.start(*self.queue.popleft())
+        live = np.flatnonzero(self.active)
+        if not len(live):
+            return
+        frames = len(out)
+        if frames > len(self.ramp):
+            self.ramp = np.arange(frames, dtype=np.intp)
+        length = self.bank.length
+        # Positions past the end land on the table's trailing zero column
+        idx = np.minimum(self.pos[live, None] + self.ramp[None, :frames], length)
+        chunk = self.bank.table[self.ids[live, None], idx]
+        if out.ndim == 1:
+            out += self.gain[live] @ chunk
+        else:
+            out += chunk.T @ (self.gain[live, None] * self.pan[live])
+        self.pos[live] += frames
+        self.active[live] = self.pos[live] < length
+
+
 # Test
 if __name__ == "__main__":
-    for drum in ['kick', 'snare', 'hihat', 'tom', 'clap', 'cymbal']:
-        sample = generate_drum(drum)
+    bank = DrumBank()
+    for drum in DRUMS:
+        sample = bank.get(drum)
         print(f"{drum}: {len(sample)} samples, max={sample.max():.2f}")
@@ -0,0 +1,291 @@
+import time
+import wave
+import numpy as np
+
+PARTITION = 256           # reverb partition size; the wet signal lags the dry one by this much
+LIMITER_LOOKAHEAD = 64    # frames (~1.5 ms at 44.1 kHz)
+LIMITER_RELEASE = 0.15    # seconds for the gain to recover from full reduction
+CEILING = 0.98
+EFFECTS_BUDGET = 0.35     # share of a block's duration the effects may use...
+OVERLOAD_BLOCKS = 64      # ...before the reverb is switched off to protect the deadline
+BYPASS_RETRY = 5.0        # seconds of audio before a bypassed reverb is tried again...
+BYPASS_RETRY_MAX = 120.0  # ...doubling each time it overloads again, up to this
+
+# Finger -> stereo position, -1 (left) .. 1 (right), as seen on a right hand from above
+FINGER_PAN = {'thumb': -0.6, 'index': -0.3, 'middle': 0.0, 'ring': 0.3, 'pinky': 0.6}
+
+
+def pan_gains(pan):
+    """Constant-power left/right gains for a pan position in [-1, 1]"""
+    angle = (np.clip(pan, -1.0, 1.0) + 1.0) * np.pi / 4
+    return np.array([np.cos(angle), np.sin(angle)])
+
+
+CENTER = pan_gains(0.0)
+FINGER_GAINS = {name: pan_gains(pan) for name, pan in FINGER_PAN.items()}
+
+
+def key_pan(key):
+    """Gains for a voice key such as (finger, freq) or ("playback", finger, freq)"""
+    for part in key if isinstance(key, tuple) else (key,):
+        gains = FINGER_GAINS.get(part) if isinstance(part, str) else None
+        if gains is not None:
+            return gains
+    return CENTER
+
+
+def generate_impulse(duration, decay, sample_rate=44100, seed=0, damping=0.6):
+    """Synthetic stereo room: decorrelated noise under an exponential decay, with the
+    highs dying faster than the lows. Returns (frames, 2) float32, unit energy."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sample_rate)
+    t = np.arange(n) / sample_rate
+    noise = rng.standard_normal((n, 2))
+    # One-pole lowpass whose cutoff falls over the tail, done as a blend of two signals
+    smooth = noise.copy()
+    smooth[1:] = 0.5 * (noise[1:] + noise[:-1])
+    mix = np.minimum(t / duration / damping, 1.0)[:, None]
+    ir = ((1 - mix) * noise + mix * smooth) * np.exp(-t / decay)[:, None]
+    ir[:int(0.005 * sample_rate)] *= np.linspace(0, 1, int(0.005 * sample_rate))[:, None]
+    return (ir / np.sqrt(np.sum(ir ** 2) / 2)).astype(np.float32)
+
+
+def load_impulse(path):
+    """16-bit mono or stereo WAV impulse response as (frames, 2) float32"""
+    with wave.open(path, 'rb') as f:
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').astype(np.float32) / 32768
+        data = data.reshape(-1, f.getnchannels())
+    if data.shape[1] == 1:
+        data = np.repeat(data, 2, axis=1)
+    return data[:, :2]
+
+
+IMPULSES = {
+    'room': lambda sr: generate_impulse(0.6, 0.15, sr, seed=1),
+    'hall': lambda sr: generate_impulse(1.6, 0.45, sr, seed=2),
+}
+
+
+def partition_impulse(ir, partition=PARTITION):
+    """Spectra of each partition-sized slice of ir, zero-padded to 2 * partition and stored
+    bin-major as (partition + 1, 2, parts) complex64 so a block's accumulation is one matmul"""
+    B = partition
+    parts = -(-len(ir) // B)
+    padded = np.zeros((parts * B, 2), dtype=np.float64)
+    padded[:len(ir)] = ir
+    slices = padded.reshape(parts, B, 2).transpose(0, 2, 1)
+    spectra = np.fft.rfft(slices, 2 * B, axis=2)
+    return np.ascontiguousarray(spectra.transpose(2, 1, 0)).astype(np.complex64)
+
+
+# (name, sample rate) -> partitioned built-in impulse; read-only, so every session shares them
+SPECTRA = {}
+
+
+def impulse_spectra(name, sample_rate):
+    key = (name, sample_rate)
+    if key not in SPECTRA:
+        SPECTRA[key] = partition_impulse(IMPULSES[name](sample_rate))
+    return SPECTRA[key]
+
+
+class PartitionedReverb:
+    """Uniformly partitioned FFT convolution (overlap-save with a frequency-domain delay line).
+
+    Every PARTITION input frames cost one rfft, one multiply-accumulate over the
+    IR's partitions and two irffts, whatever the callback's block size: input and
+    wet output go through small FIFOs, which delays the wet signal by one partition.
+    """
+
+    def __init__(self, spectra, partition=PARTITION):
+        """spectra: partition_impulse() of the impulse response"""
+        B = self.partition = partition
+        parts = spectra.shape[2]
+        self.spectra = spectra
+        # Delay line stored twice so the newest-first window is always one contiguous slice
+        self.fdl = np.zeros((B + 1, 2 * parts), dtype=np.complex64)
+        self.head = 0
+        self.parts = parts
+        self.window = np.zeros(2 * B)
+        self.inbuf = np.zeros(B)
+        self.filled = 0
+        self.out = np.zeros((2 * B, 2))
+        self.out_start = 0
+        self.out_len = B  # one partition of silence: the wet path's latency
+
+    def reset(self):
+        self.fdl[:] = 0
+        self.window[:] = 0
+        self.filled = 0
+        self.out[:] = 0
+        self.out_start = 0
+        self.out_len = self.partition
+
+    def partition_step(self):
+        B = self.partition
+        self.window[:B] = self.window[B:]
+        self.window[B:] = self.inbuf
+        self.head = (self.head - 1) % self.parts
+        spectrum = np.fft.rfft(self.window)
+        self.fdl[:, self.head] = spectrum
+        self.fdl[:, self.head + self.parts] = spectrum
+        acc = np.matmul(self.spectra, self.fdl[:, self.head:self.head + self.parts, None])[:, :, 0]
+        wet = np.fft.irfft(acc, 2 * B, axis=0)[B:]
+        # Append to the output FIFO (compacting it first when it would overflow)
+        if self.out_start + self.out_len + B > len(self.out):
+            self.out[:self.out_len] = self.out[self.out_start:self.out_start + self.out_len]
+            self.out_start = 0
+        end = self.out_start + self.out_len
+        self.out[end:end + B] = wet
+        self.out_len += B
+
+    def process(self, dry, out, wet_gain):
+        """Add wet_gain * reverb(dry) into out; dry is mono (frames,), out is (frames, 2)"""
+        frames = len(dry)
+        B = self.partition
+        pos = 0
+        done = 0
+        while pos < frames:
+            take = min(B - self.filled, frames - pos)
+            self.inbuf[self.filled:self.filled + take] = dry[pos:pos + take]
+            self.filled += take
+            pos += take
+            if self.filled == B:
+                self.filled = 0
+                self.partition_step()
+            # Drain as much wet output as is ready, in order
+            ready = min(self.out_len, pos - done)
+            if ready:
+                out[done:done + ready] += wet_gain * self.out[self.out_start:self.out_start + ready]
+                self.out_start += ready
+                self.out_len -= ready
+                done += ready
+
+
+class Limiter:
+    """Lookahead peak limiter on (frames, channels) blocks, with no per-sample Python.
+
+    The output is the input delayed by `lookahead` frames, so gain can ramp down
+    before a peak arrives. The ramp is a sliding minimum over the lookahead window.
+    The release (g[n] = min(target[n], g[n-1] + step)) becomes one
+    minimum.accumulate once the step's linear growth is folded into the target.
+    """
+
+    def __init__(self, sample_rate, channels=2, lookahead=LIMITER_LOOKAHEAD, release=LIMITER_RELEASE, ceiling=CEILING):
+        self.lookahead = lookahead
+        self.ceiling = ceiling
+        self.step = 1.0 / (release * sample_rate)
+        self.delay = np.zeros((lookahead, channels), dtype=np.float32)
+        self.targets = np.ones(lookahead)
+        self.gain = 1.0
+        self.ramp = np.arange(lookahead + 1) / lookahead
+        self.reduction = 0.0
+
+    def reset(self):
+        self.delay[:] = 0
+        self.targets[:] = 1.0
+        self.gain = 1.0
+
+    def process(self, block):
+        """Limit block in place"""
+        frames = len(block)
+        L = self.lookahead
+        peak = np.abs(block).max(axis=1)
+        target = np.minimum(1.0, self.ceiling / np.maximum(peak, 1e-9))
+        targets = np.concatenate([self.targets, target])
+        # Ramp down to each target over the L frames before it
+        windows = np.lib.stride_tricks.sliding_window_view(targets, L + 1)[:frames]
+        attack = np.min(windows + self.ramp, axis=1)
+        # Linear release: g[n] = min(attack[n], g[n-1] + step)
+        n = np.arange(1, frames + 1) * self.step
+        gain = np.minimum.accumulate(np.minimum(attack - n, self.gain)) + n
+        self.gain = float(gain[-1])
+        self.targets = targets[frames:]
+        self.reduction = 1.0 - float(gain.min())
+
+        delayed = np.concatenate([self.delay, block])
+        self.delay = delayed[frames:].copy()
+        np.multiply(delayed[:frames], gain[:, None], out=block)
+        np.clip(block, -1.0, 1.0, out=block)
+
+
+class EffectsChain:
+    """Reverb send and limiter after the mixer, with the time each block took tracked
+    so the reverb can be dropped when the effects threaten the audio deadline.
+
+    Every reverb is built up front: set_reverb() on the audio thread only swaps
+    references, since partitioning an IR takes longer than a block. A bypassed
+    reverb comes back after BYPASS_RETRY, so one spike (a GC pause, a stream
+    reopen) does not cost it for the rest of the session; each bypass that
+    follows soon after a retry waits twice as long.
+    """
+
+    def __init__(self, sample_rate, channels=2):
+        self.sample_rate = sample_rate
+        self.reverbs = {name: PartitionedReverb(impulse_spectra(name, sample_rate)) for name in IMPULSES}
+        self.reverb = None
+        self.reverb_name = None
+        self.wet = 0.0
+        self.limiter = Limiter(sample_rate, channels)
+        self.overloaded = 0
+        self.bypassed = False
+        self.bypasses = 0
+        self.retry = BYPASS_RETRY
+        self.since_bypass = 0
+        self.cpu = 0.0
+        self.mono = np.zeros(4096)
+
+    def add_impulse(self, name, ir):
+        """Make ir selectable as name; control side, never from the audio callback"""
+        self.reverbs[name] = PartitionedReverb(partition_impulse(ir))
+
+    def set_reverb(self, name, wet):
+        """Select an impulse response by name (None for dry); audio thread only"""
+        if name != self.reverb_name:
+            self.reverb_name = name
+            self.reverb = None
+            self.bypassed = False
+            self.overloaded = 0
+            self.retry = BYPASS_RETRY
+            reverb = self.reverbs.get(name)
+            if reverb is not None:
+                reverb.reset()
+                self.reverb = reverb
+        self.wet = wet
+
+    def process(self, block):
+        """Run (frames, 2) block through reverb and limiter in place; returns seconds spent"""
+        began = time.perf_counter()
+        frames = len(block)
+        if self.reverb is not None and self.wet > 0 and not self.bypassed:
+            if frames > len(self.mono):
+                self.mono = np.zeros(frames)
+            mono = self.mono[:frames]
+            np.mean(block, axis=1, out=mono)
+            self.reverb.process(mono, block, self.wet)
+        self.limiter.process(block)
+        elapsed = time.perf_counter() - began
+
+        self.cpu = elapsed * self.sample_rate / frames
+        self.since_bypass += frames
+        if self.bypassed:
+            # The reverb is not running, so its cost cannot be measured: retry after a while
+            if self.since_bypass >= self.retry * self.sample_rate:
+                if self.reverb is not None:
+                    self.reverb.reset()
+                self.bypassed = False
+                self.overloaded = 0
+        elif self.cpu > EFFECTS_BUDGET:
+            self.overloaded += 1
+            if self.overloaded >= OVERLOAD_BLOCKS:
+                # Reported from the event loop (Session.tune), never printed on the audio thread
+                if self.bypasses and self.since_bypass < 2 * self.retry * self.sample_rate:
+                    self.retry = min(self.retry * 2, BYPASS_RETRY_MAX)
+                else:
+                    self.retry = BYPASS_RETRY
+                self.bypassed = True
+                self.bypasses += 1
+                self.since_bypass = 0
+        else:
+            self.overloaded = 0
+        return elapsed
@@ -0,0 +1,220 @@
+import numpy as np
+
+# All filters work on every channel at once: x is a float array of shape (channels,)
+
+
+class MovingAverage:
+    def __init__(self, channels, size=5, **_):
+        self.size = size
+        self.buf = np.zeros((size, channels))
+        self.sum = np.zeros(channels)
+        self.pos = 0
+        self.count = 0
+
+    def reset(self):
+        self.buf[:] = 0
+        self.sum[:] = 0
+        self.pos = 0
+        self.count = 0
+
+    def __call__(self, x):
+        # Running sum: subtract the sample falling out of the window, add the new one
+        self.sum += x - self.buf[self.pos]
+        self.buf[self.pos] = x
+        self.pos = (self.pos + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        return self.sum / self.count
+
+
+class EMA:
+    def __init__(self, channels, alpha=0.4, **_):
+        self.alpha = alpha
+        self.value = np.zeros(channels)
+        self.primed = False
+
+    def reset(self):
+        self.primed = False
+
+    def __call__(self, x):
+        if not self.primed:
+            self.value[:] = x
+            self.primed = True
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value.copy()
+
+
+class OneEuro:
+    """One-euro filter: smooth at rest, low lag while the signal moves fast"""
+
+    def __init__(self, channels, rate=1000.0, min_cutoff=1.0, beta=0.007, d_cutoff=1.0, **_):
+        self.rate = rate
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_alpha = self.alpha(d_cutoff)
+        self.value = np.zeros(channels)
+        self.deriv = np.zeros(channels)
+        self.primed = False
+
+    def alpha(self, cutoff):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau * self.rate)
+
+    def reset(self):
+        self.deriv[:] = 0
+        self.primed = False
+
+    def __call__(self, x):
+        if not self.primed:
+            self.value[:] = x
+            self.primed = True
+            return self.value.copy()
+        self.deriv += self.d_alpha * ((x - self.value) * self.rate - self.deriv)
+        a = self.alpha(self.min_cutoff + self.beta * np.abs(self.deriv))
+        self.value += a * (x - self.value)
+        return self.value.copy()
+
+
+class Median:
+    def __init__(self, channels, size=5, **_):
+        self.size = size
+        self.buf = np.zeros((size, channels))
+        self.pos = 0
+        self.count = 0
+
+    def reset(self):
+        self.pos = 0
+        self.count = 0
+
+    def __call__(self, x):
+        self.buf[self.pos] = x
+        self.pos = (self.pos + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        return np.median(self.buf[:self.count], axis=0)
+
+
+FILTERS = {
+    'moving_average': MovingAverage,
+    'ema': EMA,
+    'one_euro': OneEuro,
+    'median': Median,
+}
+
+
+CALIBRATION_FRAMES = 200  # raw frames for a baseline: 0.2 s at 1 kHz
+MAD_SIGMA = 1.4826         # MAD -> standard deviation for Gaussian noise
+NOISE_ON = 8.0             # a finger never activates closer than this many noise sigmas to rest
+NOISE_OFF = 5.0
+DRIFT_RATE = 1e-4          # per frame: rest follows a released finger with a ~10 s time constant at 1 kHz
+DRIFT_GATE = 0.5           # ...but only while its drop is within this fraction of threshold_off
+
+
+class FingerDetector:
+    """Filters every finger channel and applies on/off hysteresis in one vectorized step.
+
+    Calibration happens inline: start_calibration() collects the next raw frames and
+    takes their median as rest and their MAD as per-finger noise, which sets a floor
+    under each finger's thresholds. Afterwards rest slowly follows released fingers
+    so sensor drift does not need a fresh calibration.
+    """
+
+    def __init__(self, fingers, threshold_on, threshold_off, filter_name='moving_average', **filter_args):
+        self.names = list(fingers)
+        self.idx = np.array([cfg['idx'] for cfg in fingers.values()])
+        self.range = np.array([cfg['range'] for cfg in fingers.values()], dtype=np.float64)
+        self.rest = np.full(len(self.names), np.nan)
+        self.noise = np.zeros(len(self.names))
+        self.threshold_on = threshold_on
+        self.threshold_off = threshold_off
+        self.on = np.full(len(self.names), threshold_on, dtype=np.float64)
+        self.off = np.full(len(self.names), threshold_off, dtype=np.float64)
+        self.active = np.zeros(len(self.names), dtype=bool)
+        self.drop = np.zeros(len(self.names))
+        self.samples = None
+        self.collected = 0
+        self.on_calibrated = None
+        self.pending_calibration = None
+        self.filter_args = filter_args
+        self.set_filter(filter_name)
+
+    def set_filter(self, name, **args):
+        self.filter_name = name
+        self.filter_args.update(args)
+        self.filter = FILTERS[name](len(self.names), **self.filter_args)
+
+    def set_rest(self, rest):
+        self.rest[:] = [rest.get(name, np.nan) for name in self.names]
+
+    def rest_dict(self):
+        return {name: int(value) for name, value in zip(self.names, self.rest) if not np.isnan(value)}
+
+    def set_thresholds(self, threshold_on=None, threshold_off=None):
+        if threshold_on is not None:
+            self.threshold_on = threshold_on
+        if threshold_off is not None:
+            self.threshold_off = threshold_off
+        np.maximum(self.threshold_on, NOISE_ON * self.noise / self.range, out=self.on)
+        np.maximum(self.threshold_off, NOISE_OFF * self.noise / self.range, out=self.off)
+
+    def start_calibration(self, frames=CALIBRATION_FRAMES, done=None):
+        """Take rest and noise from the next frames; done(rest, noise) runs on the sensor thread.
+
+        Safe from any thread: the request is only picked up by the next update().
+        """
+        self.pending_calibration = (frames, done)
+
+    def cancel_calibration(self):
+        """Drop a requested or running calibration so its done callback never runs; safe from any thread"""
+        self.pending_calibration = None
+        self.on_calibrated = None
+
+    def begin_calibration(self, frames, done):
+        self.rest[:] = np.nan
+        self.samples = np.empty((frames, len(self.names)))
+        self.collected = 0
+        self.on_calibrated = done
+        self.reset()
+
+    def finish_calibration(self):
+        samples, done = self.samples, self.on_calibrated
+        self.samples = None
+        self.on_calibrated = None
+        rest = np.median(samples, axis=0)
+        self.noise[:] = np.maximum(MAD_SIGMA * np.median(np.abs(samples - rest), axis=0), 1.0)
+        self.rest[:] = rest
+        self.set_thresholds()
+        if done:
+            done(self.rest_dict(), dict(zip(self.names, self.noise.tolist())))
+
+    def reset(self):
+        self.filter.reset()
+        self.active[:] = False
+        self.drop[:] = 0
+
+    def update(self, frame):
+        """Feed one decoded frame; returns (previous active mask, new active mask)"""
+        raw = frame[self.idx].astype(np.float64)
+        if self.pending_calibration is not None:
+            pending, self.pending_calibration = self.pending_calibration, None
+            self.begin_calibration(*pending)
+        if self.samples is not None:
+            self.samples[self.collected] = raw
+            self.collected += 1
+            if self.collected == len(self.samples):
+                self.finish_calibration()
+        filtered = self.filter(raw)
+        np.divide(self.rest - filtered, self.range, out=self.drop)
+        # NaN drops (uncalibrated fingers) compare False and never activate
+        new_active = np.where(self.active, self.drop > self.off, self.drop > self.on)
+        # Drift: let rest follow fingers that are released and near it
+        idle = ~new_active & (np.abs(self.drop) < self.off * DRIFT_GATE)
+        if idle.any():
+            self.rest[idle] += DRIFT_RATE * (filtered[idle] - self.rest[idle])
+        previous = self.active
+        self.active = new_active
+        return previous, new_active
+
+    def fingers(self, mask):
+        return {self.names[i] for i in np.flatnonzero(mask)}
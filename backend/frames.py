@@ -0,0 +1,78 @@
+import numpy as np
+
+HEADER = b'\xaa\x55'
+FRAME_SIZE = 40
+FRAME_FIELDS = FRAME_SIZE // 4
+BUFFER_SIZE = 64 * 1024
+
+EMPTY = np.zeros((0, FRAME_FIELDS), dtype=np.uint32)
+
+
+class FrameDecoder:
+    """Streaming decoder for 40-byte '\\xaa\\x55' frames.
+
+    Bytes are written into a preallocated buffer; every complete frame is decoded
+    in one np.frombuffer call per run of back-to-back frames, and partial frames
+    stay in the buffer until the rest of their bytes arrive.
+    """
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.end = 0
+        self.dropped_bytes = 0
+
+    def reset(self):
+        self.end = 0
+
+    def space(self):
+        """Writable view of the free part of the buffer, for readinto()"""
+        return self.view[self.end:]
+
+    def commit(self, n):
+        self.end += n
+
+    def feed(self, data):
+        """Append bytes and return every complete frame as a (n, 10) uint32 array"""
+        n = len(data)
+        if n > len(self.buf) - self.end:
+            self.dropped_bytes += self.end
+            self.end = 0
+            data = data[-len(self.buf):]
+            n = len(data)
+        self.view[self.end:self.end + n] = data
+        self.end += n
+        return self.decode()
+
+    def decode(self):
+        buf, end = self.buf, self.end
+        pos = 0
+        batches = []
+        while end - pos >= FRAME_SIZE:
+            start = buf.find(HEADER, pos, end)
+            if start < 0:
+                # Keep a trailing 0xAA, it may be the first half of the next header
+                pos = end - 1 if buf[end - 1] == HEADER[0] else end
+                break
+            self.dropped_bytes += start - pos
+            count = (end - start) // FRAME_SIZE
+            if count == 0:
+                pos = start
+                break
+            raw = np.frombuffer(buf, dtype=np.uint8, count=count * FRAME_SIZE, offset=start).reshape(count, FRAME_SIZE)
+            valid = (raw[:, 0] == HEADER[0]) & (raw[:, 1] == HEADER[1])
+            run = count if valid.all() else int(np.argmin(valid))
+            batches.append(raw[:run].view('<u4').astype(np.uint32))
+            # On a broken run the next find() resyncs from the bad frame onward
+            pos = start + run * FRAME_SIZE
+
+        remaining = end - pos
+        if remaining and pos:
+            self.buf[:remaining] = self.buf[pos:end]
+        self.end = remaining
+
+        if not batches:
+            return EMPTY
+        if len(batches) == 1:
+            return batches[0]
+        return np.concatenate(batches)
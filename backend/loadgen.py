@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import sys
+import time
+import numpy as np
+from metrics import LATENCIES, Histogram
+from session import get_session, sessions
+
+def percentiles(samples):
+    """p50/p95/p99/max in milliseconds"""
+    if not len(samples):
+        return "no samples"
+    ms = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return f"p50 {p50:.2f}ms  p95 {p95:.2f}ms  p99 {p99:.2f}ms  max {ms.max():.2f}ms  (n={len(ms)})"
+
+class SimulatedClient:
+    """Takes the place of a WebSocket: records how long after the glove produced a press
+    the "fingers" message naming that finger reached this client"""
+
+    def __init__(self, session, latencies, send_delay=0.0):
+        self.session = session
+        self.latencies = latencies
+        self.send_delay = send_delay
+        self.active = set()
+        self.messages = 0
+
+    async def send_json(self, msg):
+        self.messages += 1
+        if msg.get("type") == "fingers":
+            now = time.monotonic()
+            onsets = self.session.ser.onsets
+            active = set(msg["active"])
+            for finger in active - self.active:
+                if finger in onsets:
+                    self.latencies.append(now - onsets[finger])
+            self.active = active
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+
+async def run(args):
+    latencies = []
+    clients = []
+    for i in range(args.gloves):
+        session = get_session(f"sim-{i}")
+        options = f"rate={args.rate},pattern={args.pattern},interval={args.interval},hold={args.hold},seed={i}"
+        session.connect(f"sim:{options}", "null", args.io)
+        if args.preset:
+            session.state["current_preset"] = args.preset
+        for _ in range(args.clients):
+            client = SimulatedClient(session, latencies, args.send_delay)
+            session.bridge.attach(client)
+            clients.append(client)
+
+    await asyncio.gather(*(session.calibrate() for session in sessions.values()))
+    started = time.monotonic()
+    produced = {session: session.ser.produced for session in sessions.values()}
+    for session in sessions.values():
+        session.metrics.reset()
+        session.start_reader()
+
+    await asyncio.sleep(args.duration)
+    elapsed = time.monotonic() - started
+
+    produced = sum(session.ser.produced - produced[session] for session in sessions.values())
+    read = sum(session.metrics.counters["frames"] for session in sessions.values())
+    presses = sum(session.ser.press_count for session in sessions.values())
+    published = sum(session.bridge.published for session in sessions.values())
+    # Callback numbers come from the session metrics, which outlive a stream the tuner reopened
+    late = sum(session.metrics.counters["underruns"] for session in sessions.values())
+    misses = sum(session.metrics.counters["deadline_misses"] for session in sessions.values())
+    blocks = sum(session.metrics.counters["callbacks"] for session in sessions.values())
+    stages = {}
+    for name in list(LATENCIES) + ["update_sound", "effects", "callback"]:
+        stages[name] = Histogram()
+        for session in sessions.values():
+            stages[name].merge(session.metrics[name])
+    dropped = sum(sum(ch.dropped for ch in session.bridge.channels.values()) for session in sessions.values())
+    # Each block's deadline is its own length on the stream that is live now
+    deadlines = {session.stream.blocksize / session.stream.samplerate for session in sessions.values()}
+    budget = sum(session.metrics.counters["callbacks"] * session.stream.blocksize / session.stream.samplerate
+                 for session in sessions.values())
+    used = stages["callback"].total / 1e6 / budget * 100 if budget else 0.0
+
+    for session in list(sessions.values()):
+        for client in list(session.bridge.channels):
+            session.bridge.detach(client)
+        session.disconnect()
+
+    print(f"{args.gloves} gloves x {args.clients} clients, {args.rate:.0f} frames/s each, {args.io} I/O, {elapsed:.1f}s")
+    print(f"  frames        {read}/{produced} read ({read / elapsed:.0f}/s)")
+    print(f"  presses       {presses} ({presses / elapsed:.1f}/s)")
+    print(f"  broadcast     {published} published, {sum(c.messages for c in clients)} delivered, {dropped} dropped")
+    print(f"  press->client {percentiles(latencies)}")
+    for name, histogram in stages.items():
+        stats = histogram.snapshot()
+        print(f"  {name:<19} p50 {stats['p50']:.2f}ms  p99 {stats['p99']:.2f}ms  max {stats['max']:.2f}ms  (n={stats['count']})")
+    deadline = "/".join(f"{d * 1000:.1f}" for d in sorted(deadlines))
+    print(f"  deadline      {used:.1f}% of {deadline}ms used on average, {misses}/{blocks} blocks over, {late} late")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive simulated gloves and clients through the live pipeline and report latency and throughput")
+    parser.add_argument("--gloves", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=2, help="simulated WebSocket clients per glove")
+    parser.add_argument("--rate", type=float, default=1000, help="frames per second per glove")
+    parser.add_argument("--pattern", choices=["scale", "random"], default="scale")
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between presses")
+    parser.add_argument("--hold", type=float, default=0.15, help="seconds each press is held")
+    parser.add_argument("--preset", help="preset every session plays")
+    parser.add_argument("--send-delay", type=float, default=0.0, help="seconds each client takes per message")
+    parser.add_argument("--io", choices=["thread", "async"], default="thread", help="reader threads or event-loop fd readers")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
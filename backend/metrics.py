@@ -0,0 +1,130 @@
+import time
+
+SUB_BUCKETS = 16      # per power of two: values are kept to within ~6%
+MAX_VALUE = 1 << 26   # microseconds (~67 s); anything slower lands in the last bucket
+
+def bucket_of(us):
+    if us < SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - SUB_BUCKETS.bit_length()
+    return (shift + 1) * SUB_BUCKETS + (us >> shift) - SUB_BUCKETS
+
+def bucket_value(index):
+    """Upper edge of a bucket, in microseconds"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return ((index % SUB_BUCKETS + SUB_BUCKETS + 1) << shift) - 1
+
+BUCKETS = bucket_of(MAX_VALUE) + 1
+
+
+class Histogram:
+    """HDR-style log-linear histogram of durations.
+
+    record() is a couple of integer ops and one list increment, cheap enough for
+    the audio callback and the sensor thread. Each histogram should have a single
+    writer; readers only ever take snapshots.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        us = int(seconds * 1e6)
+        if us < 0:
+            us = 0
+        elif us >= MAX_VALUE:
+            us = MAX_VALUE - 1
+        self.counts[bucket_of(us)] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, q):
+        """Value (in microseconds) at or below which q percent of samples fall"""
+        counts = list(self.counts)
+        target = sum(counts) * q / 100
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if n and seen >= target:
+                return min(bucket_value(i), self.max)
+        return 0
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def snapshot(self):
+        """Summary in milliseconds"""
+        return {
+            "count": self.count,
+            "mean": self.total / self.count / 1000 if self.count else 0.0,
+            "p50": self.percentile(50) / 1000,
+            "p90": self.percentile(90) / 1000,
+            "p99": self.percentile(99) / 1000,
+            "p999": self.percentile(99.9) / 1000,
+            "max": self.max / 1000,
+        }
+
+
+# Stage latencies measured from the moment a frame's bytes came off the port
+LATENCIES = {
+    "frame_to_threshold": "serial read to the detector flipping a finger",
+    "frame_to_update": "serial read to update_sound having queued the notes",
+    "frame_to_audio": "serial read to the first audio block carrying the press (plus output latency when the device reports it)",
+    "frame_to_ui": "serial read to the WebSocket send of the fingers message",
+}
+
+DURATIONS = {
+    "update_sound": "time spent in update_sound",
+    "callback": "time spent in audio_callback",
+    "effects": "time per audio block in the reverb and limiter",
+    "read": "time per read_loop batch: decode, filter and dispatch",
+}
+
+
+class Metrics:
+    """Per-session latency histograms and counters, exposed at /metrics"""
+
+    def __init__(self):
+        self.histograms = {name: Histogram() for name in list(LATENCIES) + list(DURATIONS)}
+        self.counters = {
+            "frames": 0,
+            "callbacks": 0,
+            "underruns": 0,
+            "deadline_misses": 0,
+        }
+        self.started = time.time()
+
+    def __getitem__(self, name):
+        return self.histograms[name]
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        for name in self.counters:
+            self.counters[name] = 0
+        self.started = time.time()
+
+    def snapshot(self, **extra):
+        return {
+            "since": self.started,
+            "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            "counters": dict(self.counters, **extra),
+        }
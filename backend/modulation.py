@@ -0,0 +1,70 @@
+import numpy as np
+
+FRAME_RATE = 1000.0        # sensor frames per second, unless the port says otherwise
+VELOCITY_FULL = 100.0      # drop per second (in units of the finger's range) for a full-velocity strike
+VELOCITY_FLOOR = 0.4       # gain of the gentlest press that still crosses the threshold
+FORCE_SPAN = 1.0           # drop past threshold_on that counts as full force
+VOLUME_FLOOR = 0.5         # voice gain at the threshold...
+BRIGHTNESS_FLOOR = 0.15    # ...and how much of its upper spectrum is left there
+SMOOTHING = 0.01           # seconds: time constant the audio side glides to new values with
+EPSILON = 0.01             # smallest control change worth publishing to the audio thread
+
+VOLUME, BRIGHTNESS = range(2)
+
+
+class ForceModulator:
+    """Continuous force per finger, turned into voice controls on the sensor thread.
+
+    Velocity comes from how fast the drop was rising on the frame a finger went
+    down and is fixed for that note. Volume and brightness follow how far past its
+    on threshold the finger is pressed for as long as it is held; a released
+    finger keeps its last values so the release tail does not jump.
+
+    update() never modifies an array that was handed out: the controls are a
+    fresh (2, fingers) array whenever a held finger moves more than EPSILON
+    from what was last published, so publishing them to the audio thread is a
+    single reference swap and the audio side picks up whatever arrived since
+    its last block in one read. Smaller changes are below what the audio
+    side's smoothing would let anyone hear and are not published at all.
+    """
+
+    def __init__(self, fingers, frame_rate=FRAME_RATE):
+        self.names = list(fingers)
+        self.frame_rate = frame_rate
+        self.last = np.zeros(len(self.names))
+        self.reset()
+
+    def reset(self):
+        self.last[:] = 0.0
+        self.velocity = np.ones(len(self.names))
+        self.controls = np.ones((2, len(self.names)))
+
+    def update(self, drop, on, previous, active):
+        """Per frame; returns the new controls, or None when there is nothing new to publish"""
+        drop = np.nan_to_num(drop)
+        onset = active & ~previous
+        if onset.any():
+            rate = (drop[onset] - self.last[onset]) * self.frame_rate
+            self.velocity[onset] = VELOCITY_FLOOR + (1 - VELOCITY_FLOOR) * np.clip(rate / VELOCITY_FULL, 0.0, 1.0)
+        np.copyto(self.last, drop)
+        if not active.any():
+            return None
+        force = np.clip((drop[active] - on[active]) / FORCE_SPAN, 0.0, 1.0)
+        volume = VOLUME_FLOOR + (1 - VOLUME_FLOOR) * force
+        brightness = BRIGHTNESS_FLOOR + (1 - BRIGHTNESS_FLOOR) * force
+        published = self.controls
+        if (np.abs(published[VOLUME, active] - volume).max() <= EPSILON
+                and np.abs(published[BRIGHTNESS, active] - brightness).max() <= EPSILON):
+            return None
+        controls = published.copy()
+        controls[VOLUME, active] = volume
+        controls[BRIGHTNESS, active] = brightness
+        self.controls = controls
+        return controls
+
+    def snapshot(self):
+        return {
+            name: {"velocity": float(self.velocity[i]), "volume": float(self.controls[VOLUME, i]),
+                   "brightness": float(self.controls[BRIGHTNESS, i])}
+            for i, name in enumerate(self.names)
+        }
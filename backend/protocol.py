@@ -0,0 +1,76 @@
+import struct
+import numpy as np
+
+# Binary WebSocket messages, all little-endian, first byte is the message type:
+#   FINGERS  <B type><B active mask><B changed mask>           bit i = FINGERS[i]
+#   DROPS    <B type><B format><B fingers><H rows><I first frame><I step>
+#            followed by rows x fingers values (float16, or int16 = drop * DROP_SCALE)
+VERSION = 1
+FINGERS_MSG = 1
+DROPS_MSG = 2
+
+FORMATS = {'float16': 0, 'int16': 1}
+DROP_SCALE = 1000          # int16 drops are in thousandths of a finger's range
+DROPS_HEADER = struct.Struct('<BBBHII')
+
+DROP_BATCH = 32            # frames per drops message before decimation (~32 ms at 1 kHz)
+DEFAULT_DECIMATION = 10    # 100 Hz from a 1 kHz glove
+
+
+def describe(fingers):
+    """What the init message advertises so a client can opt in"""
+    return {
+        "version": VERSION,
+        "fingers": list(fingers),
+        "formats": list(FORMATS),
+        "drop_scale": DROP_SCALE,
+        "default_decimation": DEFAULT_DECIMATION,
+    }
+
+
+def finger_mask(names, fingers):
+    mask = 0
+    for i, name in enumerate(names):
+        if name in fingers:
+            mask |= 1 << i
+    return mask
+
+
+def encode_fingers(mask, previous):
+    return bytes((FINGERS_MSG, mask, mask ^ previous))
+
+
+def encode_drops(drops, first, decimation, fmt):
+    """drops: (rows, fingers) floats for frames first, first+1, ...; keeps every
+    decimation-th frame counted from frame 0 so batches line up across messages.
+    Returns None when no kept frame falls in this batch."""
+    offset = -first % decimation
+    rows = drops[offset::decimation]
+    if not len(rows):
+        return None
+    if fmt == FORMATS['int16']:
+        values = np.clip(np.round(np.nan_to_num(rows) * DROP_SCALE), -32768, 32767).astype('<i2')
+    else:
+        values = rows.astype('<f2')
+    header = DROPS_HEADER.pack(DROPS_MSG, fmt, drops.shape[1], len(rows), first + offset, decimation)
+    return header + values.tobytes()
+
+
+class DropBatcher:
+    """Collects the detector's per-frame drops on the sensor thread and hands out
+    full (DROP_BATCH, fingers) blocks; only runs while some client wants them"""
+
+    def __init__(self, fingers, batch=DROP_BATCH):
+        self.rows = np.zeros((batch, fingers), dtype=np.float32)
+        self.count = 0
+        self.frame = 0
+
+    def add(self, drop):
+        """Returns (first frame index, rows) when a batch is complete, else None"""
+        self.rows[self.count] = drop
+        self.count += 1
+        self.frame += 1
+        if self.count < len(self.rows):
+            return None
+        self.count = 0
+        return self.frame - len(self.rows), self.rows.copy()
@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+import uuid
+import numpy as np
+
+RECORDINGS_DIR = os.environ.get("RIPPLE_RECORDINGS", os.path.join(os.path.expanduser("~"), ".local", "share", "ripple", "recordings"))
+
+FORMAT_VERSION = 1
+FRAME_FIELDS = 10
+
+# Column name -> (dtype, trailing shape). Each column is one raw little-endian file.
+COLUMNS = {
+    "frame_time": ("<f8", ()),
+    "frames": ("<u4", (FRAME_FIELDS,)),
+    "event_time": ("<f8", ()),
+    "event_finger": ("u1", ()),
+    "event_pressed": ("u1", ()),
+    "event_sound": ("<i2", ()),
+    "event_type": ("u1", ()),
+    "event_preset": ("<i2", ()),
+}
+
+SOUND_TYPES = ['note', 'drum', 'none']
+
+
+class RecordingWriter:
+    """Streams decoded frames and finger events into a directory of column files.
+
+    Rows are appended as they arrive (from the reader thread), so memory stays flat
+    however long the session runs. index.json holds the column layout, string
+    tables and metadata; it is rewritten on close, but readers derive row counts
+    from file sizes so a recording cut short by a crash still opens.
+    """
+
+    def __init__(self, path, meta=None, fingers=()):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = dict(meta or {})
+        self.fingers = list(fingers)
+        self.strings = []
+        self.string_ids = {}
+        self.files = {name: open(os.path.join(path, f"{name}.bin"), "ab") for name in COLUMNS}
+        self.frame_rows = 0
+        self.event_rows = 0
+        self.lock = threading.Lock()
+        self.closed = False
+        self.write_index()
+
+    def string_id(self, value):
+        if value is None:
+            return -1
+        sid = self.string_ids.get(value)
+        if sid is None:
+            sid = self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return sid
+
+    def write_frames(self, t, frames):
+        """Append a batch of (n, 10) uint32 frames that arrived at time t"""
+        n = len(frames)
+        if not n:
+            return
+        with self.lock:
+            if self.closed:
+                return
+            self.files["frame_time"].write(np.full(n, t, dtype="<f8").tobytes())
+            self.files["frames"].write(np.ascontiguousarray(frames, dtype="<u4").tobytes())
+            self.frame_rows += n
+
+    def write_event(self, t, finger, pressed, sound=None, sound_type='note', preset=None):
+        strings = len(self.strings)
+        with self.lock:
+            if self.closed:
+                return
+            row = {
+                "event_time": np.array(t, "<f8"),
+                "event_finger": np.array(self.fingers.index(finger) if finger in self.fingers else 255, "u1"),
+                "event_pressed": np.array(1 if pressed else 0, "u1"),
+                "event_sound": np.array(self.string_id(sound), "<i2"),
+                "event_type": np.array(SOUND_TYPES.index(sound_type) if sound_type in SOUND_TYPES else 2, "u1"),
+                "event_preset": np.array(self.string_id(preset), "<i2"),
+            }
+            for name, value in row.items():
+                self.files[name].write(value.tobytes())
+            self.event_rows += 1
+        if len(self.strings) != strings:
+            # Keep the string table on disk current in case the recording is never closed
+            self.write_index()
+
+    def write_index(self):
+        index = {
+            "version": FORMAT_VERSION,
+            "columns": {name: {"dtype": dtype, "shape": list(shape)} for name, (dtype, shape) in COLUMNS.items()},
+            "frame_rows": self.frame_rows,
+            "event_rows": self.event_rows,
+            "fingers": self.fingers,
+            "strings": self.strings,
+            "sound_types": SOUND_TYPES,
+            "meta": self.meta,
+        }
+        tmp = os.path.join(self.path, "index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, "index.json"))
+
+    def close(self, **meta):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for f in self.files.values():
+                f.close()
+        self.meta.update(meta)
+        self.write_index()
+
+
+class Recording:
+    """Read side: every column memory-mapped, nothing loaded until it is touched"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.meta = self.index["meta"]
+        self.fingers = self.index["fingers"]
+        self.strings = self.index["strings"]
+        self.columns = {}
+        for name, spec in self.index["columns"].items():
+            self.columns[name] = self.map_column(name, np.dtype(spec["dtype"]), tuple(spec["shape"]))
+
+    def map_column(self, name, dtype, shape):
+        file = os.path.join(self.path, f"{name}.bin")
+        row_size = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        rows = os.path.getsize(file) // row_size if os.path.exists(file) else 0
+        if rows == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(file, dtype=dtype, mode="r", shape=(rows,) + shape)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def frame_count(self):
+        return min(len(self.columns["frame_time"]), len(self.columns["frames"]))
+
+    @property
+    def event_count(self):
+        return min(len(self.columns[name]) for name in COLUMNS if name.startswith("event_"))
+
+    def string(self, sid):
+        return self.strings[sid] if 0 <= sid < len(self.strings) else None
+
+    def events_json(self):
+        """Press events grouped per timestamp, in the shape stop_recording has always sent,
+        with each sound's hold time added as "duration" when its release was recorded"""
+        n = self.event_count
+        t = np.asarray(self.columns["event_time"][:n])
+        finger = np.asarray(self.columns["event_finger"][:n])
+        pressed = np.asarray(self.columns["event_pressed"][:n]).astype(bool)
+        sound = np.asarray(self.columns["event_sound"][:n])
+        kind = np.asarray(self.columns["event_type"][:n])
+        preset = np.asarray(self.columns["event_preset"][:n])
+
+        events = []
+        held = {}
+        for i in range(n):
+            name = self.fingers[finger[i]] if finger[i] < len(self.fingers) else None
+            if not pressed[i]:
+                # Release: close the note the finger opened, so playback knows how long it held
+                entry = held.pop(name, None)
+                if entry is not None:
+                    entry["duration"] = float(t[i]) - entry.pop("start")
+                continue
+            entry = {"finger": name, "sound": self.string(sound[i]), "type": SOUND_TYPES[kind[i]], "start": float(t[i])}
+            held[name] = entry
+            if events and events[-1]["time"] == float(t[i]):
+                events[-1]["fingers"].append(name)
+                events[-1]["sounds"].append(entry)
+            else:
+                events.append({
+                    "time": float(t[i]),
+                    "fingers": [name],
+                    "sounds": [entry],
+                    "preset": self.string(preset[i]),
+                })
+        for entry in held.values():
+            entry.pop("start")
+        return events
+
+
+def new_recording_path(session_id, root=RECORDINGS_DIR):
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(root, f"{session_id}-{stamp}-{uuid.uuid4().hex[:6]}")
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(root):
+        raise ValueError(f"Recording path escapes {root}: {path}")
+    return path
+
+def recording_path(recording_id, root=RECORDINGS_DIR):
+    """Directory of a saved recording named by a client; ValueError for anything not directly under root"""
+    if not recording_id or recording_id in ('.', '..') or os.path.basename(recording_id) != recording_id:
+        raise ValueError(f"Invalid recording id: {recording_id!r}")
+    path = os.path.realpath(os.path.join(root, recording_id))
+    if os.path.dirname(path) != os.path.realpath(root):
+        raise ValueError(f"Invalid recording id: {recording_id!r}")
+    return path
+
+def open_recording(path):
+    return Recording(path)
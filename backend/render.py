@@ -0,0 +1,130 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import wave
+import numpy as np
+from session import CHANNELS, SAMPLE_RATE, Session
+from sampler import wait_ready
+from scheduler import LOOKAHEAD
+from recorder import RECORDINGS_DIR, open_recording, recording_path
+
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+RENDER_BLOCK = 8192
+TAIL = 1.0  # seconds rendered past the last event so releases and drums ring out
+
+FORMATS = {'wav': 'audio/wav', 'flac': 'audio/flac'}
+
+def load_recording(source):
+    """A recording dict from stop_recording JSON (dict or .json path) or a recording directory"""
+    if isinstance(source, dict):
+        return source
+    if os.path.isdir(source) or not os.path.exists(source):
+        return read_recording(source if os.path.isdir(source) else os.path.join(RECORDINGS_DIR, source))
+    with open(source) as f:
+        data = json.load(f)
+    return data.get("recording", data)
+
+def load_saved_recording(recording_id):
+    """A recording from RECORDINGS_DIR by the id a client sent; never resolved against the CWD"""
+    return read_recording(recording_path(recording_id))
+
+def read_recording(path):
+    recording = open_recording(path)
+    return {
+        "id": os.path.basename(path),
+        "events": recording.events_json(),
+        "preset": recording.meta.get("preset"),
+        "sound": recording.meta.get("sound"),
+        "duration": recording.meta.get("duration", 0),
+    }
+
+def render_recording(recording, preset=None, instrument=None, block=RENDER_BLOCK, tail=TAIL):
+    """Run a recording through the same engine as a live session's audio_callback, offline.
+
+    Returns (frames, CHANNELS) float32 samples at SAMPLE_RATE. Nothing touches the audio device:
+    the callback is simply called back to back on large blocks. The instrument, tuning
+    and reverb recorded with it are restored unless a preset or instrument overrides them.
+    """
+    recording = dict(recording)
+    if preset:
+        recording["preset"] = preset
+        recording["sound"] = {key: value for key, value in (recording.get("sound") or {}).items()
+                              if key in ("tuning", "a4")}
+    wait_ready()  # offline there is no reason to fall back to a wavetable while banks load
+    session = Session("render")
+    if recording.get("preset") in session.presets:
+        session.state["current_preset"] = recording["preset"]
+    timeline, _ = session.start_playback(recording)
+    if instrument:
+        session.playback_instrument = instrument
+
+    # The limiter delays everything by its lookahead: render that much longer and drop it
+    # with the scheduler's lead-in so output frame n is recording frame n
+    start = LOOKAHEAD + session.effects.limiter.lookahead
+    total = start + timeline.length + int(tail * SAMPLE_RATE)
+    out = np.zeros((total, CHANNELS), dtype=np.float32)
+    buf = np.zeros((block, CHANNELS), dtype=np.float32)
+    for pos in range(0, total, block):
+        n = min(block, total - pos)
+        session.audio_callback(buf[:n], n, None, None)
+        out[pos:pos + n] = buf[:n]
+    return out[start:]
+
+def encode(samples, fmt='wav'):
+    """Encode float samples as 16-bit WAV or FLAC bytes"""
+    if fmt == 'flac':
+        if sf is None:
+            raise RuntimeError("FLAC export needs the soundfile package")
+        buf = io.BytesIO()
+        sf.write(buf, samples, SAMPLE_RATE, format='FLAC', subtype='PCM_16')
+        return buf.getvalue()
+    if fmt != 'wav':
+        raise ValueError(f"Unknown format: {fmt}")
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as f:
+        f.setnchannels(pcm.shape[1] if pcm.ndim > 1 else 1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+def render_to_bytes(recording, fmt='wav', preset=None, instrument=None):
+    return encode(render_recording(recording, preset, instrument), fmt)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render Ripple recordings to WAV/FLAC faster than real time")
+    parser.add_argument("recordings", nargs="+", help="stop_recording JSON files, recording directories or recording ids")
+    parser.add_argument("-o", "--output", help="output file (single recording only)")
+    parser.add_argument("--out-dir", default=".", help="directory for batch output")
+    parser.add_argument("--format", choices=list(FORMATS), default="wav")
+    parser.add_argument("--preset", help="override the recording's preset")
+    parser.add_argument("--instrument", help="override the preset's instrument")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.recordings) > 1:
+        parser.error("--output only works with a single recording; use --out-dir")
+
+    for source in args.recordings:
+        started = time.perf_counter()
+        recording = load_recording(source)
+        samples = render_recording(recording, args.preset, args.instrument)
+        data = encode(samples, args.format)
+        name = os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+        path = args.output or os.path.join(args.out_dir, f"{name}.{args.format}")
+        with open(path, "wb") as f:
+            f.write(data)
+        elapsed = time.perf_counter() - started
+        seconds = len(samples) / SAMPLE_RATE
+        print(f"{path}: {seconds:.1f}s of audio in {elapsed:.2f}s ({seconds / max(elapsed, 1e-9):.0f}x real time)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+import wave
+import numpy as np
+from drums import CACHE_DIR
+
+INSTRUMENTS_DIR = os.environ.get("RIPPLE_INSTRUMENTS", os.path.join(os.path.expanduser("~"), ".local", "share", "ripple", "instruments"))
+
+ATTACK_FRAMES = 4096      # ~93 ms of every region kept in RAM so onsets never wait on the disk
+PREFETCH_FRAMES = 44100   # what a starting voice asks the kernel to read ahead past its attack
+GENERATOR_VERSION = 1     # bump when the built-in generators change so stale banks are rebuilt
+
+NOTE_NAMES = {'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7, 'a': 9, 'b': 11}
+
+
+def midi_to_freq(midi):
+    return 440.0 * 2 ** ((midi - 69) / 12)
+
+
+def parse_key(value):
+    """SFZ key: a MIDI number or a note name such as c4, f#3 or eb5"""
+    if value.lstrip('-').isdigit():
+        return int(value)
+    match = re.match(r'^([a-g])([#b]?)(-?\d)$', value.lower())
+    if not match:
+        raise ValueError(f"Bad key: {value}")
+    name, accidental, octave = match.groups()
+    return NOTE_NAMES[name] + {'#': 1, 'b': -1}.get(accidental, 0) + 12 * (int(octave) + 1)
+
+
+def generate_piano(midi, duration, sample_rate, seed=0):
+    """Struck string: slightly inharmonic partials, the high ones dying first, plus a hammer thump"""
+    rng = np.random.default_rng(seed)
+    freq = midi_to_freq(midi)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    inharmonicity = 0.0004 * 2 ** ((midi - 60) / 24)
+    n = np.arange(1, 25)
+    partials = n * freq * np.sqrt(1 + inharmonicity * n ** 2)
+    n, partials = n[partials < sample_rate * 0.45], partials[partials < sample_rate * 0.45]
+    amps = 1.0 / n ** 1.3
+    decay = (0.6 + 2.5 * np.exp(-(midi - 21) / 30)) / n ** 0.7   # seconds per partial
+    wave = (amps[:, None] * np.sin(2 * np.pi * partials[:, None] * t + rng.random(len(n))[:, None] * 0.2)
+            * np.exp(-t / decay[:, None])).sum(axis=0)
+    wave += 0.05 * rng.standard_normal(len(t)) * np.exp(-t / 0.004)
+    return wave
+
+
+def generate_guitar(midi, duration, sample_rate, seed=0):
+    """Karplus-Strong plucked string, computed a period at a time.
+
+    Returns (samples, actual pitch) since the integer delay rounds the pitch.
+    """
+    rng = np.random.default_rng(seed)
+    period = max(int(round(sample_rate / midi_to_freq(midi) - 0.5)), 2)
+    total = int(duration * sample_rate)
+    periods = -(-total // period) + 1
+    out = np.zeros(periods * period)
+    out[:period] = rng.uniform(-1, 1, period)
+    # Each sample is the damped average of the two samples one period back
+    damping = 0.996
+    for k in range(1, periods):
+        prev = out[(k - 1) * period:k * period]
+        shifted = out[(k - 1) * period - 1:k * period - 1] if k > 1 else np.concatenate([[0.0], prev[:-1]])
+        out[k * period:(k + 1) * period] = damping * 0.5 * (prev + shifted)
+    return out[:total], sample_rate / (period + 0.5)
+
+
+# name -> (generator, root MIDI notes, seconds per region, envelope, wavetable used until loaded)
+BUILTIN = {
+    'piano': (generate_piano, range(33, 100, 4), 2.5, (0.002, 0.05, 1.0, 0.35), 'bell'),
+    'guitar': (generate_guitar, range(40, 89, 4), 2.0, (0.001, 0.05, 1.0, 0.15), 'soft'),
+}
+DEFAULT_ENVELOPE = (0.002, 0.05, 1.0, 0.3)
+
+
+def read_wav(path):
+    """16-bit PCM WAV as mono float64 and its sample rate"""
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM samples are supported")
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').astype(np.float64) / 32768
+        data = data.reshape(-1, f.getnchannels()).mean(axis=1)
+        return data, f.getframerate()
+
+
+def parse_sfz(path):
+    """Regions of a .sfz file as (sample path, root frequency); <global>/<group> opcodes are inherited"""
+    with open(path) as f:
+        text = re.sub(r'//.*', '', f.read())
+    base = os.path.dirname(path)
+    scopes = {'control': {}, 'global': {}, 'group': {}}
+    regions = []
+    # Headers, and opcode=value pairs whose value may contain spaces (sample paths)
+    for header, body in re.findall(r'<(\w+)>([^<]*)', text):
+        opcodes = dict(re.findall(r'(\w+)=(.*?)(?=\s+\w+=|\s*$)', body.strip(), re.S))
+        if header in ('control', 'global'):
+            scopes[header] = opcodes
+            scopes['group'] = {}
+        elif header == 'group':
+            scopes['group'] = opcodes
+        elif header == 'region':
+            merged = {**scopes['global'], **scopes['group'], **opcodes}
+            if 'sample' not in merged:
+                continue
+            key = merged.get('pitch_keycenter', merged.get('key', '60'))
+            root = midi_to_freq(parse_key(key) + float(merged.get('tune', 0)) / 100)
+            sample = merged['sample'].strip().replace('\\', '/')
+            regions.append((os.path.join(base, scopes['control'].get('default_path', ''), sample), root))
+    return regions
+
+
+class SampledInstrument:
+    """Multisampled instrument: every region in one int16 file that is memory-mapped, never read in.
+
+    The bank is built once into CACHE_DIR (from a built-in generator or an .sfz)
+    and is then mapped read-only, so its size does not count against RAM and
+    the kernel pages it in as voices play. The first ATTACK_FRAMES of each
+    region are also copied into a table in RAM. A note therefore starts from
+    memory while the kernel is asked to read ahead the part that follows.
+
+    Rendering picks the region with the nearest root per voice and resamples it
+    with linear interpolation, one gather for the whole block of all voices.
+    """
+
+    def __init__(self, name, envelope=DEFAULT_ENVELOPE, fallback='sine'):
+        self.name = name
+        self.envelope = envelope
+        self.fallback = fallback
+        self.available = False          # the audio thread only reads this flag
+        self.loaded = threading.Event()  # set once loading finished, successfully or not
+        self.error = None
+
+    def load(self, path, index):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = np.frombuffer(self.map, dtype='<i2')
+        regions = index["regions"]
+        self.start = np.array([r["start"] for r in regions], dtype=np.intp)
+        self.length = np.array([r["length"] for r in regions], dtype=np.intp)
+        self.root = np.array([r["root"] for r in regions])
+        self.log_root = np.log2(self.root)
+        self.rate = np.array([r["rate"] for r in regions], dtype=np.float64)
+        # Attack copies: ATTACK_FRAMES + 1 columns so idx + 1 of the interpolation stays inside
+        self.attack = np.zeros((len(regions), ATTACK_FRAMES + 1), dtype=np.float32)
+        for i, (start, length) in enumerate(zip(self.start, self.length)):
+            n = min(length + 1, ATTACK_FRAMES + 1)
+            self.attack[i, :n] = self.data[start:start + n] / 32768
+        self.available = True
+
+    def prefetch(self, regions):
+        """Ask the kernel to start reading what follows the attack of these regions"""
+        if not hasattr(self.map, 'madvise'):
+            return
+        page = mmap.PAGESIZE
+        for region in np.unique(regions):
+            begin = (int(self.start[region]) + ATTACK_FRAMES) * 2
+            end = min(begin + PREFETCH_FRAMES * 2, len(self.map))
+            offset = begin - begin % page
+            if end > offset:
+                try:
+                    self.map.madvise(mmap.MADV_WILLNEED, offset, end - offset)
+                except OSError:
+                    pass
+
+    def gather(self, region, idx):
+        """Samples at integer positions idx (voices x frames) of each voice's region"""
+        rows = np.broadcast_to(region[:, None], idx.shape)
+        early = idx <= ATTACK_FRAMES
+        if early.all():
+            return self.attack[rows, idx]
+        out = np.empty(idx.shape, dtype=np.float32)
+        out[early] = self.attack[rows[early], idx[early]]
+        late = ~early
+        out[late] = self.data[self.start[rows[late]] + idx[late]]
+        out[late] *= 1 / 32768
+        return out
+
+    def render(self, freqs, pos, frames, ramp, sample_rate):
+        """(voices x frames) samples for voices at freqs that are pos frames into their region.
+
+        Returns the samples and each voice's position after the block.
+        """
+        region = np.argmin(np.abs(np.log2(freqs)[:, None] - self.log_root[None, :]), axis=1)
+        starting = region[pos == 0]
+        if len(starting):
+            self.prefetch(starting)
+        step = freqs / self.root[region] * self.rate[region] / sample_rate
+        p = pos[:, None] + step[:, None] * ramp[None, :frames]
+        # Past the end, every index lands on the zero that follows the region
+        length = self.length[region][:, None]
+        idx = np.minimum(p.astype(np.intp), length)
+        frac = (p - idx).astype(np.float32)
+        lo = self.gather(region, idx)
+        hi = self.gather(region, np.minimum(idx + 1, length))
+        return lo + (hi - lo) * frac, pos + step * frames
+
+
+def bank_path(name, params):
+    key = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"instrument-{name}-{key}")
+
+
+def write_bank(path, regions):
+    """regions: (float samples, root frequency, sample rate); each is stored peak-normalized
+    to 0.75 with one zero frame after it"""
+    index = {"regions": []}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        start = 0
+        for samples, root, rate in regions:
+            peak = np.max(np.abs(samples)) or 1.0
+            pcm = np.clip(samples / peak * 0.75 * 32767, -32768, 32767).astype('<i2')
+            f.write(pcm.tobytes())
+            f.write(b'\0\0')
+            index["regions"].append({"start": start, "length": len(pcm), "root": root, "rate": rate})
+            start += len(pcm) + 1
+    with open(f"{tmp}.json", 'w') as f:
+        json.dump(index, f)
+    os.replace(f"{tmp}.json", f"{path}.json")
+    os.replace(tmp, f"{path}.pcm")
+    return index
+
+
+def open_bank(path, build):
+    """Index of the bank at path, building it with build() first if it is missing"""
+    try:
+        with open(f"{path}.json") as f:
+            index = json.load(f)
+        if os.path.exists(f"{path}.pcm"):
+            return index
+    except (OSError, ValueError):
+        pass
+    return write_bank(path, build())
+
+
+def load_builtin(instrument, sample_rate):
+    generator, roots, duration, _, _ = BUILTIN[instrument.name]
+    params = {"roots": list(roots), "duration": duration, "sample_rate": sample_rate, "version": GENERATOR_VERSION}
+
+    def build():
+        regions = []
+        for i, midi in enumerate(roots):
+            result = generator(midi, duration, sample_rate, seed=i)
+            samples, root = result if isinstance(result, tuple) else (result, midi_to_freq(midi))
+            regions.append((samples, root, sample_rate))
+        return regions
+    path = bank_path(instrument.name, params)
+    instrument.load(f"{path}.pcm", open_bank(path, build))
+
+
+def load_sfz(instrument, sfz):
+    params = {"sfz": os.path.abspath(sfz), "mtime": os.path.getmtime(sfz)}
+
+    def build():
+        regions = []
+        for sample, root in parse_sfz(sfz):
+            data, rate = read_wav(sample)
+            regions.append((data, root, rate))
+        if not regions:
+            raise ValueError(f"{sfz}: no regions")
+        return regions
+    path = bank_path(instrument.name, params)
+    instrument.load(f"{path}.pcm", open_bank(path, build))
+
+
+# Sampled instruments by name; each is usable once its available flag is set
+SAMPLED = {}
+
+
+def discover():
+    """Built-in generated instruments plus every .sfz in INSTRUMENTS_DIR, as name -> loader(instrument, sample_rate)"""
+    found = {name: load_builtin for name in BUILTIN}
+    try:
+        for entry in sorted(os.listdir(INSTRUMENTS_DIR)):
+            if entry.lower().endswith('.sfz'):
+                sfz = os.path.join(INSTRUMENTS_DIR, entry)
+                found[os.path.splitext(entry)[0]] = lambda instrument, sample_rate, sfz=sfz: load_sfz(instrument, sfz)
+    except OSError:
+        pass
+    return found
+
+
+def load_instruments(sample_rate, background=True):
+    """Register every sampled instrument and build or map their banks, by default off the calling thread"""
+    loaders = discover()
+    for name in loaders:
+        if name not in SAMPLED:
+            _, _, _, envelope, fallback = BUILTIN.get(name, (None, None, None, DEFAULT_ENVELOPE, 'sine'))
+            SAMPLED[name] = SampledInstrument(name, envelope, fallback)
+
+    def run():
+        for name, loader in loaders.items():
+            instrument = SAMPLED[name]
+            if instrument.loaded.is_set():
+                continue
+            try:
+                loader(instrument, sample_rate)
+            except Exception as e:
+                instrument.error = str(e)
+                print(f"Could not load instrument {name}: {e}")
+            instrument.loaded.set()
+    if background:
+        threading.Thread(target=run, daemon=True, name="sampler-load").start()
+    else:
+        run()
+
+
+def wait_ready(names=None, timeout=30.0):
+    """Block until the given (default: all) sampled instruments are loaded or failed"""
+    for name in names or list(SAMPLED):
+        instrument = SAMPLED.get(name)
+        if instrument is not None:
+            instrument.loaded.wait(timeout)
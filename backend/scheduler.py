@@ -0,0 +1,103 @@
+from collections import deque
+import numpy as np
+from drums import DRUMS
+from synth import NOTE_OFF, NOTE_ON
+
+DRUM = -1
+
+NOTE_LENGTH = 0.4     # seconds a played-back note holds when the recording has no release
+LOOKAHEAD = 2048      # frames between scheduling a timeline and its first event
+
+
+class Timeline:
+    """A recording flattened to events at absolute frame offsets from its start"""
+
+    def __init__(self, rows):
+        # Sort by frame, releases before presses on the same frame
+        rows.sort(key=lambda row: (row[0], row[1] != NOTE_OFF))
+        self.frames = np.array([row[0] for row in rows], dtype=np.int64)
+        self.events = [row[1:] for row in rows]
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def length(self):
+        return int(self.frames[-1]) if len(self.frames) else 0
+
+
+def compile_timeline(events, sounds, drum_bank, sample_rate):
+    """Turn recording events into a Timeline of note on/off and drum hits.
+
+    Note specs are resolved and drum variants loaded here, on the control side,
+    so the audio thread only has to walk the arrays.
+    """
+    rows = []
+    for event in events:
+        at = int(round(event["time"] * sample_rate))
+        for info in event.get("sounds", []):
+            sound = info.get("sound")
+            if info.get("type") == "drum":
+                if sound in DRUMS:
+                    velocity = info.get("velocity", 1.0)
+                    rows.append((at, DRUM, (drum_bank.hit(sound, velocity), info.get("finger")), 0.0, velocity))
+            elif info.get("type", "note") == "note":
+                end = at + max(int((info.get("duration") or NOTE_LENGTH) * sample_rate), 1)
+                for freq in sounds.compile(sound):
+                    key = ("playback", info.get("finger"), freq)
+                    rows.append((at, NOTE_ON, key, freq, info.get("velocity", 1.0)))
+                    rows.append((end, NOTE_OFF, key, 0.0, 0.0))
+    return Timeline(rows)
+
+
+class Scheduler:
+    """Feeds a Timeline to the audio callback at exact frame positions.
+
+    play()/stop() only append to a deque; the callback adopts the change at the top
+    of its next block and then pulls due events with a searchsorted on the frame array.
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.timeline = None
+        self.start = 0
+        self.cursor = 0
+        self.held = set()
+
+    def play(self, timeline, start_frame):
+        self.pending.append((timeline, start_frame))
+
+    def stop(self):
+        self.pending.append(None)
+
+    @property
+    def playing(self):
+        return self.timeline is not None
+
+    def due(self, clock, frames):
+        """(offset in block, kind, payload, freq, gain) for every event in [clock, clock + frames)"""
+        due = []
+        while self.pending:
+            item = self.pending.popleft()
+            # Release anything the previous timeline left sounding
+            due.extend((0, NOTE_OFF, key, 0.0, 0.0) for key in self.held)
+            self.held.clear()
+            self.timeline, self.start = item if item else (None, 0)
+            self.cursor = 0
+
+        timeline = self.timeline
+        if timeline is None:
+            return due
+        end = np.searchsorted(timeline.frames, clock + frames - self.start, side='left')
+        for i in range(self.cursor, end):
+            kind, payload, freq, gain = timeline.events[i]
+            offset = max(int(timeline.frames[i]) + self.start - clock, 0)
+            if kind == NOTE_ON:
+                self.held.add(payload)
+            elif kind == NOTE_OFF:
+                self.held.discard(payload)
+            due.append((offset, kind, payload, freq, gain))
+        self.cursor = end
+        if end >= len(timeline):
+            self.timeline = None
+        return due
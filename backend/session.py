@@ -0,0 +1,879 @@
+import asyncio
+import copy
+import glob
+import os
+import platform
+import re
+import threading
+import time
+from collections import deque
+import numpy as np
+from synth import VoicePool
+from frames import FRAME_SIZE, FrameDecoder
+from bridge import EventBridge
+from filters import FingerDetector
+from drums import DRUMS, DrumBank, DrumMixer
+from sounds import EMPTY, SoundRegistry
+from scheduler import DRUM, LOOKAHEAD, Scheduler, compile_timeline
+from recorder import RecordingWriter, new_recording_path, open_recording
+from sim import open_output, open_port
+from metrics import Metrics
+from protocol import DropBatcher
+from analytics import SessionAnalytics
+from store import get_store
+from effects import OVERLOAD_BLOCKS, EffectsChain, key_pan
+from tuner import AUTO_TUNE, TUNE_INTERVAL, AudioTuner
+from sampler import load_instruments
+from songs import SongMatcher, get_library, song_from_sequence
+from modulation import FRAME_RATE, ForceModulator
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+# Shared by every session: variants are read-only once built
+drum_bank = DrumBank(SAMPLE_RATE)
+drum_bank.preload(DRUMS)
+load_instruments(SAMPLE_RATE)
+get_library()
+
+PRESETS = {
+    'therapy': {'name': '🧘 Therapy', 'instrument': 'pad', 'reverb': {'ir': 'hall', 'wet': 0.35}, 'mapping': {'thumb': 'C_maj', 'index': 'F_maj', 'middle': 'G_maj', 'ring': 'Am', 'pinky': 'Em'}},
+    'piano': {'name': '🎹 Piano', 'instrument': 'piano', 'reverb': {'ir': 'room', 'wet': 0.2}, 'mapping': {'thumb': 'C', 'index': 'D', 'middle': 'E', 'ring': 'F', 'pinky': 'G'}},
+    'chords': {'name': '🎸 Chords', 'instrument': 'guitar', 'reverb': {'ir': 'room', 'wet': 0.25}, 'mapping': {'thumb': 'C_maj', 'index': 'D_maj', 'middle': 'E_maj', 'ring': 'G_maj', 'pinky': 'A_maj'}},
+    'drums': {'name': '🥁 Drums', 'instrument': 'drums', 'reverb': {'ir': 'room', 'wet': 0.1}, 'mapping': {'thumb': 'kick', 'index': 'snare', 'middle': 'hihat', 'ring': 'tom', 'pinky': 'clap'}},
+    'custom': {'name': '✏️ Custom', 'instrument': 'sine', 'reverb': {'ir': 'room', 'wet': 0.15}, 'mapping': {'thumb': 'C', 'index': 'D', 'middle': 'E', 'ring': 'F', 'pinky': 'G'}},
+}
+
+TUTORIALS = {
+    'scale': {'name': 'Simple Scale', 'difficulty': 'Beginner', 'sequence': ['thumb', 'index', 'middle', 'ring', 'pinky', 'pinky', 'ring', 'middle', 'index', 'thumb']},
+    'hotcross': {'name': 'Hot Cross Buns', 'difficulty': 'Beginner', 'sequence': ['middle', 'index', 'thumb', 'middle', 'index', 'thumb', 'thumb', 'thumb', 'thumb', 'thumb', 'index', 'index', 'index', 'index', 'middle', 'index', 'thumb']},
+    'rain': {'name': 'Rain Rain Go Away', 'difficulty': 'Beginner', 'sequence': ['middle', 'thumb', 'middle', 'middle', 'thumb', 'middle', 'middle', 'thumb', 'middle', 'ring', 'middle', 'index', 'thumb']},
+    'mary': {'name': 'Mary Had a Little Lamb', 'difficulty': 'Easy', 'sequence': ['middle', 'index', 'thumb', 'index', 'middle', 'middle', 'middle', 'index', 'index', 'index', 'middle', 'pinky', 'pinky', 'middle', 'index', 'thumb', 'index', 'middle', 'middle', 'middle', 'middle', 'index', 'index', 'middle', 'index', 'thumb']},
+    'happy': {'name': 'Happy Birthday', 'difficulty': 'Easy', 'sequence': ['thumb', 'thumb', 'index', 'thumb', 'ring', 'middle', 'thumb', 'thumb', 'index', 'thumb', 'pinky', 'ring', 'thumb', 'thumb', 'thumb', 'middle', 'ring', 'middle', 'index']},
+    'london': {'name': 'London Bridge', 'difficulty': 'Easy', 'sequence': ['pinky', 'ring', 'middle', 'ring', 'pinky', 'pinky', 'pinky', 'ring', 'ring', 'ring', 'pinky', 'pinky', 'pinky', 'pinky', 'ring', 'middle', 'ring', 'pinky', 'pinky', 'pinky', 'ring', 'ring', 'pinky', 'ring', 'middle']},
+    'twinkle': {'name': 'Twinkle Twinkle Little Star', 'difficulty': 'Easy', 'sequence': ['thumb', 'thumb', 'pinky', 'pinky', 'pinky', 'pinky', 'pinky', 'ring', 'ring', 'middle', 'middle', 'index', 'index', 'thumb', 'pinky', 'pinky', 'ring', 'ring', 'middle', 'middle', 'index', 'pinky', 'pinky', 'ring', 'ring', 'middle', 'middle', 'index', 'thumb', 'thumb', 'pinky', 'pinky', 'pinky', 'pinky', 'pinky', 'ring', 'ring', 'middle', 'middle', 'index', 'index', 'thumb']},
+    'brother': {'name': 'Are You Sleeping (Frère Jacques)', 'difficulty': 'Medium', 'sequence': ['thumb', 'index', 'middle', 'thumb', 'thumb', 'index', 'middle', 'thumb', 'middle', 'ring', 'pinky', 'middle', 'ring', 'pinky', 'pinky', 'ring', 'middle', 'thumb', 'pinky', 'ring', 'middle', 'thumb', 'thumb', 'pinky', 'thumb', 'thumb', 'pinky', 'thumb']},
+    'jingle': {'name': 'Jingle Bells (Chorus)', 'difficulty': 'Medium', 'sequence': ['middle', 'middle', 'middle', 'middle', 'middle', 'middle', 'middle', 'pinky', 'thumb', 'index', 'middle', 'ring', 'ring', 'ring', 'ring', 'ring', 'middle', 'middle', 'middle', 'middle', 'index', 'index', 'middle', 'index', 'pinky']},
+    'ode': {'name': 'Ode to Joy', 'difficulty': 'Medium', 'sequence': ['middle', 'middle', 'ring', 'pinky', 'pinky', 'ring', 'middle', 'index', 'thumb', 'thumb', 'index', 'middle', 'middle', 'index', 'index', 'middle', 'middle', 'ring', 'pinky', 'pinky', 'ring', 'middle', 'index', 'thumb', 'thumb', 'index', 'middle', 'index', 'thumb', 'thumb']},
+    'rowboat': {'name': 'Row Row Row Your Boat', 'difficulty': 'Medium', 'sequence': ['thumb', 'thumb', 'thumb', 'index', 'middle', 'middle', 'index', 'middle', 'ring', 'pinky', 'pinky', 'pinky', 'pinky', 'middle', 'middle', 'middle', 'thumb', 'thumb', 'thumb', 'pinky', 'ring', 'middle', 'index', 'thumb']},
+    'entertainer': {'name': 'The Entertainer (Intro)', 'difficulty': 'Hard', 'sequence': ['index', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'middle', 'index', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'pinky', 'ring', 'middle', 'ring', 'middle', 'index', 'thumb', 'index', 'middle', 'middle', 'ring', 'pinky', 'ring', 'middle', 'index', 'thumb', 'index']},
+    'minuet': {'name': 'Minuet in G (Simplified)', 'difficulty': 'Hard', 'sequence': ['pinky', 'index', 'middle', 'ring', 'pinky', 'pinky', 'thumb', 'middle', 'index', 'middle', 'ring', 'middle', 'index', 'thumb', 'index', 'thumb', 'index', 'middle', 'ring', 'middle', 'pinky', 'index', 'middle', 'ring', 'pinky', 'pinky', 'thumb', 'ring', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'pinky']},
+    'furelise': {'name': 'Für Elise (Theme)', 'difficulty': 'Hard', 'sequence': ['middle', 'index', 'middle', 'index', 'middle', 'thumb', 'index', 'thumb', 'thumb', 'middle', 'thumb', 'middle', 'index', 'middle', 'index', 'middle', 'middle', 'index', 'middle', 'index', 'middle', 'thumb', 'index', 'thumb', 'thumb', 'middle', 'index', 'thumb', 'thumb']},
+    'cancan': {'name': 'Can-Can (Fast)', 'difficulty': 'Hard', 'sequence': ['thumb', 'thumb', 'index', 'index', 'middle', 'middle', 'ring', 'ring', 'pinky', 'ring', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'pinky', 'pinky', 'ring', 'ring', 'middle', 'middle', 'index', 'index', 'thumb', 'index', 'middle', 'ring', 'pinky', 'ring', 'middle', 'index', 'thumb', 'thumb', 'middle', 'middle', 'pinky', 'middle', 'thumb', 'middle', 'pinky']},
+    'flight': {'name': 'Flight of the Bumblebee (Mini)', 'difficulty': 'Hard', 'sequence': ['thumb', 'index', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'pinky', 'ring', 'middle', 'ring', 'pinky', 'ring', 'middle', 'index', 'thumb', 'index', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'middle', 'index', 'thumb', 'index', 'middle', 'ring', 'pinky', 'ring', 'middle', 'index', 'thumb']},
+}
+
+# The built-in tutorials as untimed songs, so one matcher scores them and the library alike
+TUTORIAL_SONGS = {k: song_from_sequence(k, v['name'], v['sequence'], v['difficulty']) for k, v in TUTORIALS.items()}
+
+FINGERS = {
+    'thumb': {'idx': 1, 'range': 139000},
+    'index': {'idx': 5, 'range': 140000},
+    'middle': {'idx': 4, 'range': 139000},
+    'ring': {'idx': 3, 'range': 184000},
+    'pinky': {'idx': 6, 'range': 168000},
+}
+
+FINGER_INDEX = {name: i for i, name in enumerate(FINGERS)}
+
+THRESHOLD_ON = 2.5
+THRESHOLD_OFF = 2.0
+FILTER_SIZE = 5  # Number of frames to average
+TUTORIAL_RELEASE_THRESHOLD = 0.08
+CALIBRATION_TIMEOUT = 2.0
+IO_MODE = os.environ.get("RIPPLE_IO", "thread")
+ASYNC_READ_SIZE = 1024  # bytes per event-loop read (~25 frames), so a backlog cannot hold the loop
+
+def finger_source(key):
+    """Control column of the live finger holding a voice key such as (finger, freq); playback has none"""
+    if isinstance(key, tuple) and key:
+        return FINGER_INDEX.get(key[0], -1)
+    return -1
+
+
+def find_ports():
+    if platform.system() == 'Darwin':
+        return glob.glob('/dev/tty.usb*') + glob.glob('/dev/cu.usb*') + glob.glob('/dev/tty.SLAB*')
+    return glob.glob('/dev/ttyUSB*') + glob.glob('/dev/ttyACM*')
+
+
+class Session:
+    """One glove and one audio output: its own reader thread, calibration, filters,
+    voices, tutorial progress, recording and set of WebSocket clients."""
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.last_seen = time.monotonic()
+        self.state = {
+            "connected": False,
+            "calibrated": False,
+            "active_fingers": [],
+            "current_preset": "piano",
+            "threshold_on": THRESHOLD_ON,
+            "threshold_off": THRESHOLD_OFF,
+            "mode": "play",
+            "tutorial": {"current": None, "step": 0, "completed": False},
+            "recording": False,
+            "playing_back": False,
+            "filter": "moving_average",
+            "tuning": "equal",
+            "patient": None,
+            "audio": None,
+            "modulation": True,
+        }
+        self.presets = copy.deepcopy(PRESETS)
+        self.custom_types = {'thumb': 'note', 'index': 'note', 'middle': 'note', 'ring': 'note', 'pinky': 'note'}
+        self.custom_instrument = 'sine'
+
+        # Preset -> finger -> frozen frequency array, rebuilt whenever a mapping or tuning changes
+        self.sounds = SoundRegistry()
+        self.compiled_mappings = {}
+        self.compile_presets()
+
+        self.rest = {}
+        self.noise = {}
+        self.ser = None
+        self.reader = None
+        # "thread": blocking reads on a reader thread; "async": the event loop watches the port's fd
+        self.io_mode = IO_MODE
+        self.reader_loop = None
+        self.reader_fd = None
+        self.port = None
+        self.stream = None
+        self.device = None
+        self.tuner = None
+        self.tuner_task = None
+        self.active = set()
+        self.last_active = set()
+        self.running = False
+        self.decoder = None
+        self.metrics = Metrics()
+        # perf_counter time the current batch of frames came off the port, and those of
+        # presses the audio callback has not rendered yet
+        self.frame_arrival = 0.0
+        self.press_stamps = deque()
+        self.bridge = EventBridge(latency=self.metrics["frame_to_ui"])
+        self.drop_batcher = DropBatcher(len(FINGERS))
+        self.analytics = SessionAnalytics(FINGERS)
+        # Row in the persistent store for the current connect..disconnect span
+        self.store_id = None
+        self.tutorial_started = 0.0
+        self.tutorial_baseline = (0, 0)
+
+        # Filter and hysteresis state for all fingers at once
+        self.detector = FingerDetector(FINGERS, THRESHOLD_ON, THRESHOLD_OFF, self.state["filter"], size=FILTER_SIZE)
+        self.tutorial_ready = set(FINGERS)
+        self.matcher = None
+
+        self.recorder = None
+        self.recording_start_time = 0
+
+        self.voices = VoicePool(SAMPLE_RATE, pan=key_pan, source=finger_source)
+        # Continuous force -> velocity, volume and brightness of the voices each finger holds
+        self.modulator = ForceModulator(FINGERS)
+        self.held_notes = set()  # (finger, freq) keys with a voice held on
+        # update_sound runs on the sensor thread and on the event loop; never taken on the audio thread
+        self.sound_lock = threading.RLock()
+        self.drum_mixer = DrumMixer(drum_bank)
+        self.effects = EffectsChain(SAMPLE_RATE, CHANNELS)
+
+        # Frames rendered so far; scheduled playback events are placed on this clock
+        self.frame_clock = 0
+        self.scheduler = Scheduler()
+        self.playback_instrument = None
+        self.playback_preset = None
+        self.playback_reverb = None
+        self.playback_stop = asyncio.Event()
+
+    def compile_preset(self, name):
+        types = self.custom_types if name == "custom" else None
+        self.compiled_mappings[name] = self.sounds.compile_mapping(self.presets[name]["mapping"], types)
+
+    def compile_presets(self):
+        for name in self.presets:
+            self.compile_preset(name)
+
+    def synth_name(self):
+        preset = self.presets[self.state["current_preset"]]
+        return preset["instrument"] if self.state["current_preset"] != "custom" else self.custom_instrument
+
+    def audio_callback(self, outdata, frames, time_info, status):
+        began = time.perf_counter()
+        metrics = self.metrics
+        underflow = bool(status and status.output_underflow)
+        if underflow:
+            metrics.counters["underruns"] += 1
+        if self.press_stamps:
+            # When the device reports it, count the time until this block reaches the DAC
+            try:
+                output_latency = max(time_info.outputBufferDacTime - time_info.currentTime, 0.0)
+            except:
+                output_latency = 0.0
+            to_audio = metrics["frame_to_audio"]
+            while self.press_stamps:
+                to_audio.record(began - self.press_stamps.popleft() + output_latency)
+
+        wave = np.zeros((frames, CHANNELS), dtype=np.float32)
+        instrument = self.playback_instrument or self.synth_name()
+
+        # Split the block at every scheduled event so each lands on its exact frame
+        pos = 0
+        for offset, kind, payload, freq, gain in self.scheduler.due(self.frame_clock, frames):
+            if offset > pos:
+                self.render(wave[pos:offset], instrument)
+                pos = offset
+            if kind == DRUM:
+                sample_id, finger = payload
+                self.drum_mixer.start(sample_id, gain, key_pan(finger))
+            else:
+                self.voices.apply(kind, payload, freq, gain)
+        if pos < frames:
+            self.render(wave[pos:], instrument)
+        self.frame_clock += frames
+
+        # Reverb send and lookahead limiter in place of a hard clip
+        self.effects.set_reverb(*self.reverb_setting())
+        metrics["effects"].record(self.effects.process(wave))
+        outdata[:] = wave
+
+        elapsed = time.perf_counter() - began
+        metrics["callback"].record(elapsed)
+        metrics.counters["callbacks"] += 1
+        if elapsed > frames / SAMPLE_RATE:
+            metrics.counters["deadline_misses"] += 1
+        tuner = self.tuner
+        if tuner is not None:
+            tuner.observe(elapsed, underflow)
+
+    def render(self, wave, instrument):
+        self.voices.render(wave, instrument)
+        self.drum_mixer.mix(wave)
+
+    def reverb_setting(self):
+        """(impulse response name or None, wet gain) of the recording or preset being heard"""
+        reverb = self.playback_reverb
+        if reverb is None:
+            preset = self.presets.get(self.playback_preset or self.state["current_preset"])
+            reverb = preset.get("reverb") if preset else None
+        if not reverb:
+            return None, 0.0
+        return reverb.get("ir"), reverb.get("wet", 0.0)
+
+    def sound_settings(self):
+        """What shapes the sound beyond the recorded specs, so a recording can be heard as it was played"""
+        reverb_ir, reverb_wet = self.reverb_setting()
+        return {
+            "instrument": self.synth_name(),
+            "tuning": self.sounds.tuning,
+            "a4": self.sounds.a4,
+            "reverb": {"ir": reverb_ir, "wet": reverb_wet},
+        }
+
+    def start_playback(self, recording):
+        """Schedule a recording on the audio clock; returns its Timeline and the start delay in seconds.
+        The recording's "sound" settings, when it has them, win over the preset's."""
+        preset_name = recording.get("preset")
+        preset = self.presets.get(preset_name)
+        sound = recording.get("sound") or {}
+        instrument = sound.get("instrument")
+        if instrument is None and preset:
+            instrument = self.custom_instrument if preset_name == "custom" else preset["instrument"]
+        self.playback_instrument = instrument if instrument != "drums" else None
+        self.playback_preset = preset_name if preset else None
+        self.playback_reverb = sound.get("reverb")
+
+        sounds = self.sounds
+        if "tuning" in sound and (sound["tuning"], sound.get("a4", sounds.a4)) != (sounds.tuning, sounds.a4):
+            # Resolve the specs in the recorded tuning without retuning the live session
+            sounds = SoundRegistry()
+            sounds.set_tuning(sound["tuning"], sound.get("a4"))
+        timeline = compile_timeline(recording.get("events", []), sounds, drum_bank, SAMPLE_RATE)
+        self.playback_stop.clear()
+        self.scheduler.play(timeline, self.frame_clock + LOOKAHEAD)
+        self.state["playing_back"] = True
+        return timeline, LOOKAHEAD / SAMPLE_RATE
+
+    def stop_playback(self):
+        self.scheduler.stop()
+        self.playback_instrument = None
+        self.playback_preset = None
+        self.playback_reverb = None
+        self.state["playing_back"] = False
+        self.playback_stop.set()
+
+    def play_drum(self, drum_type, velocity=1.0, finger=None):
+        if drum_type in DRUMS:
+            self.drum_mixer.trigger(drum_bank.hit(drum_type, velocity), velocity, key_pan(finger))
+
+    def play_drums(self, fingers):
+        state = self.state
+        preset = self.presets[state["current_preset"]]
+        is_drum_preset = preset["instrument"] == "drums"
+        for f in fingers:
+            sound = preset["mapping"].get(f)
+            if is_drum_preset and sound in DRUMS:
+                self.play_drum(sound, self.velocity(f), finger=f)
+            elif state["current_preset"] == "custom" and self.custom_types.get(f) == "drum":
+                if sound in DRUMS:
+                    self.play_drum(sound, self.velocity(f), finger=f)
+
+    def velocity(self, finger):
+        """Gain for a note the finger just started, from how hard it struck"""
+        if not self.state["modulation"] or finger not in FINGER_INDEX:
+            return 1.0
+        return float(self.modulator.velocity[FINGER_INDEX[finger]])
+
+    def set_thresholds(self, threshold_on, threshold_off=None):
+        """Press/release drops (in units of each finger's range); release keeps the default ratio unless given"""
+        threshold_on = float(threshold_on)
+        if threshold_off is None:
+            threshold_off = threshold_on * THRESHOLD_OFF / THRESHOLD_ON
+        threshold_off = float(threshold_off)
+        if not (0 < threshold_off < threshold_on < float('inf')):
+            raise ValueError("Thresholds need 0 < threshold_off < threshold_on")
+        self.detector.set_thresholds(threshold_on, threshold_off)
+        self.state["threshold_on"] = threshold_on
+        self.state["threshold_off"] = threshold_off
+
+    def set_modulation(self, enabled):
+        self.state["modulation"] = bool(enabled)
+        if not enabled:
+            self.voices.set_controls(None)
+
+    def update_sound(self, fingers, trigger_drums=True):
+        """Hold a voice for every note of the given fingers and release all others"""
+        began = time.perf_counter()
+        with self.sound_lock:
+            preset = self.presets[self.state["current_preset"]]
+            is_drum_preset = preset["instrument"] == "drums"
+
+            if trigger_drums:
+                self.play_drums(fingers)
+
+            wanted = set()
+            if not is_drum_preset:
+                mapping = self.compiled_mappings[self.state["current_preset"]]
+                for f in fingers:
+                    wanted.update((f, freq) for freq in mapping.get(f, EMPTY))
+
+            for key in self.held_notes - wanted:
+                self.voices.note_off(key)
+            for key in wanted - self.held_notes:
+                self.voices.note_on(key, key[1], self.velocity(key[0]))
+            self.held_notes = wanted
+        self.metrics["update_sound"].record(time.perf_counter() - began)
+
+    def refresh_sound(self):
+        """Re-hold what the glove is pressing now, after the preset, mapping or tuning changed.
+        For the event loop: the sensor thread cannot swap the fingers in between."""
+        with self.sound_lock:
+            self.update_sound(self.active, trigger_drums=False)
+
+    def broadcast(self, msg, stamp=None):
+        """Queue a message for every client of this session; safe from the sensor thread"""
+        self.bridge.publish(msg, stamp)
+
+    def set_patient(self, patient):
+        self.state["patient"] = patient
+        if self.store_id:
+            get_store().set_patient(self.store_id, patient)
+
+    def begin_tutorial(self, tutorial_id):
+        """Start (or restart) a built-in tutorial or library song from its first step;
+        returns the Song, or None if there is no such tutorial"""
+        song = TUTORIAL_SONGS.get(tutorial_id) or get_library().load(tutorial_id)
+        if song is None or not len(song):
+            return None
+        self.end_tutorial()
+        state = self.state
+        state["mode"] = "tutorial"
+        state["tutorial"] = {"current": tutorial_id, "step": 0, "completed": False}
+        self.tutorial_ready = set(FINGERS)
+        self.tutorial_started = time.time()
+        self.tutorial_baseline = (self.analytics.correct, self.analytics.errors)
+        self.matcher = SongMatcher(song)
+        self.analytics.prompt(song.fingers(0), time.perf_counter())
+        return song
+
+    def end_tutorial(self):
+        """Store the attempt in progress, if it got anywhere; safe from the sensor thread"""
+        tutorial = self.state["tutorial"]
+        if not tutorial["current"] or not self.tutorial_started:
+            return
+        analytics = self.analytics
+        correct, errors = self.tutorial_baseline
+        if tutorial["step"] or analytics.errors > errors:
+            get_store().save_tutorial(self.store_id, self.state["patient"], tutorial["current"], self.tutorial_started,
+                                      tutorial["completed"], analytics.correct - correct, analytics.errors - errors,
+                                      dict(analytics.snapshot(), song=self.matcher.snapshot()))
+        self.tutorial_started = 0.0
+        analytics.end_prompts()
+
+    def check_tutorial_progress(self, finger, is_pressed):
+        state = self.state
+        matcher = self.matcher
+        if state["mode"] != "tutorial" or not state["tutorial"]["current"] or matcher is None or matcher.done:
+            return
+        if not is_pressed or finger not in self.tutorial_ready:
+            return
+
+        t = self.frame_arrival
+        self.analytics.tutorial_press(finger, t)
+        result = matcher.press(finger, t)
+        if result is False:
+            return
+        self.tutorial_ready.discard(finger)
+        if result is None:
+            # First fingers of a chord; the step completes with its last one
+            return
+
+        song = matcher.song
+        state["tutorial"]["step"] = matcher.step
+        if matcher.done:
+            state["tutorial"]["completed"] = True
+            self.end_tutorial()
+            self.broadcast({"type": "tutorial_complete", "tutorial": state["tutorial"]["current"], "score": matcher.snapshot()})
+        else:
+            fingers = song.fingers(matcher.step)
+            self.analytics.prompt(fingers, t)
+            self.broadcast({
+                "type": "tutorial_progress",
+                "step": matcher.step,
+                "next_finger": fingers[0],
+                "next_fingers": fingers,
+                "total": len(song),
+                "deviation_ms": matcher.deviation * 1000 if matcher.deviation is not None else None,
+            })
+
+    def start_recording(self):
+        self.stop_recording()
+        self.recording_start_time = time.time()
+        self.recorder = RecordingWriter(
+            new_recording_path(self.id),
+            meta={
+                "session": self.id,
+                "started": self.recording_start_time,
+                "preset": self.state["current_preset"],
+                "rest": dict(self.rest),
+                "fingers": FINGERS,
+                "mapping": self.presets[self.state["current_preset"]]["mapping"],
+                "sound": self.sound_settings(),
+            },
+            fingers=list(FINGERS),
+        )
+        self.state["recording"] = True
+
+    def stop_recording(self):
+        """Close the current recording file; returns the legacy JSON summary of it, or None"""
+        self.state["recording"] = False
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return None
+        duration = time.time() - self.recording_start_time if self.recording_start_time > 0 else 0
+        analytics = self.analytics.snapshot()
+        recorder.close(duration=duration, analytics=analytics)
+        recording = {
+            "id": os.path.basename(recorder.path),
+            "events": open_recording(recorder.path).events_json(),
+            "preset": self.state["current_preset"],
+            "sound": recorder.meta.get("sound"),
+            "duration": duration,
+        }
+        get_store().save_recording(self.store_id, self.state["patient"], recording["id"], recorder.path,
+                                   self.recording_start_time, duration, recording["preset"], len(recording["events"]), analytics)
+        return recording
+
+    def record_event(self, fingers, newly_pressed, newly_released=()):
+        state = self.state
+        recorder = self.recorder
+        if recorder is None:
+            return
+        timestamp = time.time() - self.recording_start_time
+        preset_name = state["current_preset"]
+        preset = self.presets[preset_name]
+
+        for f in newly_pressed:
+            sound = preset["mapping"].get(f)
+            sound_type = 'drum' if preset["instrument"] == "drums" else 'note'
+            if preset_name == "custom":
+                sound_type = self.custom_types.get(f, 'note')
+            recorder.write_event(timestamp, f, True, sound, sound_type, preset_name)
+        for f in newly_released:
+            recorder.write_event(timestamp, f, False, preset=preset_name)
+
+    def process_frame(self, v):
+        state = self.state
+        detector = self.detector
+        previous, new_mask = detector.update(v)
+        if new_mask.any():
+            self.analytics.observe(new_mask, detector.drop)
+        controls = self.modulator.update(detector.drop, detector.on, previous, new_mask)
+        if controls is not None and state["modulation"]:
+            self.voices.set_controls(controls)
+
+        if self.bridge.drop_clients:
+            batch = self.drop_batcher.add(detector.drop)
+            if batch:
+                self.broadcast({"type": "drops", "first": batch[0], "drops": batch[1]})
+
+        if state["mode"] == "tutorial":
+            idle = ~previous
+            released = idle & (detector.drop < TUTORIAL_RELEASE_THRESHOLD)
+            if released.any():
+                self.tutorial_ready.update(detector.fingers(released))
+            pressed = idle & (detector.drop > detector.on)
+            if pressed.any():
+                for name in detector.fingers(pressed):
+                    if name in self.tutorial_ready:
+                        self.check_tutorial_progress(name, True)
+
+        if (new_mask != previous).any():
+            arrival = self.frame_arrival
+            metrics = self.metrics
+            metrics["frame_to_threshold"].record(time.perf_counter() - arrival)
+            new_active = detector.fingers(new_mask)
+            newly_pressed = new_active - self.active
+            newly_released = self.active - new_active
+            analytics = self.analytics
+            for f in newly_released:
+                analytics.release(f, arrival)
+            for f in newly_pressed:
+                analytics.press(f, arrival)
+
+            if state["recording"]:
+                self.record_event(new_active, newly_pressed, newly_released)
+
+            with self.sound_lock:
+                self.last_active = self.active.copy()
+                self.active = new_active
+                state["active_fingers"] = list(new_active)
+
+                if newly_pressed:
+                    self.play_drums(newly_pressed)
+                self.update_sound(new_active, trigger_drums=False)
+            metrics["frame_to_update"].record(time.perf_counter() - arrival)
+            if newly_pressed:
+                self.press_stamps.append(arrival)
+
+            self.broadcast({"type": "fingers", "active": list(new_active)}, arrival)
+
+    def receive(self, n):
+        """Decode n bytes just written into the decoder's buffer and run every complete frame"""
+        metrics = self.metrics
+        arrival = self.frame_arrival = time.perf_counter()
+        decoder = self.decoder
+        decoder.commit(n)
+        frames = decoder.decode()
+        metrics.counters["frames"] += len(frames)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write_frames(time.time() - self.recording_start_time, frames)
+        for v in frames:
+            self.process_frame(v)
+        metrics["read"].record(time.perf_counter() - arrival)
+
+    def read_loop(self):
+        self.running = True
+        ser = self.ser
+        decoder = self.decoder = FrameDecoder()
+        if ser and ser.is_open:
+            ser.reset_input_buffer()
+
+        self.detector.reset()
+        self.modulator.reset()
+
+        while self.running and self.state["connected"]:
+            try:
+                # Block (up to the port timeout) for the first byte, then drain whatever has arrived
+                n = ser.readinto(decoder.space()[:max(ser.in_waiting, 1)])
+                if n:
+                    self.receive(n)
+            except:
+                if not (ser and ser.is_open):
+                    break
+
+    def on_readable(self):
+        """Event-loop reader: called by the loop whenever the port's fd has bytes"""
+        try:
+            n = os.readv(self.reader_fd, [self.decoder.space()[:ASYNC_READ_SIZE]])
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Device read failed ({self.id}): {e}")
+            self.stop_reader()
+            return
+        if not n:
+            # EOF: the device went away
+            self.stop_reader()
+            return
+        try:
+            self.receive(n)
+        except Exception as e:
+            print(f"Frame processing failed ({self.id}): {e}")
+
+    def start_reader(self):
+        if self.io_mode == "async" and self.start_async_reader():
+            return
+        if self.reader and self.reader.is_alive():
+            return
+        self.reader = threading.Thread(target=self.read_loop, daemon=True, name=f"reader-{self.id}")
+        self.reader.start()
+
+    def start_async_reader(self):
+        """Deliver bytes through loop.add_reader on the port's fd instead of a reader thread.
+        Returns False when there is no running loop or the port has no fd to watch."""
+        if self.reader_fd is not None:
+            return True
+        try:
+            loop = asyncio.get_running_loop()
+            fd = self.ser.fileno()
+        except (RuntimeError, AttributeError, OSError):
+            return False
+        self.ser.reset_input_buffer()
+        os.set_blocking(fd, False)
+        self.decoder = FrameDecoder()
+        self.detector.reset()
+        self.modulator.reset()
+        self.running = True
+        self.reader_loop = loop
+        self.reader_fd = fd
+        loop.add_reader(fd, self.on_readable)
+        return True
+
+    def stop_reader(self):
+        self.running = False
+        if self.reader_fd is not None:
+            try:
+                self.reader_loop.remove_reader(self.reader_fd)
+            except:
+                pass
+            self.reader_fd = None
+            self.reader_loop = None
+
+    def connect(self, port=None, device=None, io_mode=None):
+        if io_mode:
+            self.io_mode = io_mode
+        if port is None:
+            taken = {s.port for s in sessions.values() if s is not self}
+            ports = [p for p in find_ports() if p not in taken]
+            if not ports:
+                raise Exception("No USB device found. Please connect the DexUMI.")
+            port = ports[0]
+            print(f"Found serial port: {port}")
+
+        self.ser = open_port(port, FINGERS, 921600, timeout=0.01)
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+        self.port = port
+        # Velocity is a drop per second: measure it at the rate this port delivers frames
+        self.modulator = ForceModulator(FINGERS, getattr(self.ser, "rate", FRAME_RATE))
+
+        self.device = device
+        self.tuner = AudioTuner(SAMPLE_RATE)
+        self.open_stream()
+        self.state["connected"] = True
+        self.store_id = get_store().open_session(self.id, self.state["patient"], port, device)
+        try:
+            self.tuner_task = asyncio.get_running_loop().create_task(self.tune())
+        except RuntimeError:
+            pass  # no event loop (scripts): keep the default block size
+
+    def open_stream(self):
+        """(Re)open the output with the tuner's block size and device latency"""
+        old, self.stream = self.stream, None
+        if old:
+            try:
+                old.stop()
+                old.close()
+            except:
+                pass
+        tuner = self.tuner
+        stream = open_output(
+            self.device,
+            samplerate=SAMPLE_RATE,
+            channels=CHANNELS,
+            blocksize=tuner.blocksize,
+            latency=tuner.latency,
+            callback=self.audio_callback
+        )
+        stream.start()
+        self.stream = stream
+        tuner.restart()
+        self.state["audio"] = self.audio_settings()
+
+    def audio_settings(self):
+        settings = self.tuner.snapshot()
+        settings["reverb_bypassed"] = self.effects.bypassed
+        try:
+            settings["output_latency_ms"] = float(self.stream.latency) * 1000
+        except:
+            settings["output_latency_ms"] = None
+        return settings
+
+    async def tune(self):
+        """While connected: re-pick the block size (a change reopens the stream) and
+        report what the audio thread could not, such as the reverb being bypassed"""
+        try:
+            while self.stream:
+                await asyncio.sleep(TUNE_INTERVAL)
+                tuner = self.tuner
+                if not self.stream or tuner is None:
+                    return
+                phase = tuner.phase
+                effects = self.effects
+                if effects.bypassed != self.state["audio"].get("reverb_bypassed"):
+                    if effects.bypassed:
+                        print(f"Effects ({self.id}) over budget for {OVERLOAD_BLOCKS} blocks "
+                              f"({effects.cpu:.0%} of a block): reverb bypassed for {effects.retry:.0f}s")
+                    else:
+                        print(f"Effects ({self.id}): reverb back on")
+                    self.state["audio"] = self.audio_settings()
+                elif AUTO_TUNE and tuner.decide() is not None:
+                    print(f"Audio ({self.id}): {tuner.blocksize} frames, latency {tuner.latency} "
+                          f"(render p99 {tuner.cost * 1000:.2f}ms)")
+                    self.open_stream()
+                elif tuner.phase != phase:
+                    self.state["audio"] = self.audio_settings()
+                else:
+                    continue
+                self.broadcast({"type": "status", "connected": True, "audio": self.state["audio"]})
+        except asyncio.CancelledError:
+            pass
+
+    async def calibrate(self, timeout=CALIBRATION_TIMEOUT):
+        """Baseline from the live frame stream: the reader thread collects it, nothing blocks the loop"""
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def resolve(result):
+            # A timed-out wait already cancelled the future
+            if not done.done():
+                done.set_result(result)
+
+        def finished(rest, noise):
+            loop.call_soon_threadsafe(resolve, (rest, noise))
+
+        self.state["calibrated"] = False
+        self.detector.start_calibration(done=finished)
+        self.start_reader()
+        try:
+            rest, noise = await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            self.detector.cancel_calibration()
+            raise Exception("Calibration timed out: no frames from the device")
+
+        self.rest = rest
+        self.noise = noise
+        self.state["calibrated"] = True
+        get_store().save_calibration(self.store_id, self.state["patient"], rest, noise)
+        print(f"Calibration complete ({self.id}): {self.rest}")
+
+    def disconnect(self):
+        self.stop_reader()
+        if self.tuner_task:
+            self.tuner_task.cancel()
+            self.tuner_task = None
+        time.sleep(0.1)
+
+        self.voices.reset()
+        self.drum_mixer.reset()
+        self.held_notes = set()
+
+        if self.stream:
+            try:
+                self.stream.stop()
+                self.stream.close()
+            except:
+                pass
+            self.stream = None
+        if self.ser:
+            try:
+                self.ser.close()
+            except:
+                pass
+            self.ser = None
+        self.port = None
+        self.active = set()
+        self.last_active = set()
+        self.tutorial_ready = set(FINGERS)
+        state = self.state
+        state["connected"] = False
+        state["calibrated"] = False
+        state["active_fingers"] = []
+        state["audio"] = None
+        self.tuner = None
+        self.stop_recording()
+        self.end_tutorial()
+        if self.store_id:
+            get_store().close_session(self.store_id)
+            self.store_id = None
+        self.rest = {}
+        self.noise = {}
+        self.detector.set_rest(self.rest)
+        self.detector.reset()
+        self.modulator.reset()
+
+    def metrics_snapshot(self):
+        decoder = self.decoder
+        return self.metrics.snapshot(
+            dropped_frames=decoder.dropped_bytes // FRAME_SIZE if decoder else 0,
+            dropped_messages=sum(channel.dropped for channel in self.bridge.channels.values()),
+            effects=self.effects_snapshot(),
+        )
+
+    def effects_snapshot(self):
+        effects = self.effects
+        return {
+            "reverb": effects.reverb_name,
+            "wet": effects.wet,
+            "bypassed": effects.bypassed,
+            "bypasses": effects.bypasses,
+            "cpu": effects.cpu,
+            "gain_reduction": effects.limiter.reduction,
+        }
+
+    def idle(self):
+        """Nothing would be lost by dropping this session: no clients, glove, recording or playback"""
+        state = self.state
+        return not (self.bridge.channels or state["connected"] or state["recording"] or state["playing_back"])
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "connected": self.state["connected"],
+            "calibrated": self.state["calibrated"],
+            "port": self.port,
+            "device": self.device,
+            "preset": self.state["current_preset"],
+            "mode": self.state["mode"],
+            "clients": len(self.bridge.channels),
+        }
+
+
+sessions = {}
+
+# Session ids come from clients and end up in recording paths
+SESSION_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+SESSION_IDLE = 300.0   # seconds an idle session is kept for its clients to come back
+MAX_SESSIONS = 64
+
+
+def evict_idle(now=None):
+    """Forget sessions that have been idle for SESSION_IDLE"""
+    now = time.monotonic() if now is None else now
+    for session_id, session in list(sessions.items()):
+        if session.idle() and now - session.last_seen > SESSION_IDLE:
+            del sessions[session_id]
+
+def get_session(session_id):
+    """Session for an id, created on first use; ValueError for an id that is not SESSION_ID"""
+    if not isinstance(session_id, str) or not SESSION_ID.fullmatch(session_id):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    evict_idle()
+    session = sessions.get(session_id)
+    if session is None:
+        if len(sessions) >= MAX_SESSIONS:
+            raise ValueError(f"Too many sessions ({MAX_SESSIONS})")
+        session = sessions[session_id] = Session(session_id)
+    session.last_seen = time.monotonic()
+    return session
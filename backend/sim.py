@@ -0,0 +1,299 @@
+import os
+import threading
+import time
+import wave
+from collections import deque, namedtuple
+import numpy as np
+import serial
+from frames import FRAME_SIZE, HEADER
+
+DEFAULT_RATE = 1000      # frames per second
+REST_VALUE = 1_000_000
+PRESS_DEPTH = 3.0        # drop, in units of the finger's range, while a finger is pressed
+NOISE = 2000
+
+# Simulated ports and sinks open files and replay captures by path, so clients may only
+# name them when the server was started with them enabled (--simulated or RIPPLE_SIMULATED=1)
+SIMULATED = os.environ.get("RIPPLE_SIMULATED", "0") == "1"
+
+# What the sinks pass as the callback's status: a late block is reported like a device underflow
+SinkStatus = namedtuple("SinkStatus", "output_underflow")
+
+
+def parse_options(spec):
+    """'sim:rate=500,pattern=random' -> ('sim', {'rate': '500', 'pattern': 'random'})"""
+    scheme, _, rest = spec.partition(':')
+    options = {}
+    for part in filter(None, rest.split(',')):
+        key, _, value = part.partition('=')
+        options[key] = value
+    return scheme, options
+
+
+class SimulatedTransport:
+    """Stands in for serial.Serial: produces frame bytes at a fixed rate as time passes.
+
+    Frames become readable in real time (rate frames per second); read() blocks up
+    to the timeout like a serial port does. Subclasses implement produce(start, count).
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, timeout=0.01):
+        self.rate = float(rate)
+        self.timeout = timeout
+        self.pending = bytearray()
+        self.produced = 0
+        self.started = time.monotonic()
+        self.is_open = True
+        self.pipe = None
+        self.lock = threading.Lock()
+
+    def produce(self, start, count):
+        raise NotImplementedError
+
+    def advance(self):
+        with self.lock:
+            due = int((time.monotonic() - self.started) * self.rate)
+            # Never generate more than a second's worth in one go (e.g. after a long stall)
+            count = min(due - self.produced, int(self.rate))
+            if count > 0:
+                self.pending += self.produce(self.produced, count)
+                self.produced = due
+
+    @property
+    def in_waiting(self):
+        self.advance()
+        return len(self.pending)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            self.advance()
+            if self.pending or not self.is_open:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 1.0 / self.rate))
+        with self.lock:
+            data = bytes(self.pending[:size])
+            del self.pending[:size]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.advance()
+        with self.lock:
+            self.pending.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def fileno(self):
+        """A pipe the frames are pumped into as they come due, so the event loop can
+        watch this transport with add_reader exactly like a real serial port's fd"""
+        if self.pipe is None:
+            self.pipe = os.pipe()
+            os.set_blocking(self.pipe[1], False)
+            threading.Thread(target=self.pump, daemon=True, name="sim-pump").start()
+        return self.pipe[0]
+
+    def pump(self):
+        write_fd = self.pipe[1]
+        while self.is_open:
+            self.advance()
+            with self.lock:
+                if self.pending:
+                    try:
+                        written = os.write(write_fd, self.pending)
+                        del self.pending[:written]
+                    except BlockingIOError:
+                        pass  # reader is behind: keep the bytes, like a full tty buffer
+                    except OSError:
+                        break  # read end closed
+            time.sleep(1.0 / self.rate)
+        os.close(write_fd)
+
+    def close(self):
+        self.is_open = False
+        if self.pipe is not None:
+            os.close(self.pipe[0])
+
+
+class SimulatedGlove(SimulatedTransport):
+    """Synthesizes DexUMI frames for a scripted finger pattern.
+
+    pattern 'scale' walks thumb..pinky, 'random' picks fingers from a seeded RNG;
+    each step presses one finger for `hold` seconds out of every `interval`, after
+    `lead_in` seconds at rest so calibration sees an idle hand.
+    onsets records when each press first became readable, for latency measurements.
+    """
+
+    def __init__(self, fingers, rate=DEFAULT_RATE, pattern='scale', interval=0.25, hold=0.15, lead_in=1.0, seed=0, timeout=0.01):
+        super().__init__(rate, timeout)
+        self.names = list(fingers)
+        self.channels = np.array([cfg['idx'] for cfg in fingers.values()])
+        self.ranges = np.array([cfg['range'] for cfg in fingers.values()], dtype=np.float64)
+        self.interval = float(interval)
+        self.hold = float(hold)
+        self.lead_in = float(lead_in)
+        self.rng = np.random.default_rng(int(seed))
+        if pattern == 'random':
+            self.sequence = self.rng.integers(0, len(self.names), 4096)
+        else:
+            self.sequence = np.arange(len(self.names))
+        self.onsets = {}
+        self.press_count = 0
+        self.was_pressed = False
+
+    def produce(self, start, count):
+        index = np.arange(start, start + count)
+        t = index / self.rate - self.lead_in
+        step = (t // self.interval).astype(np.int64)
+        pressed = (t >= 0) & ((t - step * self.interval) < self.hold)
+        finger = self.sequence[step % len(self.sequence)]
+
+        words = np.full((count, FRAME_SIZE // 4), REST_VALUE, dtype=np.int64)
+        words[:, 0] = HEADER[0] | (HEADER[1] << 8) | ((index & 0xFFFF) << 16)
+        words[:, self.channels] += self.rng.integers(-NOISE, NOISE, (count, len(self.channels)))
+        rows = np.flatnonzero(pressed)
+        words[rows, self.channels[finger[rows]]] -= (self.ranges[finger[rows]] * PRESS_DEPTH).astype(np.int64)
+
+        # First frame of every press in this batch, counting a press carried over from the last one
+        onset = pressed & ~np.concatenate([[self.was_pressed], pressed[:-1]])
+        self.was_pressed = bool(pressed[-1])
+        now = time.monotonic()
+        for row in np.flatnonzero(onset):
+            self.onsets[self.names[finger[row]]] = now
+            self.press_count += 1
+        return words.astype('<u4').tobytes()
+
+
+class ReplayTransport(SimulatedTransport):
+    """Replays captured frame bytes in a loop: a raw capture file or a recording's frames.bin"""
+
+    def __init__(self, path, rate=DEFAULT_RATE, timeout=0.01):
+        super().__init__(rate, timeout)
+        if os.path.isdir(path):
+            path = os.path.join(path, "frames.bin")
+        with open(path, "rb") as f:
+            self.data = f.read()
+        if len(self.data) < FRAME_SIZE:
+            raise ValueError(f"Capture too short: {path}")
+        self.pos = 0
+
+    def produce(self, start, count):
+        size = count * FRAME_SIZE
+        out = bytearray()
+        while len(out) < size:
+            chunk = self.data[self.pos:self.pos + size - len(out)]
+            out += chunk
+            self.pos = (self.pos + len(chunk)) % len(self.data)
+        return bytes(out)
+
+
+def simulated_port(port):
+    return isinstance(port, str) and (port.startswith("sim") or port.startswith("replay:"))
+
+
+def simulated_device(device):
+    return device == "null" or (isinstance(device, str) and device.startswith("file:"))
+
+
+def open_port(port, fingers, baudrate=921600, timeout=0.01):
+    """serial.Serial for real ports; 'sim:...' and 'replay:<path>,...' for hardware-free runs"""
+    if port.startswith("sim"):
+        _, options = parse_options(port)
+        return SimulatedGlove(fingers, timeout=timeout, **options)
+    if port.startswith("replay:"):
+        _, options = parse_options(port)
+        path = next(key for key, value in options.items() if not value)
+        rate = options.get("rate", DEFAULT_RATE)
+        return ReplayTransport(path, rate, timeout)
+    return serial.Serial(port, baudrate, timeout=timeout)
+
+
+class NullSink:
+    """Stands in for sd.OutputStream: calls the callback on its own thread at the
+    stream's real-time pace (or back to back with realtime=False) and discards output."""
+
+    def __init__(self, samplerate, channels, blocksize, callback, realtime=True, **_):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.latency = blocksize / samplerate
+        self.callback = callback
+        self.realtime = realtime
+        self.durations = deque(maxlen=100000)
+        self.blocks = 0
+        self.late = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="null-sink")
+        self.thread.start()
+
+    def run(self):
+        out = np.zeros((self.blocksize, self.channels), dtype=np.float32)
+        period = self.blocksize / self.samplerate
+        deadline = time.monotonic()
+        status = SinkStatus(False)
+        while self.running:
+            began = time.perf_counter()
+            self.callback(out, self.blocksize, None, status)
+            self.durations.append(time.perf_counter() - began)
+            self.blocks += 1
+            self.consume(out)
+            if self.realtime:
+                deadline += period
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                else:
+                    self.late += 1
+                # A device would still have had a block buffered; more than that behind is an underflow
+                status = SinkStatus(wait < -period)
+
+    def consume(self, out):
+        pass
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def close(self):
+        self.stop()
+
+
+class FileSink(NullSink):
+    """NullSink that writes the rendered blocks to a 16-bit WAV file"""
+
+    def __init__(self, path, samplerate, channels, blocksize, callback, **kwargs):
+        super().__init__(samplerate, channels, blocksize, callback, **kwargs)
+        self.file = wave.open(path, "wb")
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(samplerate)
+
+    def consume(self, out):
+        self.file.writeframes((np.clip(out, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+def open_output(device, **kwargs):
+    """sd.OutputStream for real devices; 'null' or 'file:<path>.wav' for hardware-free runs"""
+    if device == "null":
+        return NullSink(**kwargs)
+    if isinstance(device, str) and device.startswith("file:"):
+        return FileSink(device[len("file:"):], **kwargs)
+    import sounddevice as sd
+    return sd.OutputStream(device=device, **kwargs)
@@ -0,0 +1,480 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from analytics import RunningStats
+
+SONGS_DIR = os.environ.get("RIPPLE_SONGS", os.path.join(os.path.expanduser("~"), ".local", "share", "ripple", "songs"))
+# Next to the songs, not in the sample cache: clearing that must not drop the library
+INDEX_PATH = os.environ.get("RIPPLE_SONGS_INDEX", os.path.join(os.path.dirname(os.path.abspath(SONGS_DIR)), "songs.db"))
+
+# Finger ids are positions in this list; a step's fingers are stored as a bitmask of them
+FINGER_ORDER = ['thumb', 'index', 'middle', 'ring', 'pinky']
+FINGER_BITS = {name: 1 << i for i, name in enumerate(FINGER_ORDER)}
+
+COMPILER_VERSION = 1      # bump when compilation changes so every song is recompiled
+CHORD_WINDOW = 0.04       # notes starting this close to the previous one are played together
+DRUM_CHANNEL = 9          # General MIDI percussion, which has no pitch to map
+BUILTIN_STEP = 0.6        # seconds per step for sequences that carry no rhythm
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+LOADED_SONGS = 32         # compiled songs kept in memory
+
+TIMING_WINDOW = 0.15      # seconds off the expected onset that still count as on time
+TEMPO_SMOOTHING = 0.25    # how fast the expected tempo follows the player
+TEMPO_RANGE = (0.5, 2.5)  # the player may be this much faster/slower than written
+CHORD_SPREAD = 0.12       # seconds between a chord's first and last finger for a clean chord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    title_key TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    steps INTEGER NOT NULL,
+    chords INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    difficulty TEXT NOT NULL,
+    onsets BLOB NOT NULL,
+    masks BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_title ON songs (title_key, id);
+CREATE INDEX IF NOT EXISTS songs_difficulty ON songs (difficulty, title_key, id);
+"""
+
+# Everything but the compiled arrays, for listings
+LISTED = "id, title, steps, chords, duration, difficulty"
+
+
+# Standard MIDI files
+
+def read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_midi(path):
+    """Note onsets of a standard MIDI file (format 0 or 1) as (title, seconds, pitches).
+
+    Tempo changes from any track apply to all of them. Percussion and
+    zero-velocity note-ons (note-offs under running status) are skipped.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    length = int.from_bytes(data[4:8], 'big')
+    division = int.from_bytes(data[12:14], 'big')
+    if data[:4] != b'MThd' or length < 6 or not division & 0x7fff:
+        raise ValueError(f"{path}: not a MIDI file")
+    tracks = int.from_bytes(data[10:12], 'big')
+    pos = 8 + length
+
+    title = None
+    ticks, pitches = [], []
+    tempos = [(0, 500000)]
+    for _ in range(tracks):
+        while data[pos:pos + 4] not in (b'MTrk', b''):
+            # Skip unknown chunks
+            pos += 8 + int.from_bytes(data[pos + 4:pos + 8], 'big')
+        if data[pos:pos + 4] != b'MTrk':
+            break
+        end = pos + 8 + int.from_bytes(data[pos + 4:pos + 8], 'big')
+        pos += 8
+        tick = 0
+        status = 0
+        while pos < end:
+            delta, pos = read_varlen(data, pos)
+            tick += delta
+            if data[pos] & 0x80:
+                status = data[pos]
+                pos += 1
+            if status == 0xff:
+                kind = data[pos]
+                size, pos = read_varlen(data, pos + 1)
+                if kind == 0x51 and size == 3:
+                    tempos.append((tick, int.from_bytes(data[pos:pos + 3], 'big')))
+                elif kind == 0x03 and title is None and size:
+                    title = data[pos:pos + size].decode('latin-1').strip() or None
+                pos += size
+                status = 0
+            elif status in (0xf0, 0xf7):
+                size, pos = read_varlen(data, pos)
+                pos += size
+                status = 0
+            elif status & 0xf0 in (0xc0, 0xd0):
+                pos += 1
+            else:
+                if status & 0xf0 == 0x90 and data[pos + 1] and status & 0x0f != DRUM_CHANNEL:
+                    ticks.append(tick)
+                    pitches.append(data[pos])
+                pos += 2
+        pos = end
+
+    ticks = np.array(ticks, dtype=np.float64)
+    if division & 0x8000:
+        # SMPTE time: frames per second (stored negated) times ticks per frame
+        fps = 256 - (division >> 8)
+        seconds = ticks / (fps * (division & 0xff))
+    else:
+        tempos.sort()
+        at = np.array([t for t, _ in tempos], dtype=np.float64)
+        per_tick = np.array([us for _, us in tempos]) / 1e6 / division
+        # Seconds at every tempo change, then each note from the change before it
+        start = np.concatenate([[0.0], np.cumsum(np.diff(at) * per_tick[:-1])])
+        i = np.searchsorted(at, ticks, side='right') - 1
+        seconds = start[i] + (ticks - at[i]) * per_tick[i]
+    order = np.argsort(seconds, kind='stable')
+    return title, seconds[order], np.array(pitches, dtype=np.int16)[order]
+
+
+# Compilation
+
+def assign_fingers(pitches):
+    """Finger id per note: distinct pitches low to high split into five groups of about
+    equally many notes, so the melody's contour survives and every finger gets work"""
+    unique, inverse, counts = np.unique(pitches, return_inverse=True, return_counts=True)
+    if len(unique) <= len(FINGER_ORDER):
+        return inverse.astype(np.uint8)
+    middle = np.cumsum(counts) - counts / 2
+    group = np.minimum((middle * len(FINGER_ORDER) / counts.sum()).astype(int), len(FINGER_ORDER) - 1)
+    return group[inverse].astype(np.uint8)
+
+
+def compile_notes(seconds, fingers):
+    """Merge notes into steps: (onsets float32 from 0, masks uint8 of finger bits)"""
+    if not len(seconds):
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.uint8)
+    starts = np.flatnonzero(np.concatenate([[True], np.diff(seconds) > CHORD_WINDOW]))
+    masks = np.bitwise_or.reduceat(np.left_shift(1, fingers.astype(np.uint8)), starts).astype(np.uint8)
+    onsets = (seconds[starts] - seconds[0]).astype(np.float32)
+    return onsets, masks
+
+
+def rate_difficulty(onsets, masks):
+    """Beginner .. Hard from steps per second and how many steps are chords"""
+    if len(onsets) < 2:
+        return 'Beginner'
+    rate = (len(onsets) - 1) / max(float(onsets[-1]), 1e-3)
+    chords = np.count_nonzero(masks & (masks - 1)) / len(masks)
+    effort = rate * (1 + 2 * chords)
+    for limit, label in ((1.0, 'Beginner'), (1.8, 'Easy'), (3.0, 'Medium')):
+        if effort < limit:
+            return label
+    return 'Hard'
+
+
+class Song:
+    """A compiled song: one entry per step, the time it should start (seconds from
+    the first step) and the bitmask of fingers pressed together on it. Untimed
+    songs (the built-in tutorials) only have their order scored."""
+
+    def __init__(self, song_id, title, onsets, masks, difficulty=None, timed=True):
+        self.id = song_id
+        self.title = title
+        self.onsets = onsets
+        self.masks = masks
+        self.difficulty = difficulty or rate_difficulty(onsets, masks)
+        self.timed = timed
+
+    def __len__(self):
+        return len(self.masks)
+
+    def fingers(self, step):
+        mask = int(self.masks[step])
+        return [name for name in FINGER_ORDER if mask & FINGER_BITS[name]]
+
+    def sequence(self):
+        """Finger name per step, chords joined with '+'"""
+        return ['+'.join(self.fingers(step)) for step in range(len(self))]
+
+    def describe(self):
+        return {"name": self.title, "difficulty": self.difficulty, "length": len(self)}
+
+
+def song_from_sequence(song_id, title, sequence, difficulty=None):
+    """Song from a list of finger names (or '+'-joined chords), one step per BUILTIN_STEP"""
+    masks = np.array([sum(FINGER_BITS[name] for name in step.split('+')) for step in sequence], dtype=np.uint8)
+    onsets = (np.arange(len(masks)) * BUILTIN_STEP).astype(np.float32)
+    return Song(song_id, title, onsets, masks, difficulty, timed=False)
+
+
+def compile_midi(path):
+    title, seconds, pitches = read_midi(path)
+    if not len(seconds):
+        raise ValueError(f"{path}: no notes")
+    onsets, masks = compile_notes(seconds, assign_fingers(pitches))
+    return title or os.path.splitext(os.path.basename(path))[0], onsets, masks
+
+
+# Library
+
+class SongLibrary:
+    """MIDI files under SONGS_DIR, compiled once into an SQLite index.
+
+    Each row holds a song's title, difficulty and counts next to its compiled
+    onset and finger-mask arrays, so listing and searching thousands of songs
+    never opens a MIDI file and starting one is a single row read. scan() only
+    parses files that are new or whose size or mtime changed, and drops rows
+    for files that are gone.
+    """
+
+    def __init__(self, root=SONGS_DIR, path=INDEX_PATH):
+        self.root = root
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self.connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        self.scan_lock = threading.Lock()
+        self.scanned = threading.Event()
+        self.loaded = {}
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def scan(self):
+        """Bring the index in line with the files; returns (compiled, removed, failed)"""
+        with self.scan_lock:
+            found = {}
+            for folder, _, files in os.walk(self.root):
+                for name in files:
+                    if name.lower().endswith(('.mid', '.midi')):
+                        path = os.path.join(folder, name)
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            continue
+                        found[path] = (st.st_mtime, st.st_size)
+
+            db = self.connect()
+            try:
+                known = {row["path"]: (row["mtime"], row["size"], row["version"])
+                         for row in db.execute("SELECT path, mtime, size, version FROM songs")}
+                removed = [path for path in known if path not in found]
+                compiled = failed = 0
+                for path, (mtime, size) in found.items():
+                    if known.get(path) == (mtime, size, COMPILER_VERSION):
+                        continue
+                    try:
+                        title, onsets, masks = compile_midi(path)
+                    except Exception as e:
+                        print(f"Could not import {path}: {e}")
+                        failed += 1
+                        continue
+                    song_id = hashlib.sha1(os.path.relpath(path, self.root).encode()).hexdigest()[:12]
+                    with db:
+                        db.execute("INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (song_id, path, title, title.lower(), mtime, size, COMPILER_VERSION, len(masks),
+                                    int(np.count_nonzero(masks & (masks - 1))),
+                                    float(onsets[-1]) if len(onsets) else 0.0, rate_difficulty(onsets, masks),
+                                    onsets.tobytes(), masks.tobytes()))
+                    self.loaded.pop(song_id, None)
+                    compiled += 1
+                if removed:
+                    with db:
+                        db.executemany("DELETE FROM songs WHERE path = ?", [(path,) for path in removed])
+                    self.loaded.clear()
+            finally:
+                db.close()
+        self.scanned.set()
+        if compiled or removed or failed:
+            print(f"Song library: {compiled} compiled, {len(removed)} removed, {failed} failed")
+        return compiled, len(removed), failed
+
+    def scan_in_background(self):
+        threading.Thread(target=self.scan, daemon=True, name="song-scan").start()
+
+    def search(self, query=None, difficulty=None, after=None, limit=PAGE_SIZE):
+        """One page of songs ordered by title, optionally filtered by a title substring
+        and difficulty. after is the cursor from the previous page: "<title_key>:<id>".
+        Returns (rows, cursor for the next page or None)."""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = [], []
+        if query:
+            where.append("instr(title_key, ?) > 0")
+            params.append(query.lower())
+        if difficulty:
+            where.append("difficulty = ?")
+            params.append(difficulty)
+        if after:
+            key, _, song_id = after.rpartition(":")
+            where.append("(title_key > ? OR (title_key = ? AND id > ?))")
+            params += [key, key, song_id]
+        sql = f"SELECT {LISTED}, title_key FROM songs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY title_key, id LIMIT ?"
+        params.append(limit + 1)
+
+        db = self.connect()
+        try:
+            rows = [dict(row) for row in db.execute(sql, params)]
+        finally:
+            db.close()
+        cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            cursor = f"{rows[-1]['title_key']}:{rows[-1]['id']}"
+        for row in rows:
+            del row["title_key"]
+        return rows, cursor
+
+    def count(self):
+        db = self.connect()
+        try:
+            return db.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+        finally:
+            db.close()
+
+    def load(self, song_id):
+        """Compiled Song by id, or None"""
+        song = self.loaded.get(song_id)
+        if song is not None:
+            return song
+        db = self.connect()
+        try:
+            row = db.execute("SELECT title, difficulty, onsets, masks FROM songs WHERE id = ?", (song_id,)).fetchone()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        song = Song(song_id, row["title"], np.frombuffer(row["onsets"], dtype=np.float32),
+                    np.frombuffer(row["masks"], dtype=np.uint8), row["difficulty"])
+        if len(self.loaded) >= LOADED_SONGS:
+            self.loaded.pop(next(iter(self.loaded)))
+        self.loaded[song_id] = song
+        return song
+
+
+library = None
+
+def get_library():
+    """The process-wide song library, opened (and scanned in the background) on first use"""
+    global library
+    if library is None:
+        library = SongLibrary()
+        library.scan_in_background()
+    return library
+
+
+# Scoring
+
+class SongMatcher:
+    """Scores presses against a Song as they arrive, with O(1) work per press.
+
+    A step is done once all of its fingers are down. Its timing is judged on the
+    first of them: the gap since the previous step's onset is compared with the
+    written gap scaled by the player's own tempo, which follows them smoothly, so
+    a patient who plays steadily but slowly is on time. A chord is clean when
+    its last finger lands within CHORD_SPREAD of its first.
+    """
+
+    def __init__(self, song):
+        self.song = song
+        self.reset()
+
+    def reset(self):
+        self.step = 0
+        self.held = 0
+        self.onset = None
+        self.last_onset = None
+        self.tempo = 1.0
+        self.deviation = None
+        self.timing = RunningStats()
+        self.on_time = 0
+        self.early = 0
+        self.late = 0
+        self.chords = 0
+        self.clean_chords = 0
+        self.wrong = 0
+
+    @property
+    def done(self):
+        return self.step >= len(self.song)
+
+    def expected(self):
+        """Finger names still needed for the current step"""
+        if self.done:
+            return []
+        missing = int(self.song.masks[self.step]) & ~self.held
+        return [name for name in FINGER_ORDER if missing & FINGER_BITS[name]]
+
+    def press(self, finger, t):
+        """Score a press at perf_counter time t. Returns False for a wrong finger,
+        True when the press completed the current step, None for part of a chord."""
+        if self.done:
+            return False
+        bit = FINGER_BITS[finger]
+        mask = int(self.song.masks[self.step])
+        if not bit & mask:
+            self.wrong += 1
+            return False
+        if bit & self.held:
+            return None
+        if not self.held:
+            self.onset = t
+            self.score_timing(t)
+        self.held |= bit
+        if self.held != mask:
+            return None
+
+        if mask & (mask - 1):
+            self.chords += 1
+            if t - self.onset <= CHORD_SPREAD:
+                self.clean_chords += 1
+        self.last_onset = self.onset
+        self.held = 0
+        self.step += 1
+        return True
+
+    def score_timing(self, t):
+        self.deviation = None
+        if self.last_onset is None or not self.song.timed:
+            return
+        onsets = self.song.onsets
+        written = float(onsets[self.step] - onsets[self.step - 1])
+        if written <= 0:
+            return
+        actual = t - self.last_onset
+        self.deviation = actual - written * self.tempo
+        self.timing.add(self.deviation)
+        if abs(self.deviation) <= TIMING_WINDOW:
+            self.on_time += 1
+        elif self.deviation < 0:
+            self.early += 1
+        else:
+            self.late += 1
+        low, high = TEMPO_RANGE
+        self.tempo += TEMPO_SMOOTHING * (min(max(actual / written, low), high) - self.tempo)
+
+    def snapshot(self):
+        timed = self.on_time + self.early + self.late
+        attempts = self.step + self.wrong
+        return {
+            "song": self.song.id,
+            "step": self.step,
+            "total": len(self.song),
+            "wrong": self.wrong,
+            "accuracy": self.step / attempts if attempts else 0.0,
+            "on_time": self.on_time,
+            "early": self.early,
+            "late": self.late,
+            "on_time_rate": self.on_time / timed if timed else None,
+            "deviation_ms": self.timing.snapshot(1000),
+            "tempo": self.tempo,
+            "chords": self.chords,
+            "clean_chords": self.clean_chords,
+        }
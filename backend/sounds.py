@@ -0,0 +1,125 @@
+import re
+import numpy as np
+
+NOTE_INDEX = {
+    'C': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'F': 5, 'F#': 6, 'Gb': 6,
+    'G': 7, 'G#': 8, 'Ab': 8, 'A': 9, 'A#': 10, 'Bb': 10, 'B': 11,
+}
+
+CHORD_INTERVALS = {
+    'maj': [0, 4, 7],
+    'm': [0, 3, 7],
+    '7': [0, 4, 7, 10],
+}
+
+# Cents offset of each pitch class from 12-tone equal temperament, relative to C
+TUNINGS = {
+    'equal': [0.0] * 12,
+    'just': [0.0, 11.7, 3.9, 15.6, -13.7, -2.0, -9.8, 2.0, -27.4, -15.6, 17.6, -11.7],
+    'pythagorean': [0.0, 13.7, 3.9, -5.9, 7.8, -2.0, 11.7, 2.0, 15.6, 5.9, -3.9, 9.8],
+}
+
+A4 = 440.0
+
+# Sound names offered for presets and the custom mapping
+CHORD_NAMES = (
+    ['C', 'D', 'E', 'F', 'G', 'A', 'B', 'C#', 'D#', 'F#', 'G#', 'A#', 'Db', 'Eb', 'Gb', 'Ab', 'Bb',
+     'C5', 'D5', 'E5', 'F5', 'G5']
+    + [f'{root}_maj' for root in ['C', 'D', 'E', 'F', 'G', 'A', 'B', 'C#', 'D#', 'F#', 'G#', 'A#', 'Db', 'Eb', 'Gb', 'Ab', 'Bb']]
+    + [f'{root}m' for root in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'C#', 'D#', 'F#', 'G#', 'A#', 'Db', 'Eb', 'Gb', 'Ab', 'Bb']]
+    + [f'{root}7' for root in ['C', 'D', 'E', 'F', 'G', 'A', 'B']]
+    + ['none']
+)
+
+# root, optional octave digit (7 means a seventh chord), optional quality, microtonal cents
+SPEC = re.compile(r'^([A-G][#b]?)([0-689])?(_maj|m|7)?([+-]\d+(?:\.\d+)?c)?$')
+
+EMPTY = np.zeros(0)
+EMPTY.flags.writeable = False
+
+def parse_spec(sound_str):
+    """Split a sound spec like 'A_maj_inv1_oct5' or 'E-14c' into its parts, or None"""
+    octave = 4
+    inversion = 0
+    for name in ('_oct', '_inv'):
+        if name in sound_str:
+            head, _, tail = sound_str.partition(name)
+            if tail[:1].isdigit():
+                if name == '_oct':
+                    octave = int(tail[0])
+                else:
+                    inversion = int(tail[0])
+            sound_str = head + tail[1:]
+    match = SPEC.match(sound_str)
+    if not match:
+        return None
+    root, octave_digit, quality, cents = match.groups()
+    if octave_digit:
+        octave = int(octave_digit)
+    intervals = CHORD_INTERVALS[quality.lstrip('_')] if quality else [0]
+    cents = float(cents[:-1]) if cents else 0.0
+    return root, octave, intervals, inversion, cents
+
+def note_frequency(pitch_class, octave, tuning, cents=0.0, a4=A4):
+    """Frequency of a pitch class (0 = C, may exceed 11) in an octave; A stays at a4"""
+    midi = pitch_class + 12 * (octave + 1)
+    semitones = midi - 69 + (tuning[midi % 12] - tuning[9] + cents) / 100
+    return a4 * 2 ** (semitones / 12)
+
+def parse_sound(sound_str, tuning='equal', a4=A4):
+    """Frequencies of a note or chord spec, sorted low to high"""
+    if not sound_str or sound_str == 'none':
+        return []
+    parts = parse_spec(sound_str)
+    if parts is None:
+        return []
+    root, octave, intervals, inversion, cents = parts
+    offsets = TUNINGS[tuning] if isinstance(tuning, str) else tuning
+    base = NOTE_INDEX[root]
+    freqs = []
+    for i, interval in enumerate(intervals):
+        freq = note_frequency(base + interval, octave, offsets, cents, a4)
+        if i < inversion:
+            freq *= 2
+        freqs.append(freq)
+    return sorted(freqs)
+
+
+class SoundRegistry:
+    """Resolves sound specs to frozen frequency arrays once, ahead of the hot path.
+
+    compile() memoizes per spec; compile_mapping() builds the finger -> frequencies
+    table for a preset so update_sound only does dict lookups.
+    """
+
+    def __init__(self, tuning='equal', a4=A4):
+        self.tuning = tuning
+        self.a4 = a4
+        self.cache = {}
+
+    def set_tuning(self, tuning, a4=None):
+        """Switch tuning (a TUNINGS name or 12 cent offsets); clears compiled specs"""
+        if isinstance(tuning, str) and tuning not in TUNINGS:
+            raise ValueError(f"Unknown tuning: {tuning}")
+        if not isinstance(tuning, str) and len(tuning) != 12:
+            raise ValueError("A tuning table needs 12 cent offsets")
+        self.tuning = tuning if isinstance(tuning, str) else [float(c) for c in tuning]
+        if a4 is not None:
+            self.a4 = float(a4)
+        self.cache = {}
+
+    def compile(self, spec):
+        freqs = self.cache.get(spec)
+        if freqs is None:
+            freqs = np.array(parse_sound(spec, self.tuning, self.a4)) if spec else EMPTY
+            freqs.flags.writeable = False
+            self.cache[spec] = freqs
+        return freqs
+
+    def compile_mapping(self, mapping, types=None):
+        """Finger -> frozen frequencies for a preset mapping; drum and none fingers are empty"""
+        compiled = {}
+        for finger, spec in mapping.items():
+            kind = types.get(finger, 'note') if types else 'note'
+            compiled[finger] = EMPTY if kind in ('drum', 'none') else self.compile(spec)
+        return compiled
@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from recorder import RECORDINGS_DIR
+
+STORE_PATH = os.environ.get("RIPPLE_DB", os.path.join(os.path.dirname(RECORDINGS_DIR), "ripple.db"))
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+FLUSH_INTERVAL = 0.5   # seconds the writer waits to batch more rows into one transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    patient TEXT,
+    time REAL NOT NULL,
+    ended REAL,
+    port TEXT,
+    device TEXT
+);
+CREATE TABLE IF NOT EXISTS calibrations (
+    id INTEGER PRIMARY KEY,
+    session TEXT,
+    patient TEXT,
+    time REAL NOT NULL,
+    rest TEXT NOT NULL,
+    noise TEXT
+);
+CREATE TABLE IF NOT EXISTS tutorials (
+    id INTEGER PRIMARY KEY,
+    session TEXT,
+    patient TEXT,
+    tutorial TEXT NOT NULL,
+    time REAL NOT NULL,
+    duration REAL,
+    completed INTEGER NOT NULL,
+    correct INTEGER,
+    errors INTEGER,
+    analytics TEXT
+);
+CREATE TABLE IF NOT EXISTS recordings (
+    id TEXT PRIMARY KEY,
+    session TEXT,
+    patient TEXT,
+    time REAL NOT NULL,
+    duration REAL,
+    preset TEXT,
+    events INTEGER,
+    path TEXT NOT NULL,
+    analytics TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_patient ON sessions (patient, time);
+CREATE INDEX IF NOT EXISTS sessions_time ON sessions (time);
+CREATE INDEX IF NOT EXISTS calibrations_patient ON calibrations (patient, time);
+CREATE INDEX IF NOT EXISTS tutorials_patient ON tutorials (patient, time);
+CREATE INDEX IF NOT EXISTS tutorials_tutorial ON tutorials (tutorial, time);
+CREATE INDEX IF NOT EXISTS tutorials_time ON tutorials (time);
+CREATE INDEX IF NOT EXISTS recordings_patient ON recordings (patient, time);
+CREATE INDEX IF NOT EXISTS recordings_time ON recordings (time);
+"""
+
+# Queryable tables and the columns holding JSON
+KINDS = {
+    "sessions": (),
+    "calibrations": ("rest", "noise"),
+    "tutorials": ("analytics",),
+    "recordings": ("analytics",),
+}
+
+
+class Store:
+    """SQLite (WAL) history of sessions, calibrations, tutorial results and recordings.
+
+    Writes never touch the database on the caller's thread: they are appended to
+    a deque and a writer thread commits whatever has piled up in one transaction.
+    Reads open their own connection, which WAL lets run alongside the writer.
+    Recording samples stay in their column files; rows only point at them.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self.connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        self.pending = deque()
+        self.wakeup = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.writer = threading.Thread(target=self.run, daemon=True, name="store-writer")
+        self.writer.start()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # Writes: safe from any thread, including the sensor thread
+
+    def write(self, sql, params):
+        self.idle.clear()
+        self.pending.append((sql, params))
+        self.wakeup.set()
+
+    def run(self):
+        db = self.connect()
+        while True:
+            self.wakeup.wait()
+            time.sleep(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            batch = []
+            while self.pending:
+                batch.append(self.pending.popleft())
+            try:
+                with db:
+                    for sql, params in batch:
+                        db.execute(sql, params)
+            except Exception as e:
+                print(f"Store write failed ({len(batch)} rows): {e}")
+            if not self.pending:
+                self.idle.set()
+                if self.pending:
+                    self.idle.clear()
+
+    def flush(self, timeout=5.0):
+        """Wait until everything written so far is committed"""
+        return self.idle.wait(timeout)
+
+    def open_session(self, name, patient=None, port=None, device=None):
+        """New row for one connect..disconnect span; returns its id"""
+        sid = uuid.uuid4().hex
+        self.write("INSERT INTO sessions (id, name, patient, time, port, device) VALUES (?, ?, ?, ?, ?, ?)",
+                   (sid, name, patient, time.time(), port, str(device) if device is not None else None))
+        return sid
+
+    def set_patient(self, sid, patient):
+        self.write("UPDATE sessions SET patient = ? WHERE id = ?", (patient, sid))
+
+    def close_session(self, sid):
+        self.write("UPDATE sessions SET ended = ? WHERE id = ?", (time.time(), sid))
+
+    def save_calibration(self, sid, patient, rest, noise):
+        self.write("INSERT INTO calibrations (session, patient, time, rest, noise) VALUES (?, ?, ?, ?, ?)",
+                   (sid, patient, time.time(), json.dumps(rest), json.dumps(noise)))
+
+    def save_tutorial(self, sid, patient, tutorial, started, completed, correct, errors, analytics):
+        self.write("INSERT INTO tutorials (session, patient, tutorial, time, duration, completed, correct, errors, analytics) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   (sid, patient, tutorial, started, time.time() - started, int(completed), correct, errors, json.dumps(analytics)))
+
+    def save_recording(self, sid, patient, recording_id, path, started, duration, preset, events, analytics):
+        self.write("INSERT OR REPLACE INTO recordings (id, session, patient, time, duration, preset, events, path, analytics) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   (recording_id, sid, patient, started, duration, preset, events, path, json.dumps(analytics)))
+
+    # Reads: blocking, call through asyncio.to_thread from the event loop
+
+    def query(self, kind, patient=None, tutorial=None, since=None, until=None, before=None, limit=PAGE_SIZE):
+        """One page of rows, newest first.
+
+        before is the cursor from the previous page: "<time>:<id>". Paging on the
+        (time, id) index instead of OFFSET keeps every page equally fast.
+        Returns (rows, cursor for the next page or None).
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind: {kind}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = [], []
+        if patient is not None:
+            where.append("patient = ?")
+            params.append(patient)
+        if tutorial is not None:
+            if kind != "tutorials":
+                raise ValueError("tutorial filter only applies to tutorials")
+            where.append("tutorial = ?")
+            params.append(tutorial)
+        if since is not None:
+            where.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("time < ?")
+            params.append(until)
+        if before:
+            t, _, key = before.partition(":")
+            where.append("(time < ? OR (time = ? AND id < ?))")
+            params += [float(t), float(t), key if kind in ("sessions", "recordings") else int(key)]
+        sql = f"SELECT * FROM {kind}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY time DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        db = self.connect()
+        try:
+            rows = [self.row_dict(kind, row) for row in db.execute(sql, params)]
+        finally:
+            db.close()
+        cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            cursor = f"{rows[-1]['time']!r}:{rows[-1]['id']}"
+        return rows, cursor
+
+    def iterate(self, kind, **filters):
+        """Every matching row, newest first, fetched a page at a time"""
+        cursor = None
+        while True:
+            rows, cursor = self.query(kind, before=cursor, limit=MAX_PAGE_SIZE, **filters)
+            yield from rows
+            if cursor is None:
+                return
+
+    def patients(self):
+        sql = """
+            SELECT patient, COUNT(*) AS sessions, MIN(time) AS first, MAX(time) AS last
+            FROM sessions WHERE patient IS NOT NULL GROUP BY patient ORDER BY last DESC
+        """
+        db = self.connect()
+        try:
+            return [dict(row) for row in db.execute(sql)]
+        finally:
+            db.close()
+
+    def row_dict(self, kind, row):
+        item = dict(row)
+        for column in KINDS[kind]:
+            if item.get(column):
+                item[column] = json.loads(item[column])
+        return item
+
+
+store = None
+
+def get_store():
+    """The process-wide store, opened on first use"""
+    global store
+    if store is None:
+        store = Store()
+    return store
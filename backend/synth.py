@@ -0,0 +1,292 @@
+import numpy as np
+from collections import deque
+from sampler import SAMPLED
+from modulation import BRIGHTNESS, SMOOTHING, VOLUME
+
+TABLE_SIZE = 2048
+MAX_VOICES = 32
+MAX_BLOCK = 4096
+DARK_TAPS = 8     # box filter a voice fades towards as its brightness drops (first null at sr / 8)
+
+def build_wavetable(partials, size=TABLE_SIZE):
+    """One cycle of a sum of harmonics, with a guard sample for interpolation"""
+    x = np.arange(size + 1) / size
+    table = np.zeros(size + 1)
+    for harmonic, amp in partials:
+        table += amp * np.sin(2 * np.pi * harmonic * x)
+    return table
+
+# Each instrument is a list of layers: (frequency ratio, gain, harmonic partials).
+# Harmonic timbres collapse into a single table; detuned ones need their own layer.
+INSTRUMENTS = {
+    'sine': [(1.0, 1.0, [(1, 1.0)])],
+    'soft': [(1.0, 1.0, [(1, 0.6), (2, 0.3), (3, 0.1)])],
+    'bell': [(1.0, 1.0, [(1, 1.0), (2, 0.5)])],
+    'pad': [(1.0, 0.4, [(1, 1.0)]), (1.002, 0.3, [(1, 1.0)]), (0.998, 0.3, [(1, 1.0)])],
+}
+
+def compile_instrument(layers):
+    tables = np.stack([build_wavetable(partials) for _, _, partials in layers])
+    ratios = np.array([ratio for ratio, _, _ in layers])
+    gains = np.array([gain for _, gain, _ in layers])
+    return tables, ratios, gains
+
+WAVETABLES = {name: compile_instrument(layers) for name, layers in INSTRUMENTS.items()}
+MAX_LAYERS = max(len(layers) for layers in INSTRUMENTS.values())
+
+
+IDLE, ATTACK, DECAY, SUSTAIN, RELEASE = range(5)
+NOTE_ON, NOTE_OFF, ALL_OFF, RESET = range(4)
+
+# (attack s, decay s, sustain level, release s) per instrument
+ENVELOPES = {
+    'sine': (0.005, 0.08, 0.8, 0.12),
+    'soft': (0.01, 0.15, 0.7, 0.2),
+    'bell': (0.002, 0.6, 0.35, 0.4),
+    'pad': (0.08, 0.3, 0.85, 0.5),
+}
+DEFAULT_ENVELOPE = ENVELOPES['sine']
+
+
+class VoicePool:
+    """Fixed set of wavetable voices with per-sample ADSR envelopes.
+
+    Control threads only append note events to a deque (atomic under the GIL);
+    the audio callback applies them at the start of each block, so neither side
+    ever waits on a lock.
+
+    Rendering into a (frames, 2) buffer places each voice in the stereo field
+    with the left/right gains pan(key) gave it when it started (centered by default).
+
+    Voices whose source(key) names a control column follow it continuously:
+    set_controls() swaps in a (2, sources) array of volume and brightness, and
+    each block every voice glides from where it was towards the newest values
+    along a per-sample exponential, so updates never step.
+    """
+
+    def __init__(self, sample_rate, max_voices=MAX_VOICES, pan=None, source=None):
+        self.sample_rate = sample_rate
+        self.max_voices = max_voices
+        self.pan_of = pan
+        self.source_of = source
+        self.source = np.full(max_voices, -1, dtype=np.intp)
+        self.controls = None
+        self.volume = np.ones(max_voices)
+        self.brightness = np.ones(max_voices)
+        self.dark_tail = np.zeros((max_voices, DARK_TAPS - 1))
+        self.smoothing = np.exp(-1.0 / (SMOOTHING * sample_rate))
+        self.glide = np.zeros(0)
+        self.pan = np.full((max_voices, 2), np.sqrt(0.5))
+        self.freqs = np.zeros(max_voices)
+        self.phase = np.zeros((max_voices, MAX_LAYERS))  # in cycles, [0, 1)
+        self.sample_pos = np.zeros(max_voices)  # frames into the region, for sampled instruments
+        self.stage = np.zeros(max_voices, dtype=np.int8)
+        self.level = np.zeros(max_voices)
+        self.gain = np.zeros(max_voices)
+        self.started = np.zeros(max_voices, dtype=np.int64)
+        self.keys = [None] * max_voices
+        self.events = deque()
+        self.blocks = 0
+        self.norm = 1.0
+        self.ramp = np.arange(MAX_BLOCK, dtype=np.float64)
+
+    # Control side: safe to call from any thread
+
+    def note_on(self, key, freq, gain=1.0):
+        self.events.append((NOTE_ON, key, freq, gain))
+
+    def note_off(self, key):
+        self.events.append((NOTE_OFF, key, 0.0, 0.0))
+
+    def all_notes_off(self):
+        self.events.append((ALL_OFF, None, 0.0, 0.0))
+
+    def reset(self):
+        self.events.append((RESET, None, 0.0, 0.0))
+
+    def set_controls(self, controls):
+        """Newest (2, sources) volume/brightness array, or None for none; replaces any not yet rendered"""
+        self.controls = controls
+
+    # Audio side
+
+    def apply_events(self):
+        while self.events:
+            self.apply(*self.events.popleft())
+
+    def apply(self, kind, key, freq, gain):
+        """Act on one event immediately; audio thread only"""
+        if kind == NOTE_ON:
+            self.start(key, freq, gain)
+        elif kind == NOTE_OFF:
+            for i, held in enumerate(self.keys):
+                if held == key and ATTACK <= self.stage[i] <= SUSTAIN:
+                    self.stage[i] = RELEASE
+        elif kind == ALL_OFF:
+            self.stage[(self.stage >= ATTACK) & (self.stage <= SUSTAIN)] = RELEASE
+        elif kind == RESET:
+            self.stage[:] = IDLE
+            self.level[:] = 0.0
+            self.keys = [None] * self.max_voices
+
+    def start(self, key, freq, gain):
+        i = None
+        for v, held in enumerate(self.keys):
+            if held == key and self.stage[v] != IDLE:
+                i = v  # retrigger: keep phase and attack from the current level
+                break
+        if i is None:
+            idle = np.flatnonzero(self.stage == IDLE)
+            if len(idle):
+                i = idle[0]
+                self.level[i] = 0.0
+            else:
+                # Steal the quietest releasing voice, else the oldest one
+                releasing = np.flatnonzero(self.stage == RELEASE)
+                if len(releasing):
+                    i = releasing[np.argmin(self.level[releasing])]
+                else:
+                    i = int(np.argmin(self.started))
+            self.phase[i] = 0.0
+        self.sample_pos[i] = 0.0  # sampled notes always restart from their attack
+        self.freqs[i] = freq
+        self.gain[i] = gain
+        self.stage[i] = ATTACK
+        self.started[i] = self.blocks
+        self.keys[i] = key
+        if self.pan_of is not None:
+            self.pan[i] = self.pan_of(key)
+        source = self.source_of(key) if self.source_of is not None else -1
+        self.source[i] = source
+        controls = self.controls
+        if source >= 0 and controls is not None:
+            # Start where the finger already is rather than gliding in from the last note
+            self.volume[i] = controls[VOLUME, source]
+            self.brightness[i] = controls[BRIGHTNESS, source]
+        else:
+            self.volume[i] = 1.0
+            self.brightness[i] = 1.0
+        self.dark_tail[i] = 0.0
+
+    def envelope(self, live, frames, shape):
+        """Per-sample envelope (voices x frames) for the live voices, advancing their stage"""
+        attack, decay, sustain, release = shape
+        sr = self.sample_rate
+        a = 1.0 / max(attack * sr, 1.0)
+        d = (1.0 - sustain) / max(decay * sr, 1.0)
+        r = 1.0 / max(release * sr, 1.0)
+
+        t = self.ramp[:frames] + 1.0
+        stage = self.stage[live][:, None]
+        level = self.level[live][:, None]
+        attacking = stage == ATTACK
+        releasing = stage == RELEASE
+
+        rise = level + a * t
+        peak = np.where(attacking, 1.0, level)
+        peak_at = np.where(attacking, (1.0 - level) / a, 0.0)
+        floor = np.where(attacking, sustain, np.minimum(level, sustain))
+        fall = np.maximum(peak - d * (t - peak_at), floor)
+        env = np.where(attacking & (rise < 1.0), rise, fall)
+        env = np.where(releasing, np.maximum(level - r * t, 0.0), env)
+
+        end = env[:, -1]
+        new_stage = stage[:, 0].copy()
+        new_stage[attacking[:, 0] & (rise[:, -1] >= 1.0)] = DECAY
+        new_stage[(new_stage == DECAY) & (end <= sustain)] = SUSTAIN
+        new_stage[releasing[:, 0] & (end <= 0.0)] = IDLE
+        self.stage[live] = new_stage
+        self.level[live] = end
+        return env
+
+    def render(self, out, instrument):
+        """Apply pending note events, then add len(out) frames of output into out (mono or stereo)"""
+        self.apply_events()
+        self.blocks += 1
+        live = np.flatnonzero(self.stage != IDLE)
+        n = len(live)
+        if n == 0:
+            return
+        frames = len(out)
+        if frames > len(self.ramp):
+            self.ramp = np.arange(frames, dtype=np.float64)
+
+        sampled = SAMPLED.get(instrument)
+        if sampled is not None and not sampled.available:
+            instrument, sampled = sampled.fallback, None  # still loading, or failed to
+        if sampled is not None:
+            env = self.envelope(live, frames, sampled.envelope)
+            env *= self.gain[live][:, None]
+            voices, self.sample_pos[live] = sampled.render(self.freqs[live], self.sample_pos[live], frames,
+                                                           self.ramp, self.sample_rate)
+            voices *= env
+        else:
+            env = self.envelope(live, frames, ENVELOPES.get(instrument, DEFAULT_ENVELOPE))
+            env *= self.gain[live][:, None]
+            voices = self.oscillators(live, frames, instrument, env)
+        self.modulate(live, voices)
+
+        # Ramp the 1/voices normalisation across the block so chord changes don't step
+        norm = self.norm + (n - self.norm) * (self.ramp[:frames] + 1.0) / frames
+        self.norm = float(n)
+        voices *= 0.3 / norm
+        if out.ndim == 1:
+            out += voices.sum(axis=0)
+        else:
+            out += voices.T @ self.pan[live]
+
+    def modulate(self, live, voices):
+        """Apply the live voices' smoothed volume and brightness to voices (voices x frames) in place"""
+        controls = self.controls
+        source = self.source[live]
+        controlled = source >= 0
+        volume = self.volume[live]
+        brightness = self.brightness[live]
+        if controls is None or not controlled.any():
+            if (volume == 1.0).all() and (brightness == 1.0).all():
+                return
+            volume_target = brightness_target = np.ones(len(live))
+        else:
+            volume_target = np.where(controlled, controls[VOLUME, source], 1.0)
+            brightness_target = np.where(controlled, controls[BRIGHTNESS, source], 1.0)
+
+        frames = voices.shape[1]
+        if len(self.glide) != frames:
+            self.glide = self.smoothing ** (np.arange(frames) + 1.0)
+        glide = self.glide[None, :]
+        volume_curve = volume_target[:, None] + (volume - volume_target)[:, None] * glide
+        brightness_curve = brightness_target[:, None] + (brightness - brightness_target)[:, None] * glide
+        self.volume[live] = volume_curve[:, -1]
+        self.brightness[live] = brightness_curve[:, -1]
+
+        # Dark copy: running mean over DARK_TAPS samples, carried across blocks per voice
+        padded = np.concatenate([self.dark_tail[live], voices], axis=1)
+        self.dark_tail[live] = padded[:, -(DARK_TAPS - 1):]
+        sums = np.cumsum(padded, axis=1)
+        dark = sums[:, DARK_TAPS - 1:].copy()
+        dark[:, 1:] -= sums[:, :-DARK_TAPS]
+        dark /= DARK_TAPS
+        voices -= dark
+        voices *= brightness_curve
+        voices += dark
+        voices *= volume_curve
+
+    def oscillators(self, live, frames, instrument, env):
+        """Wavetable output (voices x frames) of the live voices under env, advancing their phase"""
+        tables, ratios, gains = WAVETABLES.get(instrument, WAVETABLES['sine'])
+        layers = len(ratios)
+        inc = self.freqs[live][:, None] * ratios[None, :] / self.sample_rate  # (n, L)
+        phase = self.phase[live, :layers]
+        pos = phase[:, :, None] + inc[:, :, None] * self.ramp[None, None, :frames]
+        pos -= np.floor(pos)
+        pos *= TABLE_SIZE
+        idx = pos.astype(np.intp)
+        frac = pos - idx
+        rows = np.arange(layers)[None, :, None]
+        lo = tables[rows, idx]
+        hi = tables[rows, idx + 1]
+        samples = lo + (hi - lo) * frac
+        phase += inc * frames
+        phase %= 1.0
+        self.phase[live, :layers] = phase
+        return np.einsum('l,vlf,vf->vf', gains, samples, env)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+import effects
+from effects import (BYPASS_RETRY, CEILING, OVERLOAD_BLOCKS, PARTITION, EffectsChain, Limiter,
+                     PartitionedReverb, partition_impulse)
+
+SAMPLE_RATE = 44100
+
+@pytest.mark.parametrize("block", [64, 100, 256, 333, 1024])
+def test_reverb_matches_direct_convolution(block):
+    rng = np.random.default_rng(1)
+    ir = rng.normal(0, 0.1, (1000, 2))
+    dry = rng.normal(0, 0.5, 4000)
+    reverb = PartitionedReverb(partition_impulse(ir))
+    out = np.zeros((len(dry), 2))
+    for pos in range(0, len(dry), block):
+        reverb.process(dry[pos:pos + block], out[pos:pos + block], 0.5)
+    for channel in range(2):
+        # The wet path lags by one partition
+        expected = 0.5 * np.convolve(dry, ir[:, channel])[:len(dry) - PARTITION]
+        assert out[:PARTITION, channel] == pytest.approx(0.0, abs=1e-9)
+        assert np.abs(out[PARTITION:, channel] - expected).max() < 1e-4 * np.abs(expected).max()
+
+def test_reverb_reset_clears_the_tail():
+    reverb = PartitionedReverb(partition_impulse(np.ones((600, 2))))
+    out = np.zeros((512, 2))
+    reverb.process(np.ones(512), out, 1.0)
+    reverb.reset()
+    out[:] = 0
+    reverb.process(np.zeros(512), out, 1.0)
+    assert not out.any()
+
+def test_limiter_never_exceeds_the_ceiling():
+    rng = np.random.default_rng(2)
+    limiter = Limiter(SAMPLE_RATE)
+    signal = (rng.normal(0, 1, (SAMPLE_RATE, 2)) * np.linspace(0.1, 4, SAMPLE_RATE)[:, None]).astype(np.float32)
+    peak = 0.0
+    for pos in range(0, len(signal), 300):
+        block = signal[pos:pos + 300].copy()
+        limiter.process(block)
+        peak = max(peak, float(np.abs(block).max()))
+    assert peak <= CEILING + 1e-6
+
+def test_limiter_passes_quiet_audio_through_delayed():
+    limiter = Limiter(SAMPLE_RATE)
+    signal = np.sin(np.arange(2048) / 10)[:, None].repeat(2, axis=1).astype(np.float32) * 0.5
+    out = signal.copy()
+    for pos in range(0, len(out), 256):
+        limiter.process(out[pos:pos + 256])
+    L = limiter.lookahead
+    assert out[L:] == pytest.approx(signal[:-L])
+    assert limiter.reduction == 0.0
+
+def test_limiter_ramps_down_before_a_peak():
+    limiter = Limiter(SAMPLE_RATE)
+    block = np.full((512, 2), 0.5, dtype=np.float32)
+    block[300] = 2.0
+    limiter.process(block)
+    # The peak comes out at 300 + lookahead, already at the ceiling, with the gain falling before it
+    at = 300 + limiter.lookahead
+    assert abs(block[at, 0]) == pytest.approx(CEILING, rel=1e-3)
+    assert block[at - limiter.lookahead // 2, 0] < 0.5
+
+def test_set_reverb_swaps_prebuilt_reverbs():
+    chain = EffectsChain(SAMPLE_RATE)
+    chain.set_reverb('hall', 0.3)
+    assert chain.reverb is chain.reverbs['hall']
+    chain.set_reverb(None, 0.0)
+    assert chain.reverb is None
+
+def test_bypass_and_retry(monkeypatch):
+    chain = EffectsChain(SAMPLE_RATE)
+    chain.set_reverb('room', 0.3)
+    block = np.full((256, 2), 0.1, dtype=np.float32)
+    monkeypatch.setattr(effects, "EFFECTS_BUDGET", -1.0)
+    for _ in range(OVERLOAD_BLOCKS):
+        chain.process(block.copy())
+    assert chain.bypassed and chain.bypasses == 1
+
+    monkeypatch.setattr(effects, "EFFECTS_BUDGET", 1e9)
+    blocks = 0
+    while chain.bypassed:
+        chain.process(block.copy())
+        blocks += 1
+    assert blocks * 256 == pytest.approx(BYPASS_RETRY * SAMPLE_RATE, abs=256)
+
+    # Overloading again right after the retry backs off
+    monkeypatch.setattr(effects, "EFFECTS_BUDGET", -1.0)
+    for _ in range(OVERLOAD_BLOCKS):
+        chain.process(block.copy())
+    assert chain.bypassed and chain.retry == 2 * BYPASS_RETRY
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from filters import DRIFT_RATE, FILTERS, NOISE_ON, FingerDetector
+
+FINGERS = {'thumb': {'idx': 1, 'range': 1000}, 'index': {'idx': 2, 'range': 1000}}
+REST = np.array([50000.0, 60000.0])
+
+def frame(raw):
+    v = np.zeros(10, dtype=np.uint32)
+    v[[1, 2]] = np.round(raw)
+    return v
+
+def calibrated(noise=2.0, frames=200, seed=0):
+    detector = FingerDetector(FINGERS, 2.5, 2.0)
+    results = []
+    detector.start_calibration(frames, done=lambda rest, noise: results.append((rest, noise)))
+    rng = np.random.default_rng(seed)
+    for _ in range(frames):
+        detector.update(frame(REST + rng.normal(0, noise, 2)))
+    assert len(results) == 1
+    return detector, results[0]
+
+def test_calibration_takes_median_and_mad():
+    detector, (rest, noise) = calibrated(noise=20.0, frames=1000)
+    assert rest['thumb'] == pytest.approx(50000, abs=3)
+    assert rest['index'] == pytest.approx(60000, abs=3)
+    # MAD scaled to sigma recovers the Gaussian noise
+    assert noise['thumb'] == pytest.approx(20.0, rel=0.15)
+
+def test_calibration_ignores_a_stray_spike():
+    detector = FingerDetector(FINGERS, 2.5, 2.0)
+    detector.start_calibration(100)
+    for i in range(100):
+        detector.update(frame(REST - (900000 if i == 50 else 0)))
+    assert detector.rest.tolist() == REST.tolist()
+    assert detector.noise.tolist() == [1.0, 1.0]
+
+def test_noise_raises_the_thresholds():
+    detector, _ = calibrated(noise=500.0, frames=1000)
+    assert detector.on[0] == pytest.approx(NOISE_ON * detector.noise[0] / 1000)
+    assert detector.on[0] > 2.5
+    quiet, _ = calibrated(noise=2.0)
+    assert quiet.on.tolist() == [2.5, 2.5]
+
+def test_press_and_release_with_hysteresis():
+    detector, _ = calibrated()
+
+    def hold(drop, frames=10):
+        for _ in range(frames):
+            detector.update(frame(REST - np.array([drop, 0.0]) * 1000))
+        return detector.fingers(detector.active)
+
+    assert hold(1.0) == set()
+    assert hold(3.0) == {'thumb'}
+    # Between off and on: a held finger stays down
+    assert hold(2.2) == {'thumb'}
+    assert hold(1.5) == set()
+    assert hold(2.2) == set()
+
+def test_uncalibrated_fingers_never_activate():
+    detector = FingerDetector(FINGERS, 2.5, 2.0)
+    for _ in range(10):
+        previous, active = detector.update(frame(np.zeros(2)))
+    assert not active.any()
+
+def test_rest_drifts_only_while_released():
+    detector, _ = calibrated()
+    drifted = REST + [100.0, 0.0]
+    for _ in range(1000):
+        detector.update(frame(drifted))
+    expected = 100 * (1 - (1 - DRIFT_RATE) ** 1000)
+    assert detector.rest[0] - REST[0] == pytest.approx(expected, rel=0.1)
+
+    pressed = detector.rest[1]
+    for _ in range(1000):
+        detector.update(frame(drifted - [0.0, 3000.0]))
+    assert detector.active[1]
+    # Only the frames while the filter ramps into the press may nudge it
+    assert detector.rest[1] == pytest.approx(pressed, abs=1.0)
+
+def test_cancelled_calibration_never_calls_back():
+    detector = FingerDetector(FINGERS, 2.5, 2.0)
+    called = []
+    detector.start_calibration(50, done=lambda *args: called.append(args))
+    detector.update(frame(REST))
+    detector.cancel_calibration()
+    for _ in range(100):
+        detector.update(frame(REST))
+    assert called == []
+
+@pytest.mark.parametrize("name", sorted(FILTERS))
+def test_filters_settle_on_a_constant(name):
+    smooth = FILTERS[name](2)
+    x = np.array([1000.0, -5.0])
+    for _ in range(200):
+        y = smooth(x)
+    assert y == pytest.approx(x)
+    smooth.reset()
+    assert smooth(np.array([7.0, 7.0])) == pytest.approx([7.0, 7.0])
+
+def test_set_filter_swaps_the_filter():
+    detector = FingerDetector(FINGERS, 2.5, 2.0, 'moving_average', size=3)
+    detector.set_filter('median')
+    assert isinstance(detector.filter, FILTERS['median'])
+    assert detector.filter.size == 3
@@ -0,0 +1,71 @@
+import numpy as np
+from frames import FRAME_FIELDS, FRAME_SIZE, HEADER, FrameDecoder
+
+def frame(*values):
+    """40 frame bytes: the header in the first field, then the given little-endian values"""
+    fields = np.zeros(FRAME_FIELDS, dtype='<u4')
+    fields[1:1 + len(values)] = values
+    raw = bytearray(fields.tobytes())
+    raw[:2] = HEADER
+    return bytes(raw)
+
+def test_decodes_back_to_back_frames():
+    decoder = FrameDecoder()
+    frames = decoder.feed(frame(1, 2) + frame(3, 4) + frame(5, 6))
+    assert frames.shape == (3, FRAME_FIELDS)
+    assert frames.dtype == np.uint32
+    assert frames[:, 1].tolist() == [1, 3, 5]
+    assert frames[:, 2].tolist() == [2, 4, 6]
+    assert decoder.dropped_bytes == 0
+
+def test_keeps_partial_frames_until_complete():
+    decoder = FrameDecoder()
+    data = frame(7) + frame(8)
+    assert len(decoder.feed(data[:25])) == 0
+    frames = decoder.feed(data[25:60])
+    assert frames[:, 1].tolist() == [7]
+    assert decoder.feed(data[60:])[:, 1].tolist() == [8]
+    assert decoder.end == 0
+
+def test_resyncs_after_leading_garbage():
+    decoder = FrameDecoder()
+    frames = decoder.feed(b'\x01\x02\xaa\x03' + frame(9) + frame(10))
+    assert frames[:, 1].tolist() == [9, 10]
+    assert decoder.dropped_bytes == 4
+
+def test_resyncs_after_garbage_between_frames():
+    decoder = FrameDecoder()
+    frames = decoder.feed(frame(1) + b'\x00' * 7 + frame(2) + frame(3))
+    assert frames[:, 1].tolist() == [1, 2, 3]
+    assert decoder.dropped_bytes == 7
+
+def test_skips_a_frame_with_a_broken_header():
+    decoder = FrameDecoder()
+    broken = b'\xab' + frame(2)[1:]
+    frames = decoder.feed(frame(1) + broken + frame(3))
+    assert frames[:, 1].tolist() == [1, 3]
+    assert decoder.dropped_bytes == FRAME_SIZE
+
+def test_keeps_a_trailing_header_byte():
+    decoder = FrameDecoder()
+    data = frame(4)
+    assert len(decoder.feed(b'\x00' * FRAME_SIZE + data[:1])) == 0
+    assert decoder.feed(data[1:])[:, 1].tolist() == [4]
+
+def test_drops_what_does_not_fit_the_buffer():
+    decoder = FrameDecoder(size=4 * FRAME_SIZE)
+    decoder.feed(frame(1)[:30])
+    frames = decoder.feed(frame(2) + frame(3) + frame(4) + frame(5))
+    assert frames[:, 1].tolist() == [2, 3, 4, 5]
+    assert decoder.dropped_bytes == 30
+
+def test_readinto_path():
+    decoder = FrameDecoder()
+    data = frame(11) + frame(12)[:10]
+    decoder.space()[:len(data)] = data
+    decoder.commit(len(data))
+    assert decoder.decode()[:, 1].tolist() == [11]
+    rest = frame(12)[10:]
+    decoder.space()[:len(rest)] = rest
+    decoder.commit(len(rest))
+    assert decoder.decode()[:, 1].tolist() == [12]
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from songs import (CHORD_SPREAD, CHORD_WINDOW, TIMING_WINDOW, SongMatcher, Song, compile_notes,
+                   read_midi, song_from_sequence)
+
+def varlen(value):
+    out = [value & 0x7f]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7f))
+        value >>= 7
+    return bytes(reversed(out))
+
+def track(*events):
+    """MTrk chunk from (delta ticks, event bytes) pairs; the end-of-track event is appended"""
+    body = b''.join(varlen(delta) + data for delta, data in events) + b'\x00\xff\x2f\x00'
+    return b'MTrk' + len(body).to_bytes(4, 'big') + body
+
+def midi(tmp_path, *tracks, division=480):
+    path = tmp_path / "song.mid"
+    header = b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big') + len(tracks).to_bytes(2, 'big') + division.to_bytes(2, 'big')
+    path.write_bytes(header + b''.join(tracks))
+    return str(path)
+
+def tempo(us):
+    return b'\xff\x51\x03' + us.to_bytes(3, 'big')
+
+def test_running_status_and_note_offs(tmp_path):
+    path = midi(tmp_path, track(
+        (0, b'\xff\x03\x05Scale'),
+        (0, b'\x90\x3c\x40'),   # C4 on
+        (480, b'\x3c\x00'),     # running status, velocity 0: a note-off
+        (0, b'\x3e\x40'),       # D4 on, still running status
+        (480, b'\x80\x3e\x00'),
+        (0, b'\x99\x24\x40'),   # percussion channel: skipped
+        (0, b'\xc0\x05'),       # program change, one data byte
+        (0, b'\x90\x40\x40'),
+    ))
+    title, seconds, pitches = read_midi(path)
+    assert title == 'Scale'
+    assert pitches.tolist() == [60, 62, 64]
+    assert seconds == pytest.approx([0.0, 0.5, 1.0])
+
+def test_tempo_changes_apply_to_every_track(tmp_path):
+    path = midi(tmp_path,
+        track((0, tempo(500000)), (960, tempo(250000))),
+        track((0, b'\x90\x3c\x40'), (960, b'\x90\x3e\x40'), (480, b'\x90\x40\x40'), (480, b'\x90\x41\x40')))
+    _, seconds, pitches = read_midi(path)
+    assert pitches.tolist() == [60, 62, 64, 65]
+    # Two beats at 120 bpm, then 240 bpm
+    assert seconds == pytest.approx([0.0, 1.0, 1.25, 1.5])
+
+def test_notes_are_sorted_across_tracks(tmp_path):
+    path = midi(tmp_path,
+        track((480, b'\x90\x3c\x40')),
+        track((0, b'\x90\x43\x40'), (960, b'\x90\x45\x40')))
+    _, seconds, pitches = read_midi(path)
+    assert pitches.tolist() == [67, 60, 69]
+    assert seconds == pytest.approx([0.0, 0.5, 1.0])
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "bad.mid"
+    path.write_bytes(b'RIFF' + bytes(20))
+    with pytest.raises(ValueError):
+        read_midi(str(path))
+
+def test_compile_notes_merges_chords():
+    seconds = np.array([0.0, CHORD_WINDOW / 2, 0.5, 1.0, 1.0 + CHORD_WINDOW * 2])
+    fingers = np.array([0, 2, 1, 3, 4])
+    onsets, masks = compile_notes(seconds, fingers)
+    assert onsets.tolist() == pytest.approx([0.0, 0.5, 1.0, 1.0 + CHORD_WINDOW * 2])
+    assert masks.tolist() == [0b101, 0b10, 0b1000, 0b10000]
+
+def test_song_from_sequence():
+    song = song_from_sequence('t', 'Test', ['thumb', 'index+ring', 'pinky'])
+    assert not song.timed
+    assert song.sequence() == ['thumb', 'index+ring', 'pinky']
+    assert song.fingers(1) == ['index', 'ring']
+
+def timed_song(gaps, masks):
+    onsets = np.concatenate([[0.0], np.cumsum(gaps)]).astype(np.float32)
+    return Song('s', 'Song', onsets, np.array(masks, dtype=np.uint8))
+
+def test_matcher_counts_wrong_fingers_and_steps():
+    matcher = SongMatcher(song_from_sequence('t', 'Test', ['thumb', 'index']))
+    assert matcher.press('index', 0.0) is False
+    assert matcher.press('thumb', 0.1) is True
+    assert matcher.expected() == ['index']
+    assert matcher.press('index', 0.2) is True
+    assert matcher.done
+    snapshot = matcher.snapshot()
+    assert snapshot["wrong"] == 1
+    assert snapshot["accuracy"] == pytest.approx(2 / 3)
+    # Untimed songs only score the order
+    assert snapshot["on_time_rate"] is None
+
+def test_matcher_chords():
+    matcher = SongMatcher(timed_song([1.0], [0b11, 0b101]))
+    assert matcher.press('thumb', 0.0) is None
+    assert matcher.press('thumb', 0.01) is None
+    assert matcher.press('index', 0.05) is True
+    assert matcher.press('thumb', 1.0) is None
+    assert matcher.press('middle', 1.0 + CHORD_SPREAD * 2) is True
+    assert (matcher.chords, matcher.clean_chords) == (2, 1)
+
+def test_matcher_follows_the_players_tempo():
+    matcher = SongMatcher(timed_song([0.5] * 6, [1] * 7))
+    t = 0.0
+    matcher.press('thumb', t)
+    # Steadily twice as slow as written: late at first, on time once the tempo caught up
+    for _ in range(6):
+        t += 1.0
+        matcher.press('thumb', t)
+    assert matcher.late >= 1
+    assert abs(matcher.deviation) <= TIMING_WINDOW
+    assert matcher.tempo > 1.5
+    assert matcher.on_time + matcher.early + matcher.late == 6
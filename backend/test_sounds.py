@@ -0,0 +1,60 @@
+import pytest
+from sounds import CHORD_NAMES, SoundRegistry, parse_sound, parse_spec
+
+@pytest.mark.parametrize("spec, parts", [
+    ('C', ('C', 4, [0], 0, 0.0)),
+    ('F#', ('F#', 4, [0], 0, 0.0)),
+    ('Bb3', ('Bb', 3, [0], 0, 0.0)),
+    ('A_maj', ('A', 4, [0, 4, 7], 0, 0.0)),
+    ('Am', ('A', 4, [0, 3, 7], 0, 0.0)),
+    ('G7', ('G', 4, [0, 4, 7, 10], 0, 0.0)),
+    ('C5_maj', ('C', 5, [0, 4, 7], 0, 0.0)),
+    ('E-14c', ('E', 4, [0], 0, -14.0)),
+    ('D+3.5c', ('D', 4, [0], 0, 3.5)),
+    ('A_maj_inv1_oct5', ('A', 5, [0, 4, 7], 1, 0.0)),
+    ('Em_oct3_inv2', ('E', 3, [0, 3, 7], 2, 0.0)),
+])
+def test_parse_spec(spec, parts):
+    assert parse_spec(spec) == parts
+
+@pytest.mark.parametrize("spec", ['', 'H', 'c', 'C##', 'C_min', 'Cx', 'E-14', 'C_maj_maj'])
+def test_parse_spec_rejects(spec):
+    assert parse_spec(spec) is None
+
+def test_seven_is_a_chord_not_an_octave():
+    assert parse_spec('C7') == ('C', 4, [0, 4, 7, 10], 0, 0.0)
+
+def test_every_offered_name_parses():
+    for name in CHORD_NAMES:
+        assert name == 'none' or parse_spec(name) is not None, name
+
+def test_parse_sound_frequencies():
+    assert parse_sound('A') == [pytest.approx(440.0)]
+    assert parse_sound('A5') == [pytest.approx(880.0)]
+    assert parse_sound('A', a4=432) == [pytest.approx(432.0)]
+    assert parse_sound('A+100c')[0] == pytest.approx(440.0 * 2 ** (1 / 12))
+    assert parse_sound('none') == [] and parse_sound('nonsense') == []
+
+def test_inversion_raises_the_lowest_notes_an_octave():
+    root, third, fifth = parse_sound('C_maj')
+    assert parse_sound('C_maj_inv1') == [pytest.approx(third), pytest.approx(fifth), pytest.approx(root * 2)]
+
+def test_registry_memoizes_frozen_arrays():
+    sounds = SoundRegistry()
+    freqs = sounds.compile('C_maj')
+    assert sounds.compile('C_maj') is freqs
+    assert not freqs.flags.writeable
+    sounds.set_tuning('just')
+    assert sounds.compile('C_maj') is not freqs
+
+def test_registry_rejects_unknown_tunings():
+    sounds = SoundRegistry()
+    with pytest.raises(ValueError):
+        sounds.set_tuning('meantone')
+    with pytest.raises(ValueError):
+        sounds.set_tuning([0.0] * 11)
+
+def test_compile_mapping_leaves_drums_empty():
+    compiled = SoundRegistry().compile_mapping({'thumb': 'C', 'index': 'kick'}, {'index': 'drum'})
+    assert len(compiled['thumb']) == 1
+    assert len(compiled['index']) == 0
@@ -0,0 +1,86 @@
+import pytest
+import tuner
+from tuner import (DEFAULT_STEP, FLOOR_DECAY, LADDER, MIN_BLOCKS, PROBE_INTERVAL, SETTLE, UNDERRUN_LIMIT,
+                   WARMUP, AudioTuner)
+
+SAMPLE_RATE = 44100
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tuner.time, "monotonic", clock)
+    return clock
+
+def blocks(audio, cost, count=MIN_BLOCKS, underflow=False):
+    for _ in range(count):
+        audio.observe(cost, underflow)
+
+def warmed_up(clock, cost):
+    audio = AudioTuner(SAMPLE_RATE)
+    blocks(audio, cost)
+    clock.now += WARMUP
+    audio.decide()
+    return audio
+
+def test_warmup_picks_the_smallest_block_with_headroom(clock):
+    audio = AudioTuner(SAMPLE_RATE)
+    blocks(audio, 0.001)
+    assert audio.decide() is None
+    clock.now += WARMUP
+    # 1 ms needs a block of at least 2 ms at 50% headroom: 128 frames
+    assert audio.decide() == 1 and audio.phase == "tuned"
+    assert warmed_up(clock, 0.0001).blocksize == LADDER[0][0]
+    assert warmed_up(clock, 1.0).step == len(LADDER) - 1
+
+def test_warmup_underruns_are_ignored(clock):
+    audio = AudioTuner(SAMPLE_RATE)
+    clock.now += SETTLE + 0.1
+    blocks(audio, 0.0001, underflow=True)
+    assert audio.decide() is None
+    assert audio.floor == 0 and audio.phase == "warmup"
+
+def test_underruns_step_up_and_raise_the_floor(clock):
+    audio = warmed_up(clock, 0.0001)
+    assert audio.step == 0
+    clock.now += SETTLE + 0.1
+    blocks(audio, 0.0001, count=UNDERRUN_LIMIT, underflow=True)
+    assert audio.decide() == 1
+    assert audio.floor == 1
+
+def test_underruns_right_after_a_reopen_do_not_count(clock):
+    audio = warmed_up(clock, 0.0001)
+    blocks(audio, 0.0001, count=UNDERRUN_LIMIT, underflow=True)
+    assert audio.underruns == 0
+
+def test_a_creeping_cost_steps_up(clock):
+    audio = warmed_up(clock, 0.0001)
+    blocks(audio, 0.001)
+    assert audio.decide() == 1
+
+def test_steps_down_after_a_quiet_probe_interval(clock):
+    audio = AudioTuner(SAMPLE_RATE, step=DEFAULT_STEP)
+    audio.phase = "tuned"
+    blocks(audio, 0.0001)
+    assert audio.decide() is None
+    clock.now += PROBE_INTERVAL + 1
+    assert audio.decide() == DEFAULT_STEP - 1
+
+def test_never_probes_below_the_floor_until_it_decays(clock):
+    audio = warmed_up(clock, 0.0001)
+    clock.now += SETTLE + 0.1
+    blocks(audio, 0.0001, count=UNDERRUN_LIMIT, underflow=True)
+    audio.decide()
+    clock.now += PROBE_INTERVAL + 1
+    blocks(audio, 0.0001)
+    assert audio.decide() is None and audio.step == 1
+
+    clock.now += FLOOR_DECAY
+    assert audio.decide() == 0
+    assert audio.floor == 0
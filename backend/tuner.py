@@ -0,0 +1,118 @@
+import os
+import time
+from collections import deque
+import numpy as np
+
+# (block size, device latency) from most to least responsive
+LADDER = [(64, 'low'), (128, 'low'), (256, 'low'), (512, 'low'), (512, 'high'), (1024, 'high')]
+DEFAULT_STEP = 2            # 256 / low, what the stream always used to open with
+
+AUTO_TUNE = os.environ.get("RIPPLE_AUTOTUNE", "1") != "0"
+WARMUP = 2.0                # seconds measured before the first choice
+SETTLE = 0.25               # seconds after (re)opening a stream whose underruns are ignored
+TUNE_INTERVAL = 1.0         # how often the event loop looks at the measurements
+PROBE_INTERVAL = 30.0       # stable seconds before trying a smaller setting again
+FLOOR_DECAY = 300.0         # stable seconds before a setting that underran may be tried again
+HEADROOM = 0.5              # p99 render time may use this share of a block
+UNDERRUN_LIMIT = 3          # underruns on one setting before it counts as failed
+MIN_BLOCKS = 50             # callbacks needed before a decision
+WINDOW = 2000               # callbacks kept for the percentile
+
+
+class AudioTuner:
+    """Picks the smallest block size and device latency the machine keeps up with.
+
+    The audio callback only appends its render time to a deque and bumps an
+    underrun counter. The event loop calls decide() every TUNE_INTERVAL.
+    After WARMUP it jumps straight to the smallest setting whose block leaves
+    HEADROOM over the measured p99. Render time hardly shrinks with the block, so
+    the current cost is a safe estimate for smaller blocks. After that the tuner
+    steps up on repeated underruns or a p99 that is creeping up, and steps down
+    again after PROBE_INTERVAL of quiet. Underruns during warmup are ignored,
+    as there is no cost estimate yet to tell a slow machine from a stream that
+    is still starting up. A setting that underran is not chosen again until
+    FLOOR_DECAY passes without another one.
+    """
+
+    def __init__(self, sample_rate, step=DEFAULT_STEP):
+        self.sample_rate = sample_rate
+        self.step = step
+        self.floor = 0
+        self.floor_since = time.monotonic()
+        self.phase = "warmup"
+        self.durations = deque(maxlen=WINDOW)
+        self.underruns = 0
+        self.changes = 0
+        self.cost = 0.0
+        self.restart()
+
+    @property
+    def blocksize(self):
+        return LADDER[self.step][0]
+
+    @property
+    def latency(self):
+        return LADDER[self.step][1]
+
+    def restart(self):
+        """Measurements start over, e.g. after the stream was reopened"""
+        self.durations.clear()
+        self.underruns = 0
+        self.since = time.monotonic()
+
+    # Audio side
+
+    def observe(self, elapsed, underflow):
+        self.durations.append(elapsed)
+        if underflow and time.monotonic() - self.since > SETTLE:
+            self.underruns += 1
+
+    # Event loop side
+
+    def budget(self, step):
+        return HEADROOM * LADDER[step][0] / self.sample_rate
+
+    def decide(self):
+        """New ladder step to switch to, or None to stay"""
+        now = time.monotonic()
+        if self.floor > 0 and now - self.floor_since > FLOOR_DECAY:
+            self.floor -= 1
+            self.floor_since = now
+        if self.underruns >= UNDERRUN_LIMIT and self.phase != "warmup":
+            # Do not come back down to what just failed for a while
+            self.floor = max(self.floor, self.step + 1)
+            self.floor_since = now
+            self.phase = "tuned"
+            return self.move(min(self.step + 1, len(LADDER) - 1))
+        if len(self.durations) < MIN_BLOCKS:
+            return None
+        self.cost = float(np.percentile(np.fromiter(self.durations, float), 99))
+        if self.phase == "warmup":
+            if now - self.since < WARMUP:
+                return None
+            self.phase = "tuned"
+            candidates = [i for i in range(self.floor, len(LADDER)) if self.cost <= self.budget(i)]
+            return self.move(candidates[0] if candidates else len(LADDER) - 1)
+        if self.cost > self.budget(self.step):
+            return self.move(min(self.step + 1, len(LADDER) - 1))
+        if self.step > self.floor and now - self.since > PROBE_INTERVAL and self.cost <= self.budget(self.step - 1):
+            return self.move(self.step - 1)
+        return None
+
+    def move(self, step):
+        if step == self.step:
+            self.restart()
+            return None
+        self.step = step
+        self.changes += 1
+        self.restart()
+        return step
+
+    def snapshot(self):
+        return {
+            "blocksize": self.blocksize,
+            "latency": self.latency,
+            "phase": self.phase,
+            "render_p99_ms": self.cost * 1000,
+            "changes": self.changes,
+        }
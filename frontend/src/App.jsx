@@ -20,8 +20,8 @@ const INVERSIONS = [
 // Default data (same as server)
 const DEFAULT_PRESETS = {
   'therapy': { name: '🧘 Therapy', instrument: 'pad', mapping: { thumb: 'C_maj', index: 'F_maj', middle: 'G_maj', ring: 'Am', pinky: 'Em' } },
-  'piano': { name: '🎹 Piano', instrument: 'bell', mapping: { thumb: 'C', index: 'D', middle: 'E', ring: 'F', pinky: 'G' } },
-  'chords': { name: '🎸 Chords', instrument: 'soft', mapping: { thumb: 'C_maj', index: 'D_maj', middle: 'E_maj', ring: 'G_maj', pinky: 'A_maj' } },
+  'piano': { name: '🎹 Piano', instrument: 'piano', mapping: { thumb: 'C', index: 'D', middle: 'E', ring: 'F', pinky: 'G' } },
+  'chords': { name: '🎸 Chords', instrument: 'guitar', mapping: { thumb: 'C_maj', index: 'D_maj', middle: 'E_maj', ring: 'G_maj', pinky: 'A_maj' } },
   'drums': { name: '🥁 Drums', instrument: 'drums', mapping: { thumb: 'kick', index: 'snare', middle: 'hihat', ring: 'tom', pinky: 'clap' } },
   'custom': { name: '✏️ Custom', instrument: 'sine', mapping: { thumb: 'C', index: 'D', middle: 'E', ring: 'F', pinky: 'G' } },
 }
@@ -52,7 +52,7 @@ function Hand({ activeFingers, mapping, onFingerClick, highlightFinger }) {
     <div style={{ display: 'flex', justifyContent: 'center', gap: '12px', padding: '30px' }}>
       {FINGERS.map(finger => {
         const isActive = activeFingers.includes(finger)
-        const isHighlighted = finger === highlightFinger
+        const isHighlighted = highlightFinger?.includes(finger)
         const color = FINGER_COLORS[finger]
         const displayName = mapping?.[finger]?.split('_oct')[0]?.split('_inv')[0] || NOTE_NAMES[finger]
         return (
@@ -448,19 +448,22 @@ function SaveRecordingModal({ onSave, onClose }) {
 
 export default function App() {
   const [connected, setConnected] = useState(false)
+  const [audio, setAudio] = useState(null)
   const [calibrated, setCalibrated] = useState(false)
   const [activeFingers, setActiveFingers] = useState([])
   const [currentPreset, setCurrentPreset] = useState('piano')
   const [presets, setPresets] = useState(DEFAULT_PRESETS)
   const [drums, setDrums] = useState(DEFAULT_DRUMS)
   const [tutorials, setTutorials] = useState(DEFAULT_TUTORIALS)
+  const [songs, setSongs] = useState({ query: '', items: [], next: null })
   const [selectedFinger, setSelectedFinger] = useState(null)
   const [customTypes, setCustomTypes] = useState({ thumb: 'note', index: 'note', middle: 'note', ring: 'note', pinky: 'note' })
-  const [threshold, setThreshold] = useState(0.15)
+  const [threshold, setThreshold] = useState(2.5)
+  const [modulation, setModulation] = useState(true)
   const [showSettings, setShowSettings] = useState(false)
   const [mode, setMode] = useState('play')
   const [tab, setTab] = useState('play')
-  const [tutorialState, setTutorialState] = useState({ current: null, name: '', step: 0, total: 0, nextFinger: null, sequence: [], completed: false })
+  const [tutorialState, setTutorialState] = useState({ current: null, name: '', step: 0, total: 0, nextFinger: null, nextFingers: [], sequence: [], completed: false })
   
   const [isRecording, setIsRecording] = useState(false)
   const [recordings, setRecordings] = useState(() => {
@@ -475,12 +478,14 @@ export default function App() {
   const recordingTimerRef = useRef(null)
   
   const ws = useRef(null)
+  const binaryFingers = useRef([])
 
   useEffect(() => { localStorage.setItem('ripple-recordings', JSON.stringify(recordings)) }, [recordings])
 
   useEffect(() => {
     const connectWs = () => {
       ws.current = new WebSocket('ws://localhost:8000/ws')
+      ws.current.binaryType = 'arraybuffer'
       ws.current.onopen = () => console.log('WebSocket connected')
       ws.current.onclose = () => {
         console.log('WebSocket disconnected')
@@ -489,27 +494,44 @@ export default function App() {
       }
       ws.current.onerror = () => console.log('WebSocket error')
       ws.current.onmessage = (event) => {
+        if (event.data instanceof ArrayBuffer) {
+          // Binary finger state: [type, active mask, changed mask], bit i = binaryFingers.current[i]
+          const bytes = new Uint8Array(event.data)
+          if (bytes[0] === 1) setActiveFingers(binaryFingers.current.filter((_, i) => bytes[1] & (1 << i)))
+          return
+        }
         const data = JSON.parse(event.data)
         if (data.type === 'init') {
+          if (data.binary) {
+            binaryFingers.current = data.binary.fingers
+            ws.current.send(JSON.stringify({ type: 'set_protocol', protocol: 'binary', decimation: 0 }))
+          }
           setPresets(data.presets || DEFAULT_PRESETS)
           setDrums(data.drums || DEFAULT_DRUMS)
           setTutorials(data.tutorials || DEFAULT_TUTORIALS)
+          ws.current.send(JSON.stringify({ type: 'search_songs' }))
           setCurrentPreset(data.state?.current_preset || 'piano')
           setConnected(data.state?.connected || false)
+          setAudio(data.state?.audio || null)
+          setModulation(data.state?.modulation ?? true)
+          setThreshold(data.state?.threshold_on ?? 2.5)
           setCalibrated(data.state?.calibrated || false)
           setCustomTypes(data.custom_types || { thumb: 'note', index: 'note', middle: 'note', ring: 'note', pinky: 'note' })
-        } else if (data.type === 'status') { setConnected(data.connected); if (data.calibrated !== undefined) setCalibrated(data.calibrated)
+        } else if (data.type === 'status') { setConnected(data.connected); setAudio(data.audio || null); if (data.calibrated !== undefined) setCalibrated(data.calibrated)
         } else if (data.type === 'calibrated') { setCalibrated(true)
+        } else if (data.type === 'modulation_changed') { setModulation(data.enabled)
+        } else if (data.type === 'threshold_changed') { setThreshold(data.threshold_on)
         } else if (data.type === 'fingers') { setActiveFingers(data.active)
         } else if (data.type === 'preset_changed') { setCurrentPreset(data.preset)
         } else if (data.type === 'mapping_updated') {
           setPresets(prev => ({ ...prev, custom: { ...prev.custom, mapping: { ...prev.custom?.mapping, [data.finger]: data.sound } } }))
           if (data.custom_types) setCustomTypes(data.custom_types)
         } else if (data.type === 'tutorial_started') {
-          setMode('tutorial'); setTutorialState({ current: data.tutorial, name: data.name, step: 0, total: data.total, nextFinger: data.next_finger, sequence: data.sequence, completed: false })
-        } else if (data.type === 'tutorial_progress') { setTutorialState(prev => ({ ...prev, step: data.step, nextFinger: data.next_finger }))
-        } else if (data.type === 'tutorial_complete') { setTutorialState(prev => ({ ...prev, completed: true, nextFinger: null }))
-        } else if (data.type === 'tutorial_reset') { setTutorialState(prev => ({ ...prev, step: 0, nextFinger: data.next_finger, completed: false }))
+          setMode('tutorial'); setTutorialState({ current: data.tutorial, name: data.name, step: 0, total: data.total, nextFinger: data.next_finger, nextFingers: data.next_fingers, sequence: data.sequence, completed: false })
+        } else if (data.type === 'tutorial_progress') { setTutorialState(prev => ({ ...prev, step: data.step, nextFinger: data.next_finger, nextFingers: data.next_fingers }))
+        } else if (data.type === 'tutorial_complete') { setTutorialState(prev => ({ ...prev, completed: true, nextFinger: null, nextFingers: [] }))
+        } else if (data.type === 'tutorial_reset') { setTutorialState(prev => ({ ...prev, step: 0, nextFinger: data.next_finger, nextFingers: data.next_fingers, completed: false }))
+        } else if (data.type === 'songs') { setSongs(prev => ({ ...prev, items: data.append ? [...prev.items, ...data.songs] : data.songs, next: data.next }))
         } else if (data.type === 'recording_started') {
           setIsRecording(true); setRecordingTime(0); recordingTimerRef.current = setInterval(() => setRecordingTime(t => t + 0.1), 100)
         } else if (data.type === 'recording_stopped') {
@@ -529,7 +551,9 @@ export default function App() {
   const selectPreset = (preset) => { setCurrentPreset(preset); send({ type: 'set_preset', preset }) }
   const startTutorial = (id) => send({ type: 'start_tutorial', tutorial: id })
   const resetTutorial = () => send({ type: 'reset_tutorial' })
-  const exitTutorial = () => { send({ type: 'set_mode', mode: 'play' }); setMode('play'); setTutorialState({ current: null, name: '', step: 0, total: 0, nextFinger: null, sequence: [], completed: false }) }
+  const searchSongs = (query) => { setSongs(prev => ({ ...prev, query })); send({ type: 'search_songs', query }) }
+  const moreSongs = () => send({ type: 'search_songs', query: songs.query, cursor: songs.next })
+  const exitTutorial = () => { send({ type: 'set_mode', mode: 'play' }); setMode('play'); setTutorialState({ current: null, name: '', step: 0, total: 0, nextFinger: null, nextFingers: [], sequence: [], completed: false }) }
   const handleFingerClick = (finger) => setSelectedFinger(finger)
   const handleSoundSelect = (sound, soundType) => { 
     setPresets(prev => ({ ...prev, custom: { ...prev.custom, mapping: { ...prev.custom?.mapping, [selectedFinger]: sound } } }))
@@ -537,7 +561,8 @@ export default function App() {
     send({ type: 'set_mapping', finger: selectedFinger, sound, sound_type: soundType })
     setSelectedFinger(null) 
   }
-  const updateThreshold = (val) => { setThreshold(val); send({ type: 'set_threshold', value: val }) }
+  const updateThreshold = (val) => { setThreshold(val); send({ type: 'set_threshold', threshold_on: val }) }
+  const toggleModulation = (enabled) => { setModulation(enabled); send({ type: 'set_modulation', enabled }) }
   const startRecording = () => send({ type: 'start_recording' })
   const stopRecording = () => send({ type: 'stop_recording' })
   
@@ -579,8 +604,12 @@ export default function App() {
 
       {showSettings && (
         <div style={{ background: 'rgba(255,255,255,0.1)', borderRadius: '15px', padding: '20px', marginBottom: '25px' }}>
-          <h3 style={{ marginBottom: '15px' }}>Sensitivity: {Math.round(threshold * 100)}%</h3>
-          <input type="range" min="0.05" max="0.4" step="0.01" value={threshold} onChange={(e) => updateThreshold(parseFloat(e.target.value))} style={{ width: '100%' }} />
+          <h3 style={{ marginBottom: '15px' }}>Press threshold: {threshold.toFixed(1)} (lower is more sensitive)</h3>
+          <input type="range" min="0.5" max="5" step="0.1" value={threshold} onChange={(e) => updateThreshold(parseFloat(e.target.value))} style={{ width: '100%' }} />
+          <label style={{ display: 'flex', alignItems: 'center', gap: '8px', marginTop: '10px', cursor: 'pointer' }}>
+            <input type="checkbox" checked={modulation} onChange={(e) => toggleModulation(e.target.checked)} /> Pressure controls loudness and tone
+          </label>
+          {audio && <p style={{ marginTop: '10px', opacity: 0.6 }}>Audio: {audio.blocksize} frames, {audio.latency} latency{audio.output_latency_ms != null ? ` (${audio.output_latency_ms.toFixed(1)}ms)` : ''}{audio.phase === 'warmup' ? ', tuning…' : ''}{audio.reverb_bypassed ? ', reverb off (CPU)' : ''}</p>}
         </div>
       )}
 
@@ -641,6 +670,16 @@ export default function App() {
               <TutorialCard key={id} id={id} name={tutorial.name} difficulty={tutorial.difficulty} length={tutorial.length} onStart={startTutorial} active={tutorialState.current === id} />
             ))}
           </div>
+          <h2 style={{ margin: '30px 0 15px' }}>Song Library</h2>
+          <input value={songs.query} onChange={e => searchSongs(e.target.value)} placeholder="Search MIDI songs..."
+            style={{ width: '100%', padding: '10px', borderRadius: '8px', border: 'none', background: 'rgba(255,255,255,0.1)', color: 'white', marginBottom: '15px' }} />
+          <div style={{ display: 'grid', gap: '15px', gridTemplateColumns: 'repeat(auto-fill, minmax(250px, 1fr))' }}>
+            {songs.items.map(song => (
+              <TutorialCard key={song.id} id={song.id} name={song.title} difficulty={song.difficulty} length={song.steps} onStart={startTutorial} active={tutorialState.current === song.id} />
+            ))}
+          </div>
+          {songs.items.length === 0 && <p style={{ opacity: 0.5 }}>No songs found. Put .mid files in the songs folder.</p>}
+          {songs.next && <button onClick={moreSongs} style={{ marginTop: '15px', padding: '8px 16px', borderRadius: '8px', border: 'none', background: 'rgba(255,255,255,0.1)', color: 'white', cursor: 'pointer' }}>Load more</button>}
         </div>
       )}
 
@@ -656,7 +695,7 @@ export default function App() {
               <div style={{ background: tutorialState.completed ? '#4ade80' : '#8b5cf6', height: '100%', width: `${(tutorialState.step / tutorialState.total) * 100}%`, transition: 'width 0.3s ease' }} />
             </div>
           </div>
-          <Hand activeFingers={activeFingers} mapping={NOTE_NAMES} highlightFinger={tutorialState.nextFinger} />
+          <Hand activeFingers={activeFingers} mapping={NOTE_NAMES} highlightFinger={tutorialState.nextFingers} />
           {tutorialState.completed ? (
             <div style={{ textAlign: 'center', marginTop: '20px' }}>
               <h3 style={{ color: '#4ade80', marginBottom: '15px' }}>🎉 Congratulations!</h3>
@@ -668,7 +707,7 @@ export default function App() {
             </div>
           ) : (
             <div style={{ textAlign: 'center', marginTop: '20px' }}>
-              <p style={{ fontSize: '1.2rem' }}>Press: <span style={{ color: FINGER_COLORS[tutorialState.nextFinger], fontWeight: 'bold', fontSize: '1.5rem' }}>{tutorialState.nextFinger?.toUpperCase()} ({NOTE_NAMES[tutorialState.nextFinger]})</span></p>
+              <p style={{ fontSize: '1.2rem' }}>Press: <span style={{ color: FINGER_COLORS[tutorialState.nextFinger], fontWeight: 'bold', fontSize: '1.5rem' }}>{tutorialState.nextFingers.map(f => `${f.toUpperCase()} (${NOTE_NAMES[f]})`).join(' + ')}</span></p>
               <button onClick={resetTutorial} style={{ marginTop: '15px', padding: '8px 16px', borderRadius: '8px', border: 'none', background: 'rgba(255,255,255,0.1)', color: 'white', cursor: 'pointer' }}>🔄 Restart</button>
             </div>
           )}
@@ -676,8 +715,8 @@ export default function App() {
             <h4 style={{ marginBottom: '10px', opacity: 0.7 }}>Sequence</h4>
             <div style={{ display: 'flex', flexWrap: 'wrap', gap: '5px' }}>
               {tutorialState.sequence.map((finger, i) => (
-                <div key={i} style={{ width: '30px', height: '30px', borderRadius: '6px', background: i < tutorialState.step ? '#4ade80' : i === tutorialState.step ? FINGER_COLORS[finger] : 'rgba(255,255,255,0.1)',
-                  display: 'flex', alignItems: 'center', justifyContent: 'center', fontSize: '0.7rem', fontWeight: 'bold', opacity: i < tutorialState.step ? 0.5 : 1 }}>{NOTE_NAMES[finger]}</div>
+                <div key={i} style={{ width: '30px', height: '30px', borderRadius: '6px', background: i < tutorialState.step ? '#4ade80' : i === tutorialState.step ? FINGER_COLORS[finger.split('+')[0]] : 'rgba(255,255,255,0.1)',
+                  display: 'flex', alignItems: 'center', justifyContent: 'center', fontSize: '0.7rem', fontWeight: 'bold', opacity: i < tutorialState.step ? 0.5 : 1 }}>{finger.split('+').map(f => NOTE_NAMES[f]).join('')}</div>
               ))}
             </div>
           </div>